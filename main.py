@@ -2,17 +2,43 @@
 - Determine the amount of rows (ROW_LIMIT) to filter on the company stock screener. This determines the amount of data 
 called on the APIs and displayed on the dashboard charts.
 - Configure logging settings
-- Extract and transform the data from the APIs
-- Write the transformed data to a csv file
-- Upload the data to a GCP Cloud SQL PostgreSQL database (serves no purpose at the moment, mainly to practice 
-my ability to connect and upload)
-- Execute sample queries to verify the proper insertion of data
-- Close the database connection
-- Generate the Dash Plotly dashboard webserver and run it on the open port of the GCP Cloud Run container.
+- Run the pipeline as a DAG of stages (see modules/pipeline.py), each stage starting as soon as its inputs are
+available:
+    - Extract the screener data and keep the ROW_LIMIT largest companies
+    - Extract the employees and the sentiment data of these companies, concurrently, and add them to the data
+    - Write the transformed data to a csv file
+    - Upload the data to a GCP Cloud SQL PostgreSQL database (serves no purpose at the moment, mainly to practice
+    my ability to connect and upload), upsert the changed rows into the history table, verify the load and close
+    the database connection
+- Generate the Dash Plotly dashboard webserver and run it on the open port of the GCP Cloud Run container, as soon
+as the data is transformed: the csv file and the upload go on while it starts.
+
+The transformed data is handed in memory to the upload and dashboard stages, the csv file is only a side artifact.
+The wall-clock time of each stage is logged.
+
+The outputs of the API and transform stages are checkpointed under a run ID (RUN_ID, today's date by default, see
+modules/checkpoints.py): when a run fails, like when an API limit is reached, the next run of the day resumes from
+the stages, and from the tickers, already fetched.
+
+With STARTUP_MODE=stale (the default) and a previous data snapshot on disk, the dashboard starts serving that
+snapshot right away while the pipeline runs in the background. The new data is published to the running
+dashboard once its snapshot is written. Without a snapshot, or with STARTUP_MODE=fresh, the dashboard waits for
+the transformed data.
+
+With SERVER_MODE=gunicorn, the dashboard is served by worker processes forked from this one, and a process must
+not be forked while other threads may hold its locks. The background pipeline thus runs in a process of its own
+instead of a thread, and the workers load its snapshot with their snapshot watcher, within
+DASHBOARD_RELOAD_INTERVAL seconds (60 by default) of its writing. In fresh mode, the whole pipeline, upload
+included, is done before the workers are forked.
 """
 
 import logging
+import multiprocessing
+import os
+import threading
 import traceback
+from functools import partial
+from modules import api_cache, checkpoints
 from modules.extract_data import (
     screener_call,
     screener_transf,
@@ -25,49 +51,164 @@ from modules.extract_data import (
 from modules.update_psql import (
     conn_to_psql,
     upload_to_psql,
+    upsert_history_to_psql,
     close_conn_to_sql,
 )
-from modules.dash_plotly_dashboard import dashboard
+from modules.dash_plotly_dashboard import dashboard, set_dataset
+from modules.pipeline import Stage, run_stages
+from modules.serving import SERVER_MODE
+from modules.snapshot import snapshot_path
 
 
 ROW_LIMIT = 12
+# stale : serve the last snapshot while the pipeline runs, fresh : run the pipeline, then serve
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "stale")
 
 
-def app():
-    """Global app"""
+def pipeline_stages():
+    """
+    The stages of the pipeline, from the API calls to the upload.
+
+    Returns:
+        list: the Stage objects, final_data being the transformed data
+    """
+
+    return [
+        Stage(
+            "screener",
+            partial(screener_call, row_limit=ROW_LIMIT),
+            outputs=("screener_resp_tech", "screener_resp_com"),
+            checkpoint=True,
+        ),
+        Stage(
+            "screener_transf",
+            partial(screener_transf, row_limit=ROW_LIMIT),
+            inputs=("screener_resp_tech", "screener_resp_com"),
+            outputs=("tickers_list", "filtered_screener"),
+            checkpoint=True,
+        ),
+        # Both only depend on the tickers, they run concurrently
+        Stage(
+            "fte",
+            fte_call,
+            inputs=("tickers_list",),
+            outputs=("employees_n_list",),
+            checkpoint=True,
+            per_ticker=True,
+        ),
+        Stage(
+            "sentiment",
+            yest_sent_call,
+            inputs=("tickers_list",),
+            outputs=("d_list_sentiment",),
+            checkpoint=True,
+            per_ticker=True,
+        ),
+        Stage(
+            "add_fte",
+            add_fte,
+            inputs=("employees_n_list", "filtered_screener"),
+            outputs=("added_fte",),
+            checkpoint=True,
+        ),
+        Stage(
+            "add_sentiment",
+            add_yest_sent,
+            inputs=("added_fte", "d_list_sentiment"),
+            outputs=("final_data",),
+            checkpoint=True,
+        ),
+        Stage("api_cache_stats", lambda final_data: api_cache.log_stats(), inputs=("final_data",)),
+        Stage("snapshot", write_data_to_csv, inputs=("final_data",), outputs=("snapshot_file",)),
+        Stage("upload", load, inputs=("final_data",)),
+    ]
+
+
+def load(final_data):
+    """Connect to database, upload data, and close the connection."""
+
+    pool, connector = conn_to_psql()
+    upload_to_psql(pool, final_data)
+    upsert_history_to_psql(pool, final_data)
+    close_conn_to_sql(pool, connector)
+
+
+def publish(final_data, snapshot_file):
+    """Publishes the new data to the running dashboard."""
+
+    # Published with the mtime of the new file, so that the snapshot watcher doesn't reload it
+    set_dataset(final_data, os.stat(snapshot_file).st_mtime)
+    logging.info("New data published to the dashboard.")
+
+
+def refresh_data(publish_data=True):
+    """
+    Runs the pipeline behind a dashboard serving the last snapshot: the new data is published to the
+    dashboard once its snapshot is written, while it is uploaded.
+
+    Args:
+        publish_data (bool): False when the dashboard runs in other processes, which load the snapshot
+    """
+
+    try:
+        stages = pipeline_stages()
+        if publish_data:
+            stages.append(Stage("publish", publish, inputs=("final_data", "snapshot_file")))
+        run_stages(stages, run_id=checkpoints.run_id()).wait()
+        logging.info("Background data refresh done.")
+
+    except Exception as e:
+        logging.critical(e)
+        logging.critical(traceback.format_exc())
+
+
+def configure_logging():
+    """Logging configuration"""
 
-    # Logging configuration
     logging.basicConfig(
         # filename="logs/app.log",
         handlers=[logging.FileHandler("logs/app.log"), logging.StreamHandler()],
         format="%(asctime)s - %(levelname)s - %(message)s",
         level=logging.INFO,
     )
+
+
+def refresh_data_process():
+    """Runs the pipeline in a process of its own, the gunicorn workers loading its snapshot."""
+
+    configure_logging()
+    refresh_data(publish_data=False)
+
+
+def app():
+    """Global app"""
+
+    configure_logging()
     logging.info("APP STARTED")
 
     try:
-        # API calls data extraction & transformation
-        screener_resp_tech, screener_resp_com = screener_call(row_limit=ROW_LIMIT)
-        tickers_list, filtered_screener = screener_transf(
-            row_limit=ROW_LIMIT,
-            screener_resp_tech=screener_resp_tech,
-            screener_resp_com=screener_resp_com,
-        )
-
-        employees_n_list = fte_call(tickers_list)
-        added_fte = add_fte(employees_n_list, filtered_screener)
-
-        d_list_sentiment = yest_sent_call(tickers_list)
-        final_data = add_yest_sent(added_fte, d_list_sentiment)
-        write_data_to_csv(final_data)
-
-        # Connect to database, upload data, and close the connection.
-        pool, connector = conn_to_psql()
-        upload_to_psql(pool)
-        close_conn_to_sql(pool, connector)
-
-        # Generate the dash & plotly web dashboard
-        dashboard()
+        if STARTUP_MODE == "stale" and os.path.exists(snapshot_path()):
+            # The port is opened right away on the last good snapshot, users never wait for the pipeline
+            logging.info("Serving the last data snapshot while the pipeline runs.")
+            if SERVER_MODE == "gunicorn":
+                # A fresh interpreter, so that no pipeline thread runs in the process the workers are forked from
+                multiprocessing.get_context("spawn").Process(
+                    target=refresh_data_process, name="data-refresh", daemon=True
+                ).start()
+            else:
+                threading.Thread(target=refresh_data, name="data-refresh", daemon=True).start()
+            dashboard()
+
+        else:
+            run = run_stages(pipeline_stages(), run_id=checkpoints.run_id())
+            if SERVER_MODE == "gunicorn":
+                # The workers are forked once no pipeline thread is left
+                final_data = run.wait()["final_data"]
+            else:
+                final_data = run.result("final_data")
+
+            # Generate the dash & plotly web dashboard, while the snapshot and upload stages go on
+            dashboard(final_data)
 
     except Exception as e:
         logging.critical(e)
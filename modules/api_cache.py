@@ -0,0 +1,138 @@
+"""
+This api_cache module is a persistent on-disk cache of the API responses, stored in a SQLite database.
+
+Entries are keyed by url and query parameters (secrets excluded) and carry their own expiry date,
+so that each endpoint can use its own time to live. Expired entries are evicted when they are read
+and when the cache is opened.
+
+Functions:
+    - get : Returns the cached body of a request, or None if it is missing or expired.
+    - put : Stores the body of a request for ttl seconds.
+    - purge_expired : Evicts all the expired entries.
+    - stats : Returns the hits and misses counters and the hit rate.
+    - log_stats : Logs the cache counters.
+"""
+
+
+import hashlib
+import json
+import logging
+import os
+import time
+from modules.sqlite_db import LocalDatabase
+
+
+CACHE_PATH = os.environ.get("API_CACHE_PATH", os.path.join("data", "api_cache.sqlite"))
+# Query parameters holding secrets, never written to the cache
+SECRET_PARAMS = {"apikey", "token"}
+
+_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_db = LocalDatabase(
+    [
+        """CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            body BLOB NOT NULL,
+            expires_at REAL NOT NULL
+        )"""
+    ],
+    on_open=lambda conn: _purge_expired(conn),
+)
+_lock = _db.lock
+
+
+def _connection():
+    """Returns the connection to the cache database, opening it on first use."""
+
+    return _db.connection(CACHE_PATH)
+
+
+def _key(url, params):
+    """Cache key of a request, ignoring the secret parameters."""
+
+    params = {k: str(v) for k, v in (params or {}).items() if k not in SECRET_PARAMS}
+    return hashlib.sha256(json.dumps([url, params], sort_keys=True).encode()).hexdigest()
+
+
+def _purge_expired(conn):
+    with conn:
+        deleted = conn.execute(
+            "DELETE FROM responses WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+    _counters["evictions"] += deleted
+    return deleted
+
+
+def get(url, params=None):
+    """
+    Returns the cached body of a request.
+
+    Args:
+        url (str): the requested url
+        params (dict): the query string parameters
+
+    Returns:
+        bytes: the response body, or None if the request is not cached or has expired
+    """
+
+    key = _key(url, params)
+    with _lock:
+        conn = _connection()
+        row = conn.execute(
+            "SELECT body, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None and row[1] <= time.time():
+            with conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            _counters["evictions"] += 1
+            row = None
+        _counters["hits" if row is not None else "misses"] += 1
+    return row[0] if row is not None else None
+
+
+def put(url, params, body, ttl):
+    """
+    Stores the body of a request in the cache.
+
+    Args:
+        url (str): the requested url
+        params (dict): the query string parameters
+        body (bytes): the response body
+        ttl (float): time to live of the entry in seconds
+    """
+
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, url, body, expires_at) VALUES (?, ?, ?, ?)",
+                (_key(url, params), url, body, time.time() + ttl),
+            )
+        _counters["stores"] += 1
+
+
+def purge_expired():
+    """Evicts all the expired entries, returns the number of evicted entries."""
+
+    with _lock:
+        return _purge_expired(_connection())
+
+
+def stats():
+    """Returns the cache counters and the hit rate of the current process."""
+
+    with _lock:
+        counters = dict(_counters)
+    lookups = counters["hits"] + counters["misses"]
+    counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+    return counters
+
+
+def log_stats():
+    """Logs the cache counters."""
+
+    counters = stats()
+    logging.info(
+        f"API cache : {counters['hits']} hits, {counters['misses']} misses "
+        f"({counters['hit_rate']:.0%} hit rate), {counters['evictions']} evictions."
+    )
@@ -0,0 +1,151 @@
+"""
+This checkpoints module keeps the outputs of the pipeline stages in a local SQLite database, under a run ID,
+so that a run stopped by an error, like the API limit being reached, can be resumed instead of starting
+over and spending the API quota again.
+
+A re-run with the same run ID (today's date by default, or the RUN_ID environment variable) restores the
+outputs of the stages that already completed, and the per-ticker stages (see extract_data._fan_out) skip
+the tickers they already fetched: each of their items is checkpointed as soon as it is fetched. The items
+of a stage are dropped once its outputs are stored, and all the checkpoints of a run once it succeeds. The
+checkpoints of the other runs, like a failed run of a previous day, are dropped when a run starts.
+
+Values are pickled, they are only ever read back by the pipeline that wrote them.
+
+Classes:
+    - Items : The per-ticker checkpoints of a stage.
+
+Functions:
+    - run_id : The ID of the current run.
+    - load_outputs : Returns the checkpointed outputs of a stage, or None.
+    - save_outputs : Checkpoints the outputs of a completed stage.
+    - clear_run : Drops all the checkpoints of a run.
+    - clear_other_runs : Drops the checkpoints of all the runs but one.
+"""
+
+
+import os
+import pickle
+from datetime import date
+from modules.sqlite_db import LocalDatabase
+
+
+CHECKPOINT_PATH = os.environ.get(
+    "CHECKPOINT_PATH", os.path.join("data", "checkpoints.sqlite")
+)
+
+_db = LocalDatabase(
+    [
+        """CREATE TABLE IF NOT EXISTS stage_outputs (
+            run_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            outputs BLOB NOT NULL,
+            PRIMARY KEY (run_id, stage)
+        )""",
+        """CREATE TABLE IF NOT EXISTS stage_items (
+            run_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value BLOB NOT NULL,
+            PRIMARY KEY (run_id, stage, key)
+        )""",
+    ]
+)
+_lock = _db.lock
+
+
+def _connection():
+    """Returns the connection to the checkpoints database, opening it on first use."""
+
+    return _db.connection(CHECKPOINT_PATH)
+
+
+def run_id():
+    """The ID of the current run: the RUN_ID environment variable, or today's date."""
+
+    return os.environ.get("RUN_ID") or date.today().isoformat()
+
+
+def load_outputs(run, stage):
+    """
+    Returns the checkpointed outputs of a stage.
+
+    Args:
+        run (str): the run ID
+        stage (str): the stage name
+
+    Returns:
+        dict: the outputs of the stage, None if it didn't complete in this run
+    """
+
+    with _lock:
+        row = _connection().execute(
+            "SELECT outputs FROM stage_outputs WHERE run_id = ? AND stage = ?", (run, stage)
+        ).fetchone()
+    return None if row is None else pickle.loads(row[0])
+
+
+def save_outputs(run, stage, outputs):
+    """
+    Checkpoints the outputs of a completed stage, and drops its per-ticker checkpoints.
+
+    Args:
+        run (str): the run ID
+        stage (str): the stage name
+        outputs (dict): the outputs of the stage
+    """
+
+    blob = pickle.dumps(outputs, protocol=pickle.HIGHEST_PROTOCOL)
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO stage_outputs VALUES (?, ?, ?)", (run, stage, blob))
+            conn.execute("DELETE FROM stage_items WHERE run_id = ? AND stage = ?", (run, stage))
+
+
+def clear_run(run):
+    """Drops all the checkpoints of a run."""
+
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.execute("DELETE FROM stage_outputs WHERE run_id = ?", (run,))
+            conn.execute("DELETE FROM stage_items WHERE run_id = ?", (run,))
+
+
+def clear_other_runs(run):
+    """Drops the checkpoints of all the runs but one, the run being started."""
+
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.execute("DELETE FROM stage_outputs WHERE run_id <> ?", (run,))
+            conn.execute("DELETE FROM stage_items WHERE run_id <> ?", (run,))
+
+
+class Items:
+    """
+    The per-ticker checkpoints of a stage in a run: the items already fetched are loaded once, and each new
+    item is stored as soon as it is fetched.
+    """
+
+    def __init__(self, run, stage):
+        self.run = run
+        self.stage = stage
+        with _lock:
+            rows = _connection().execute(
+                "SELECT key, value FROM stage_items WHERE run_id = ? AND stage = ?", (run, stage)
+            ).fetchall()
+        self.done = {key: pickle.loads(value) for key, value in rows}
+
+    def save(self, key, value):
+        """Checkpoints the item of a key, like a ticker."""
+
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with _lock:
+            conn = _connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO stage_items VALUES (?, ?, ?, ?)",
+                    (self.run, self.stage, key, blob),
+                )
+        self.done[key] = value
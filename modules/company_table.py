@@ -0,0 +1,175 @@
+"""
+This company_table module answers the page queries of the company table of the dashboard: a Dash
+DataTable with server-side sorting, filtering and pagination, so that only the visible page of rows is
+sent to the browser.
+
+Queries run against an in-memory frame prepared once per dataset: the table columns only, with a
+lowercase copy of the text columns for case-insensitive filters. Rows are filtered with vectorized
+masks, then only the rows of the requested page are taken from a stable sort, with a partial sort
+(nsmallest / nlargest) on a single numeric column.
+
+Functions:
+    - table_columns : DataTable column definitions.
+    - prepare_table : Frame the page queries run against.
+    - parse_filter : Parses a DataTable filter query.
+    - query_page : Returns a page of rows, sorted and filtered.
+"""
+
+
+import math
+import re
+
+
+PAGE_SIZE = 15
+# Column : (name, type) of the table, in order
+TABLE_COLUMNS = {
+    "symbol": ("Symbol", "text"),
+    "companyName": ("Company Name", "text"),
+    "marketCap": ("Market Capitalization ($)", "numeric"),
+    "beta": ("Beta", "numeric"),
+    "fullTimeEmployees": ("Full Time Employees", "numeric"),
+    "yest_twitter_positive_mentions": ("Positive Mentions", "numeric"),
+    "yest_twitter_negative_mentions": ("Negative Mentions", "numeric"),
+    "yest_twitter_mean_sentiment_score": ("Mean Sentiment Score", "numeric"),
+}
+LOWERCASE_SUFFIX = "__lower"
+
+# One filter of a DataTable filter query, like {marketCap} s> 1000 or {companyName} icontains "app"
+FILTER_PART = re.compile(
+    r"\{(?P<column>[^}]+)\}\s*"
+    r"(?P<case>[is]?)(?:(?P<operator>eq|ne|lt|le|gt|ge|contains|datestartswith)\b|(?P<symbol><=|>=|!=|<|>|=))"
+    r"\s*(?P<value>.*)"
+)
+OPERATORS = {"=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+
+
+def table_columns():
+    """DataTable column definitions of the company table."""
+
+    columns = []
+    for column, (name, column_type) in TABLE_COLUMNS.items():
+        definition = {"name": name, "id": column, "type": column_type}
+        if column_type == "numeric":
+            definition["format"] = {"specifier": ",.2~f"}
+        columns.append(definition)
+    return columns
+
+
+def prepare_table(df):
+    """
+    Frame the page queries of a dataset run against.
+
+    Args:
+        df (pandas.DataFrame): the dashboard data, with symbol as a column
+
+    Returns:
+        pandas.DataFrame: the table columns, and a lowercase copy of the text columns
+    """
+
+    table = df[[column for column in TABLE_COLUMNS if column in df.columns]].reset_index(drop=True)
+    for column, (_, column_type) in TABLE_COLUMNS.items():
+        if column_type == "text" and column in table.columns:
+            table[column + LOWERCASE_SUFFIX] = table[column].astype(str).str.lower()
+    return table
+
+
+def _parse_value(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"`":
+        return value[1:-1].replace("\\" + value[0], value[0])
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parse_filter(filter_query):
+    """
+    Parses a DataTable filter query.
+
+    Args:
+        filter_query (str): filters joined by &&, like {marketCap} s> 1e12 && {companyName} icontains inc
+
+    Returns:
+        list: (column, operator, case_sensitive, value) tuples, unknown columns and operators skipped
+    """
+
+    filters = []
+    for part in (filter_query or "").split(" && "):
+        match = FILTER_PART.match(part.strip())
+        if match is None or match["column"] not in TABLE_COLUMNS:
+            continue
+        operator = match["operator"] or OPERATORS[match["symbol"]]
+        case_sensitive = match["case"] != "i"
+        filters.append((match["column"], operator, case_sensitive, _parse_value(match["value"])))
+    return filters
+
+
+def _filter_mask(table, column, operator, case_sensitive, value):
+    numeric = TABLE_COLUMNS[column][1] == "numeric"
+    if numeric and not isinstance(value, float):
+        # A text value on a numeric column matches nothing, rather than failing
+        return table[column] != table[column]
+    if not numeric:
+        value = str(value) if not isinstance(value, float) else f"{value:g}"
+        if not case_sensitive:
+            column, value = column + LOWERCASE_SUFFIX, value.lower()
+
+    series = table[column]
+    if operator == "contains":
+        return series.astype(str).str.contains(str(value), regex=False)
+    if operator == "datestartswith":
+        return series.astype(str).str.startswith(str(value))
+    return {
+        "eq": series.__eq__,
+        "ne": series.__ne__,
+        "lt": series.__lt__,
+        "le": series.__le__,
+        "gt": series.__gt__,
+        "ge": series.__ge__,
+    }[operator](value)
+
+
+def query_page(table, page_current=0, page_size=PAGE_SIZE, sort_by=None, filter_query=""):
+    """
+    Returns a page of rows of the company table, sorted and filtered.
+
+    Args:
+        table (pandas.DataFrame): the frame returned by prepare_table
+        page_current (int): the page number, from 0
+        page_size (int): the number of rows of a page
+        sort_by (list): DataTable sort_by, like [{"column_id": "marketCap", "direction": "desc"}]
+        filter_query (str): DataTable filter query
+
+    Returns:
+        tuple: the rows of the page as a list of dicts, and the number of pages
+    """
+
+    for column, operator, case_sensitive, value in parse_filter(filter_query):
+        table = table[_filter_mask(table, column, operator, case_sensitive, value)]
+
+    page_count = max(1, math.ceil(len(table) / page_size))
+    start = min(page_current or 0, page_count - 1) * page_size
+    end = start + page_size
+
+    sort_by = [s for s in (sort_by or []) if s["column_id"] in TABLE_COLUMNS]
+    if (
+        len(sort_by) == 1
+        and TABLE_COLUMNS[sort_by[0]["column_id"]][1] == "numeric"
+        and not table[sort_by[0]["column_id"]].isna().any()
+    ):
+        # Only the rows up to the end of the page are sorted (nsmallest and nlargest drop NaNs)
+        column = sort_by[0]["column_id"]
+        if sort_by[0]["direction"] == "asc":
+            table = table.nsmallest(end, column, keep="first")
+        else:
+            table = table.nlargest(end, column, keep="first")
+    elif sort_by:
+        table = table.sort_values(
+            [s["column_id"] for s in sort_by],
+            ascending=[s["direction"] == "asc" for s in sort_by],
+            kind="stable",
+        )
+
+    page = table.iloc[start:end][[column for column in TABLE_COLUMNS if column in table.columns]]
+    return page.to_dict("records"), page_count
@@ -0,0 +1,74 @@
+"""
+This config module holds the runtime configuration of the app: environment variables and secrets.
+
+Nothing is read when the module is imported. Each value is resolved on first access and then kept,
+so that importing the app has no side effect and needs neither the PROJECT_ID environment variable
+nor any network access.
+
+Classes:
+    - Config : Lazily resolved configuration.
+
+Functions:
+    - get_config : Returns the configuration shared by the whole process.
+"""
+
+
+import os
+from functools import cached_property
+from modules import gcp_interactions
+
+
+class Config:
+    """Lazily resolved configuration: each value is read on first access, then cached."""
+
+    @cached_property
+    def project_id(self):
+        """The GCP project ID, only required when the secrets come from GCP Secret Manager."""
+
+        if gcp_interactions.SECRETS_BACKEND == "gcp":
+            return os.environ["PROJECT_ID"]
+        return os.environ.get("PROJECT_ID")
+
+    def secret(self, secret_name):
+        """Value of a secret, cached by gcp_interactions for SECRETS_TTL seconds."""
+        return gcp_interactions.get_secret(self.project_id, secret_name)
+
+    @property
+    def fmi_api_key(self):
+        return self.secret("FMI_API_KEY")
+
+    @property
+    def finnh_api_key(self):
+        return self.secret("FINNH_API_KEY")
+
+    @property
+    def sql_instance_connection_name(self):
+        return self.secret("SQL_INSTANCE_CONNECTION_NAME1")
+
+    @property
+    def sql_db_user(self):
+        return self.secret("SQL_DB_USER1")
+
+    @property
+    def sql_db_pass(self):
+        return self.secret("SQL_DB_PASS1")
+
+    @property
+    def sql_db_name(self):
+        return self.secret("SQL_DB_NAME1")
+
+    @property
+    def sql_db_table_name(self):
+        return self.secret("SQL_DB_TABLE_NAME1")
+
+
+_config = None
+
+
+def get_config():
+    """Returns the configuration shared by the whole process, created on first use."""
+
+    global _config
+    if _config is None:
+        _config = Config()
+    return _config
@@ -3,617 +3,1019 @@ This dash_plotly_dashboard module uses a unique function to create an interactiv
 dashboard webserver with Dash & Plotly libraries.
 
 Functions:
-    - dashboard : creates a simple dashboard with 3 callbacks for interactivity.
+    - create_app : creates a simple dashboard with 3 callbacks for interactivity.
+    - dashboard : creates the dashboard and runs its web server (see the serving module).
     - render_content_marketcap : Renders the left-side charts representing 
-      classifications by market cap.
+      classifications by market cap, and the company table.
+    - update_company_table : Sends the visible page of the company table, sorted and filtered on
+      the server (see the company_table module).
     - render_content_scatter : Renders the right-side charts representing the
-      3 dimensions scatter.
-    - update_highlighted_point : Interactivity when cursor is on a given company point.
+      3 dimensions scatter. Both send the URL of the cached figure, the browser fetches it.
+    - update_highlighted_point : Interactivity when cursor is on a given company point, sent as
+      a Patch of the highlight trace rather than a new figure.
+    - dataset_version : Short content hash of a dataset, used to key its derived caches.
+    - build_figures : Builds and serializes the figures of every tab once per dataset version.
+    - get_figure : Returns the cached JSON of the figure of a tab for a dataset version.
+    - figure_url : URL of the cached JSON of a figure.
+    - serve_figure : Route sending the cached JSON of a figure.
+    - highlight_patch : Partial figure update showing the hovered company in green.
+    - top_n_with_other : The largest companies, the others summed up into an "Other" row.
+    - downsample : A bounded, distribution preserving sample of the companies.
+    - prepare_dataset : Dashboard frame of the final data.
+    - set_dataset : Swaps in the dataset served by the dashboard and evicts the previous figures.
+    - current_dataset : The dataset served by the dashboard.
+    - reload_if_changed : Loads the snapshot file if it was written since the last load.
+    - watch_snapshot : Background thread reloading the snapshot file when it changes.
+
+The running dashboard reloads a new snapshot file by itself, every DASHBOARD_RELOAD_INTERVAL
+seconds at most, without a restart: the data is refreshed by rewriting the snapshot.
+
+The charts stay bounded for large universes: the market cap charts show the DASHBOARD_TOP_N largest
+companies and an "Other" bucket, the scatters are downsampled on the server to
+DASHBOARD_MAX_SCATTER_POINTS companies and drawn with WebGL.
+
+The figures are serialized to JSON and compressed once per dataset, and served as is under
+/figures/<dataset version>/<tab>.json with a long lived Cache-Control header: the tab callbacks only send
+the graph and that URL, a clientside callback fetches the figure. Sent in the callback response, a
+figure would be serialized again by Dash on each tab render, which took most of the time of the
+callback (see profiling/bench_serving.py).
+
+The server also exposes the Prometheus metrics of the pipeline and the time of each callback at /metrics
+(see the metrics module).
+
+Dash, Plotly and scikit-learn are imported when the dashboard is created, not when the module is imported.
 """
+import hashlib
 import os
 import logging
+import threading
 from datetime import date, timedelta
-import dash_bootstrap_components as dbc
-import pandas as pd
-import plotly.express as px
-from dash import dcc, html, Dash
-from dash.dependencies import Input, Output
-from sklearn.preprocessing import MinMaxScaler
+from modules import company_table
+from modules.metrics import register_metrics_endpoint, timed_callback
+from modules.serving import SERVER_MODE, run_gunicorn
+from modules.snapshot import read_snapshot, snapshot_path
+from modules.static_assets import (
+    ASSET_MAX_AGE,
+    STYLESHEETS,
+    asset_url,
+    compress,
+    enable_compression,
+    preferred_encoding,
+    register_static_assets,
+)
 
 
-def dashboard():
-    
-    logging.info("Dash Plotly dashboard started.")
-    
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    camera = dict(eye=dict(x=0, y=-2.5, z=0.1))
+CAMERA = dict(eye=dict(x=0, y=-2.5, z=0.1))
+LABELS = dict(
+    companyName="Company Name",
+    fullTimeEmployees="Full Time Employees",
+    normalized_sentiment="Last 15 days Reddit Sentiment",
+    marketCap="Market Capitalization ($)",
+)
 
-    df = pd.read_csv("data/final_data.csv")
-    
-    df["normalized_sentiment"] = scaler.fit_transform(df[["yest_twitter_mean_sentiment_score"]])
-    df["normalized_sentiment"] = df["normalized_sentiment"].fillna(df["normalized_sentiment"].mean())
-    df["normalized_sentiment"] = df["normalized_sentiment"].round(2)
-    
-    external_stylesheets = [
-        'https://fonts.googleapis.com/css2?family=Lato&display=swap',
-        dbc.themes.SLATE
-    ]
-    # app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
-    app = Dash(external_stylesheets=external_stylesheets)
-    app.css.config.serve_locally = True
+# Columns drawn on each axis of the scatter figures
+SCATTER_AXES = {
+    "tab-3d-scatter": {"x": "fullTimeEmployees", "y": "normalized_sentiment", "z": "marketCap"},
+    "tab-2d-scatter": {"x": "fullTimeEmployees", "y": "marketCap"},
+}
 
-    app.layout = html.Div(
-        style={"backgroundColor": "#1F2630"},
-        children=[
-            html.Br(),
-            html.H1(
-                "Data pipeline demo 1 : micro ETL and web dashboard on GCP",
-                style={
-                    "textAlign": "center",
-                    "padding-top": "50px",
-                    "padding-left": "20px",
-                    "padding-bottom": "50px",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#c2d6ea",
-                    "font-weight": "bold",
-                    "font-size": 30,
-                },
-            ),
-            html.H2(
-                "(please wait a few seconds for the charts to load)",
-                style={
-                    "textAlign": "center",
-                    "padding-top": "20px",
-                    "padding-left": "20px",
-                    "padding-bottom": "25px",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#c2d6ea",
-                    "font-weight": "bold",
-                    "font-size": 20,
-                },
-            ),
-            html.Div(
-                [
-                    html.Span("Github repository : "),
-                    html.A(
-                        "https://github.com/AlexandreGarito/data-pipeline-demo-1",
-                        href="https://github.com/AlexandreGarito/data-pipeline-demo-1",
-                        target="_blank",
-                        style={
-                            "color": "#c2d6ea",
-                            "text-decoration": "underline",
-                        },
-                    ),
-                ],
-                style={
-                    "textAlign": "center",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#c2d6ea",
-                    "font-weight": "bold",
-                    "font-size": 22, 
-                    "padding": "20px 0px 0px 0px",
-                },
-            ),
-            html.Br(),
-            html.H3(
-                """The purpose of this project is to showcase my ability to employ Python in extracting, transforming, 
-                loading, and displaying a simple set of API data within an interactive dashboard that updates daily. 
-                This serves as a small "A to Z project" in 
-                my data engineering journey, where I can gain experience with some tools and challenges involved in the field. 
-                This project also involves some DevOps processes and tools such as CI/CD, Docker, and Airflow.
-                Although dashboarding is not a core skill in data engineering, here it serves as an accessory tool that 
-                demonstrates the functionality of this pipeline.""",
-                style={
-                    "textAlign": "left",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#c2d6ea",
-                    "font-weight": "normal",
-                    "font-size": 15,
-                    "padding": "15px 100px 0px 100px",
-                },
-            ),
-            html.H3(
-                """The pipeline is coded in Python. The app is run in a Docker container on Google Cloud Platform (GCP). 
-                Data is extracted with API requests, transformed using pandas, loaded into a GCP Cloud SQL PostgreSQL 
-                database, and showcased in this dashboard using the Dash-Plotly web framework (based on Flask). 
-                With GCP Cloud Build, the code is automatically pulled from the GitHub repo with each new commit, 
-                built as a Docker image, and a container is deployed on GCP Cloud Run. At the start of the container, 
-                unit tests are run with pytest, then the data 
-                extraction scripts are called, then the Dash-Plotly app and web server is called.
-                Every day at 2 AM UTC, a GCP Cloud Composer (managed Airflow) DAG triggers a container reboot to 
-                refresh the data.""",
-                style={
-                    "textAlign": "left",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#c2d6ea",
-                    "font-weight": "normal",
-                    "font-size": 15,
-                    "padding": "15px 100px 0px 100px",
-                },
-            ),
-            html.H3(
-                """Free and easily accessible API data was prioritized to facilitate long-term stability of the pipeline,
-                data is therefore rather limited in order to stay under the free API rate limits and focuses on the biggest 
-                publicly traded companies of the Technology field.""",
-                style={
-                    "textAlign": "left",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#c2d6ea",
-                    "font-weight": "normal",
-                    "font-size": 15,
-                    "padding": "15px 100px 0px 100px",
-                },
-            ),
-            html.H3(
-                """My original idea was to use the data of those companies by crossing their market capitalization, their 
-                number of employees, and their daily current job offerings to give a ranking of these companies when it 
-                comes to market cap per employee and market cap per job offer. This would've been a simple approach to find 
-                the "best-capitalized job offers" by company. Unfortunately, I realized that daily job offering data is 
-                quite tricky to obtain, often paid and often incomplete. So, I decided to replace it with Twitter social 
-                media sentiment, a data source simple to obtain and also updated daily. As a result, the dashboard would 
-                display the "best-capitalized workforce" for each company, along with their social media sentiment. Since 
-                the Twitter API ceased to be freely accessible in February 2023, the API I used ceased to provide it, and I 
-                had to switch to Reddit social sentiment, 
-                which is unfortunately more scarce than Twitter sentiment, but it's still the best option I have for now 
-                without having to redesign the entire social sentiment part of the pipeline.""",
-                style={
-                    "textAlign": "left",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#c2d6ea",
-                    "font-weight": "normal",
-                    "font-size": 15,
-                    "padding": "15px 100px 0px 100px",
-                },
-            ),
-            html.H3(
-                """As of March 2023, this dashboard primarily serves as a small working technical demo; however, I am committed to 
-                update and enhance the dashboard with more valuable data as I advance in my data engineering journey. Also, 
-                I discovered after a few days that Cloud Composer (managed Airflow) is actually somewhat expensive to run for 
-                an individual, so I'm rebooting my container with a cheaper GCP Cloud Scheduler + Cloud Function setup from now on. Update: 
-                As of 19/06/2023, the Reddit API is no longer free to use. As a consequence, the Reddit Sentiment updates were stopped just 
-                before the change.""",
-                style={
-                    "textAlign": "left",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#c2d6ea",
-                    "font-weight": "normal",
-                    "font-size": 15,
-                    "padding": "15px 100px 30px 100px",
-                },
-            ),
-            html.H3(
-                f"Last data update : {date.today()}",
-                style={
-                    "textAlign": "right",
-                    "padding-top": "0px",
-                    "padding-right": "20px",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#c2d6ea",
-                    "font-weight": "bold",
-                    "font-size": 10,
-                },
-            ),
-            html.H3(
-                "Made by Alexandre Garito",
-                style={
-                    "padding-top": "0px",
-                    "padding-left": "20px",
-                    "backgroundColor": "#1F2630",
-                    "font-family": "Lato",
-                    "color": "#43505b",
-                    "font-weight": "bold",
-                    "font-size": 10,
-                },
-            ),
-            html.Div(
-                [
-                    dcc.Tabs(
-                        style={"fontWeight": "bold", "color": "#c9c9c9"},
-                        id="tabs-marketcap",
-                        value="tab-treemap",
-                        children=[
-                            dcc.Tab(label="Treemap", value="tab-treemap"),
-                            dcc.Tab(label="Bar Chart", value="tab-barchart"),
-                        ],
-                        colors={
-                            "border": "#252E3F",
-                            "primary": "#3a485b",
-                            "background": "#3a485b",
-                        },
-                    )
-                ],
-                style={
-                    "width": "50%",
-                    "display": "inline-block",
-                    "backgroundColor": "#1F2630",
-                    "padding-top": "0px",
-                    "padding-left": "20px",
-                    "padding-right": "20px",
-                    "padding-bottom": "0px",
-                },
-            ),
-            html.Div(
-                [
-                    dcc.Tabs(
-                        style={"fontWeight": "bold", "color": "#c9c9c9"},
-                        id="tabs-scatter",
-                        value="tab-3d-scatter",
-                        children=[
-                            dcc.Tab(label="3D Scatter", value="tab-3d-scatter"),
-                            dcc.Tab(label="2D Scatter", value="tab-2d-scatter"),
-                        ],
-                        colors={
-                            "border": "#252E3F",
-                            "primary": "#3a485b",
-                            "background": "#3a485b",
-                        },
-                    )
-                ],
-                style={
-                    "width": "50%",
-                    "display": "inline-block",
-                    "backgroundColor": "#1F2630",
-                    "padding-top": "0px",
-                    "padding-left": "20px",
-                    "padding-right": "20px",
-                    "padding-bottom": "0px",
-                },
-            ),
-            html.Div(
-                id="tabs-content-marketcap",
-                style={
-                    "width": "50%",
-                    "display": "inline-block",
-                    "backgroundColor": "#1F2630",
-                    "padding-top": "0px",
-                    "padding-left": "20px",
-                    "padding-right": "20px",
-                    "padding-bottom": "20px",
-                },
-            ),
-            html.Div(
-                id="tabs-content-scatter",
-                style={
-                    "width": "50%",
-                    "display": "inline-block",
-                    "backgroundColor": "#1F2630",
-                    "padding-top": "0px",
-                    "padding-left": "20px",
-                    "padding-right": "20px",
-                    "padding-bottom": "20px",
-                },
-            ),
-        ],
-    )
+# Large universes: the market cap charts show the TOP_N largest companies and an "Other" bucket, the
+# scatters at most MAX_SCATTER_POINTS companies, the 2D one drawn with WebGL above WEBGL_MIN_POINTS
+TOP_N = int(os.environ.get("DASHBOARD_TOP_N", 25))
+MAX_SCATTER_POINTS = int(os.environ.get("DASHBOARD_MAX_SCATTER_POINTS", 5000))
+WEBGL_MIN_POINTS = 200
 
+# Seconds between two checks of the snapshot file by the running dashboard
+RELOAD_INTERVAL = int(os.environ.get("DASHBOARD_RELOAD_INTERVAL", 60))
 
-    @app.callback(
-        Output("tabs-content-marketcap", "children"), Input("tabs-marketcap", "value")
+# Dataset served by the dashboard, replaced as a whole by set_dataset
+_dataset = None
+_reload_lock = threading.RLock()
+# Interval of the snapshot watcher thread of this process, None if it doesn't watch
+_watch_interval = None
+
+FIGURES_URL = "/figures"
+# Sets the figure of a graph from the URL of its cached JSON, a dcc.Store inserted with the graph
+FETCH_FIGURE_JS = """
+async function(url) {
+    const response = await fetch(url);
+    if (!response.ok) {
+        return window.dash_clientside.no_update;
+    }
+    return response.json();
+}
+"""
+
+# Figures of the current dataset keyed by (tab, dataset version): their JSON text, their number of traces,
+# and their JSON compressed with each encoding once requested
+_figure_cache = {}
+
+
+def _add_highlight_trace(fig, tab):
+    """
+    Adds to a scatter figure an empty trace, drawn over it, in which the hovered company is shown
+    in green. It is the last trace of the figure, hover callbacks only patch its coordinates.
+    """
+    import plotly.graph_objects as go
+
+    if tab == "tab-3d-scatter":
+        trace = go.Scatter3d
+    else:
+        # Same renderer as the scatter, so that the highlight is drawn over its points
+        trace = go.Scattergl if fig.data[0].type == "scattergl" else go.Scatter
+    # Scaled like the points of the scatter, so that the highlighted one has the same size
+    sizeref = fig.data[0].marker.sizeref
+    return fig.add_trace(
+        trace(
+            **{axis: [] for axis in SCATTER_AXES[tab]},
+            mode="markers",
+            marker=dict(color="green", sizemode="area", sizeref=sizeref, line_width=0),
+            name="highlighted",
+            showlegend=False,
+            hoverinfo="skip",
+        )
     )
-    def render_content_marketcap(tab):
-        if tab == "tab-treemap":
-            return html.Div(
-                [
-                    dcc.Graph(
-                        id="graph-market-cap",
-                        figure=px.treemap(
-                            df,
-                            path=["companyName"],
-                            values="marketCap",
-                            hover_name="companyName",
-                            hover_data={"companyName": True, "marketCap": True},
-                            color="companyName",
-                            color_discrete_sequence=px.colors.qualitative.Alphabet,
-                            height=800,
-                            template="simple_white",
-                            title="Market Capitalization by Company ($)",
-                            labels={"marketCap": "Market Capitalization"},
-                        )
-                        .update_layout(
-                            font_size=10,
-                            font_color="#ffffff",
-                            paper_bgcolor="#252E3F",
-                            font_family="Lato",
-                        )
-                        .update_traces(
-                            hovertemplate=" <b>%{label}</b><br><br>Market Capitalization : $%{customdata}<extra></extra>",
-                            customdata=[f"{x:,.0f}" for x in df["marketCap"]],
-                        )
-                        .update_traces(marker=dict(cornerradius=20)),
-                    )
 
-                ]
-            )
-        elif tab == "tab-barchart":
-            return html.Div(
-                [
-                    dcc.Graph(
-                        id="graph-market-cap",
-                        figure=px.bar(
-                            df,
-                            x="companyName",
-                            y="marketCap",
-                            hover_name="companyName",
-                            hover_data={"companyName": True, "marketCap": True},
-                            color="companyName",
-                            color_discrete_sequence=px.colors.qualitative.Alphabet,
-                            height=800,
-                            title="Market Capitalization by Company ($)",
-                            labels={
-                                "marketCap": "Market Capitalization",
-                                "companyName": "Company Name",
-                            },
-                            # orientation='h'
-                        )
-                        .update_layout(
-                            font_size=10,
-                            font_color="#ffffff",
-                            paper_bgcolor="#252E3F",
-                            font_family="Lato",
-                        )
-                        .update_traces(
-                            hovertemplate=" <b>%{label}</b><br><br>Market Capitalization : $%{customdata}<extra></extra>",
-                            customdata=[f"{x:,.0f}" for x in df["marketCap"]],
-                        ),
-                    )
-                ]
-            )
 
+def top_n_with_other(df, top_n=TOP_N):
+    """
+    The top_n companies by market cap, the others being summed up into a single "Other" row.
 
-    @app.callback(
-        Output("tabs-content-scatter", "children"), Input("tabs-scatter", "value")
+    Args:
+        df (pandas.DataFrame): the dashboard data
+        top_n (int): the number of companies kept
+
+    Returns:
+        pandas.DataFrame: at most top_n + 1 rows, df itself if it has no more than top_n rows
+    """
+    import pandas as pd
+
+    if len(df) <= top_n:
+        return df
+    top = df.nlargest(top_n, "marketCap")
+    rest = df.drop(top.index)
+    other = pd.DataFrame(
+        {"companyName": [f"Other ({len(rest)} companies)"], "marketCap": [rest["marketCap"].sum()]}
     )
-    def render_content_scatter(tab):
-        if tab == "tab-3d-scatter":
-            return html.Div(
-                [
-                    dcc.Graph(
-                        id="graph-3d-scatter",
-                        figure=px.scatter_3d(
-                            df,
-                            x="fullTimeEmployees",
-                            y="normalized_sentiment",
-                            z="marketCap",
-                            title="Market Capitalization & Number of Employees & Last 15 days Reddit Sentiment",
-                            color="normalized_sentiment",
-                            hover_name="companyName",
-                            log_x=True,
-                            log_z=True,
-                            size="normalized_sentiment",
-                            height=800,
-                            size_max=30,
-                            color_continuous_scale="rdbu",
-                            labels=dict(
-                                companyName="Company Name",
-                                fullTimeEmployees="Full Time Employees",
-                                normalized_sentiment="Last 15 days Reddit Sentiment",
-                                marketCap="Market Capitalization ($)",
-                            ),
-                        ).update_layout(
-                            scene_camera=camera,
-                            font_size=10,
-                            font_color="#ffffff",
-                            paper_bgcolor="#252E3F",
-                            font_family="Lato",
-                        ),
-                    )
-                ]
-            )
-        elif tab == "tab-2d-scatter":
-            return html.Div(
-                [
-                    dcc.Graph(
-                        id="graph-2d-scatter",
-                        figure=px.scatter(
-                            df,
-                            x="fullTimeEmployees",
-                            y="marketCap",
-                            title="Market Capitalization & Full Time Employees & Reddit Sentiment (last 15 days)",
-                            color="normalized_sentiment",
-                            hover_name="companyName",
-                            log_x=True,
-                            log_y=True,
-                            size="normalized_sentiment",
-                            height=800,
-                            size_max=30,
-                            color_continuous_scale="rdbu",
-                            labels=dict(
-                                companyName="Company Name",
-                                fullTimeEmployees="Full Time Employees",
-                                normalized_sentiment="Last 15 days Reddit Sentiment",
-                                marketCap="Market Capitalization ($)",
-                            ),
-                        )
-                        .update_layout(
-                            yaxis2=dict(
-                                title="Another Y-axis", overlaying="y", position=0.85
-                            ),
-                            font_size=10,
-                            font_color="#ffffff",
-                            paper_bgcolor="#252E3F",
-                            font_family="Lato",
-                        )
-                        .update_yaxes(tickprefix="$"),
-                    )
-                ]
-            )
+    return pd.concat([top, other], ignore_index=True)
 
-    @app.callback(
-        Output("graph-3d-scatter", "figure"),
-        Input("graph-market-cap", "hoverData"),
-        Input("tabs-scatter", "value"),
+
+def downsample(df, max_points=MAX_SCATTER_POINTS):
+    """
+    At most max_points companies of the data: the largest half by market cap, and an evenly spaced
+    sample of the others along the market cap, so that the shape of the distribution is kept.
+
+    Args:
+        df (pandas.DataFrame): the dashboard data
+        max_points (int): the number of companies kept
+
+    Returns:
+        pandas.DataFrame: the sample, df itself if it has no more than max_points rows
+    """
+    import numpy as np
+
+    if len(df) <= max_points:
+        return df
+    by_market_cap = df.sort_values("marketCap", ascending=False, kind="stable")
+    n_top = max_points // 2
+    rest = by_market_cap.iloc[n_top:]
+    sampled = np.linspace(0, len(rest) - 1, max_points - n_top).round().astype(int)
+    return by_market_cap.iloc[np.r_[np.arange(n_top), n_top + sampled]]
+
+
+def _treemap_figure(df):
+    import plotly.express as px
+
+    df = top_n_with_other(df, TOP_N)
+
+    return (
+        px.treemap(
+            df,
+            path=["companyName"],
+            values="marketCap",
+            hover_name="companyName",
+            hover_data={"companyName": True, "marketCap": True},
+            color="companyName",
+            color_discrete_sequence=px.colors.qualitative.Alphabet,
+            height=800,
+            template="simple_white",
+            title="Market Capitalization by Company ($)",
+            labels={"marketCap": "Market Capitalization"},
+        )
+        .update_layout(
+            font_size=10,
+            font_color="#ffffff",
+            paper_bgcolor="#252E3F",
+            font_family="Lato",
+        )
+        .update_traces(
+            hovertemplate=" <b>%{label}</b><br><br>Market Capitalization : $%{customdata}<extra></extra>",
+            customdata=[f"{x:,.0f}" for x in df["marketCap"]],
+        )
+        .update_traces(marker=dict(cornerradius=20))
     )
-    def update_3d_highlighted_point(hoverData, tab):
-        if tab != "tab-3d-scatter":
-            raise dash.exceptions.PreventUpdate
 
-        try:
-            company_name = hoverData["points"][0]["label"]
-            highlighted_df = df[df["companyName"] == company_name]
-        except (KeyError, TypeError):
-            company_name = "dummy"
-            highlighted_df = df
 
-        scatter_data = px.scatter_3d(
-            highlighted_df,
-            x="fullTimeEmployees",
-            y="normalized_sentiment",
-            z="marketCap",
-            title="Market Capitalization & Full Time Employees & Reddit Sentiment (last 15 days)",
-            color="normalized_sentiment",
+def _barchart_figure(df):
+    import plotly.express as px
+
+    df = top_n_with_other(df, TOP_N)
+
+    return (
+        px.bar(
+            df,
+            x="companyName",
+            y="marketCap",
             hover_name="companyName",
-            log_x=True,
-            log_z=True,
-            size="normalized_sentiment",
+            hover_data={"companyName": True, "marketCap": True},
+            color="companyName",
+            color_discrete_sequence=px.colors.qualitative.Alphabet,
             height=800,
-            size_max=30,
-            color_continuous_scale="rdbu",
-            labels=dict(
-                companyName="Company Name",
-                fullTimeEmployees="Full Time Employees",
-                normalized_sentiment="Last 15 days Reddit Sentiment",
-                marketCap="Market Capitalization ($)",
-            ),
-        ).update_layout(
-            scene_camera=camera,
+            title="Market Capitalization by Company ($)",
+            labels={
+                "marketCap": "Market Capitalization",
+                "companyName": "Company Name",
+            },
+            # orientation='h'
+        )
+        .update_layout(
             font_size=10,
             font_color="#ffffff",
             paper_bgcolor="#252E3F",
             font_family="Lato",
         )
+        .update_traces(
+            hovertemplate=" <b>%{label}</b><br><br>Market Capitalization : $%{customdata}<extra></extra>",
+            customdata=[f"{x:,.0f}" for x in df["marketCap"]],
+        )
+    )
+
 
-        scatter_data["data"][0]["marker"]["color"] = "green"
+def _scatter_3d_figure(df):
+    import plotly.express as px
 
-        not_highlighted_df = df[df["companyName"] != company_name]
+    # Scatter3d is always drawn with WebGL
+    df = downsample(df, MAX_SCATTER_POINTS)
+
+    fig = px.scatter_3d(
+        df,
+        x="fullTimeEmployees",
+        y="normalized_sentiment",
+        z="marketCap",
+        title="Market Capitalization & Number of Employees & Last 15 days Reddit Sentiment",
+        color="normalized_sentiment",
+        hover_name="companyName",
+        log_x=True,
+        log_z=True,
+        size="normalized_sentiment",
+        height=800,
+        size_max=30,
+        color_continuous_scale="rdbu",
+        labels=LABELS,
+    ).update_layout(
+        scene_camera=CAMERA,
+        font_size=10,
+        font_color="#ffffff",
+        paper_bgcolor="#252E3F",
+        font_family="Lato",
+    )
+    return _add_highlight_trace(fig, "tab-3d-scatter")
 
-        not_highlighted_data = px.scatter_3d(
-            not_highlighted_df,
+
+def _scatter_2d_figure(df):
+    import plotly.express as px
+
+    df = downsample(df, MAX_SCATTER_POINTS)
+
+    fig = (
+        px.scatter(
+            df,
             x="fullTimeEmployees",
-            y="normalized_sentiment",
-            z="marketCap",
+            y="marketCap",
             title="Market Capitalization & Full Time Employees & Reddit Sentiment (last 15 days)",
             color="normalized_sentiment",
             hover_name="companyName",
             log_x=True,
-            log_z=True,
+            log_y=True,
             size="normalized_sentiment",
             height=800,
             size_max=30,
             color_continuous_scale="rdbu",
-            labels=dict(
-                companyName="Company Name",
-                fullTimeEmployees="Full Time Employees",
-                normalized_sentiment="Last 15 days Reddit Sentiment",
-                marketCap="Market Capitalization ($)",
-            ),
-        ).update_layout(
-            scene_camera=camera,
+            labels=LABELS,
+            render_mode="webgl" if len(df) > WEBGL_MIN_POINTS else "svg",
+        )
+        .update_layout(
+            yaxis2=dict(title="Another Y-axis", overlaying="y", position=0.85),
             font_size=10,
             font_color="#ffffff",
             paper_bgcolor="#252E3F",
             font_family="Lato",
         )
+        .update_yaxes(tickprefix="$")
+    )
+    return _add_highlight_trace(fig, "tab-2d-scatter")
+
+
+FIGURE_BUILDERS = {
+    "tab-treemap": _treemap_figure,
+    "tab-barchart": _barchart_figure,
+    "tab-3d-scatter": _scatter_3d_figure,
+    "tab-2d-scatter": _scatter_2d_figure,
+}
+
+
+def dataset_version(df):
+    """Short content hash of a dataset, used to key its derived caches."""
+    import pandas as pd
+
+    return hashlib.sha1(pd.util.hash_pandas_object(df).values.tobytes()).hexdigest()[:12]
+
+
+def build_figures(df, version):
+    """
+    Builds the figure of every tab once, serializes it to JSON once, and keeps the JSON text in the
+    figure cache, so that serve_figure sends it as is.
+
+    Returns:
+        dict: the JSON text of the figure of each tab
+    """
+
+    for tab, builder in FIGURE_BUILDERS.items():
+        figure = builder(df)
+        _figure_cache[(tab, version)] = {"json": figure.to_json(), "traces": len(figure.data)}
+    logging.info(f"{len(FIGURE_BUILDERS)} figures built for dataset version {version}.")
+    return {tab: _figure_cache[(tab, version)]["json"] for tab in FIGURE_BUILDERS}
+
+
+def _cached_figure(tab, df, version):
+    cached = _figure_cache.get((tab, version))
+    if cached is None:
+        build_figures(df, version)
+        cached = _figure_cache[(tab, version)]
+    return cached
+
+
+def get_figure(tab, df, version):
+    """Returns the cached JSON text of the figure of a tab for a dataset version, building the figures on a miss."""
+
+    return _cached_figure(tab, df, version)["json"]
+
+
+def figure_url(tab, version):
+    """URL of the cached JSON of the figure of a tab for a dataset version."""
+
+    return f"{FIGURES_URL}/{version}/{tab}.json"
+
+
+def serve_figure(version, tab):
+    """
+    Route sending the cached JSON of the figure of a tab, compressed once per encoding. The figures
+    of a dataset version never change, so they are sent with a one year, immutable Cache-Control
+    header. An outdated version, the dataset having been reloaded since the page was rendered, gets
+    the current figure, which must not be cached under its URL.
+
+    Args:
+        version (str): the dataset version in the URL
+        tab (str): the tab of the figure
+
+    Returns:
+        flask.Response: the figure JSON
+    """
+    import flask
+
+    if tab not in FIGURE_BUILDERS:
+        flask.abort(404)
+    df, served_version = _served()
+    cached = _cached_figure(tab, df, served_version)
+    encoding = preferred_encoding(flask.request)
+    if encoding is None:
+        response = flask.Response(cached["json"], mimetype="application/json")
+    else:
+        if encoding not in cached:
+            cached[encoding] = compress(cached["json"].encode(), encoding)
+        # Flask-Compress leaves the responses with a Content-Encoding as they are
+        response = flask.Response(cached[encoding], mimetype="application/json")
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    if version == served_version:
+        response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _hovered_company(hoverData):
+    """Company name of the hovered market cap chart point, None if nothing is hovered."""
+
+    try:
+        return hoverData["points"][0]["label"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def highlight_patch(tab, df, version, company_name):
+    """
+    Partial update of a cached scatter figure that shows a company in green.
+
+    Only the coordinates of the highlight trace are sent to the browser, the figure it already has is
+    left untouched.
+
+    Args:
+        tab (str): tab-3d-scatter or tab-2d-scatter
+        df (pandas.DataFrame): the dashboard data
+        version (str): the dataset version of df
+        company_name (str): the company to highlight, None to clear the highlight
+
+    Returns:
+        dash.Patch: the update of the highlight trace
+    """
+    from dash import Patch
+
+    highlight_trace = _cached_figure(tab, df, version)["traces"] - 1
+    highlighted_df = df[df["companyName"] == company_name]
+
+    patched_figure = Patch()
+    for axis, column in SCATTER_AXES[tab].items():
+        patched_figure["data"][highlight_trace][axis] = highlighted_df[column].tolist()
+    patched_figure["data"][highlight_trace]["marker"]["size"] = highlighted_df[
+        "normalized_sentiment"
+    ].tolist()
+    return patched_figure
+
+
+def prepare_dataset(df_final_data):
+    """
+    Dashboard frame of the final data: the symbol as a column and the sentiment normalized to [0, 1].
+
+    Args:
+        df_final_data (pandas.DataFrame): the final data, indexed by symbol
+
+    Returns:
+        pandas.DataFrame: the dashboard data
+    """
+    from sklearn.preprocessing import MinMaxScaler
+
+    scaler = MinMaxScaler(feature_range=(0, 1))
+
+    if df_final_data.index.name == "symbol":
+        df = df_final_data.reset_index()
+    else:
+        df = df_final_data.copy()
+
+    df["normalized_sentiment"] = scaler.fit_transform(df[["yest_twitter_mean_sentiment_score"]])
+    df["normalized_sentiment"] = df["normalized_sentiment"].fillna(df["normalized_sentiment"].mean())
+    df["normalized_sentiment"] = df["normalized_sentiment"].round(2)
+    return df
+
+
+def _snapshot_mtime():
+    try:
+        return os.stat(snapshot_path()).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def set_dataset(df_final_data, snapshot_mtime=None):
+    """
+    Makes a dataset the one served by the dashboard.
+
+    Its figures are built before it is swapped in, requests being served from the previous dataset
+    meanwhile. The figures of the previous datasets are then evicted from the cache.
+
+    Args:
+        df_final_data (pandas.DataFrame): the final data, indexed by symbol
+        snapshot_mtime (float): modification time of the snapshot file the data was read from
+
+    Returns:
+        str: the dataset version
+    """
+
+    global _dataset
+
+    df = prepare_dataset(df_final_data)
+    version = dataset_version(df)
+    if not all((tab, version) in _figure_cache for tab in FIGURE_BUILDERS):
+        build_figures(df, version)
+
+    table = company_table.prepare_table(df)
+
+    updated = date.fromtimestamp(snapshot_mtime) if snapshot_mtime else date.today()
+    with _reload_lock:
+        # A single assignment, so that callbacks see either the previous or the new dataset as a whole
+        _dataset = {
+            "df": df,
+            "table": table,
+            "version": version,
+            "snapshot_mtime": snapshot_mtime,
+            "updated": updated,
+        }
+
+        for key in [key for key in _figure_cache if key[1] != version]:
+            _figure_cache.pop(key, None)
+    logging.info(f"Dashboard serving dataset version {version}.")
+    return version
+
+
+def current_dataset():
+    """
+    The dataset served by the dashboard: a dict with df, table (the company table frame), version,
+    snapshot_mtime and updated.
+    """
+
+    if _dataset is None:
+        with _reload_lock:
+            if _dataset is None:
+                set_dataset(read_snapshot(), _snapshot_mtime())
+    return _dataset
+
+
+def _served():
+    dataset = current_dataset()
+    return dataset["df"], dataset["version"]
+
+
+def reload_if_changed():
+    """
+    Loads the snapshot file if it was written after the served dataset was loaded.
+
+    Returns:
+        bool: True if a new dataset was loaded
+    """
+
+    with _reload_lock:
+        snapshot_mtime = _snapshot_mtime()
+        if snapshot_mtime is None:
+            return False
+        if _dataset is not None and _dataset["snapshot_mtime"] is not None:
+            if snapshot_mtime <= _dataset["snapshot_mtime"]:
+                return False
+        set_dataset(read_snapshot(), snapshot_mtime)
+        return True
+
+
+def watch_snapshot(interval=RELOAD_INTERVAL):
+    """
+    Starts a daemon thread that checks the snapshot file every interval seconds and reloads it when
+    it changed. A failed reload is logged and the current dataset keeps being served.
+
+    Returns:
+        threading.Event: set it to stop the thread
+    """
+
+    global _watch_interval
+
+    _watch_interval = interval
+    stop_event = threading.Event()
+
+    def watch():
+        while not stop_event.wait(interval):
+            try:
+                reload_if_changed()
+            except Exception as e:
+                logging.error(f"Reloading the dashboard data failed : {e}")
+
+    threading.Thread(target=watch, name="snapshot-watcher", daemon=True).start()
+    return stop_event
+
+
+def _after_fork_in_child():
+    """
+    Threads don't survive a fork: a worker process forked from a process that was watching the
+    snapshot starts its own watcher, with a new lock in case the fork happened while it was held.
+    """
+
+    global _reload_lock
+
+    _reload_lock = threading.RLock()
+    if _watch_interval is not None:
+        watch_snapshot(_watch_interval)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def create_app(df_final_data=None):
+    """
+    Creates the dashboard Dash app, with its dataset loaded and its figures built.
+
+    Args:
+        df_final_data (pandas.DataFrame): the final data, read from the snapshot file if not given
+
+    Returns:
+        dash.Dash: the app, app.server being its WSGI app
+    """
+    import dash
+    from dash import dash_table, dcc, html, Dash
+    from dash.dependencies import Input, Output, State
+
+    global _watch_interval
+    
+    logging.info("Dash Plotly dashboard started.")
+
+    # The figures of the dataset are built once, the tab callbacks only look them up
+    if df_final_data is None:
+        reload_if_changed()
+    else:
+        set_dataset(df_final_data, _snapshot_mtime())
+    if _watch_interval is None:
+        if SERVER_MODE == "gunicorn":
+            # No thread in the process the workers are forked from: each worker starts its own watcher
+            # after the fork (see _after_fork_in_child)
+            _watch_interval = RELOAD_INTERVAL
+        else:
+            watch_snapshot()
+    
+    # Lato and the Slate theme are served by the app, with long lived cache headers (see static_assets)
+    external_stylesheets = [asset_url(filename) for filename in STYLESHEETS]
+    # app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
+    app = Dash(external_stylesheets=external_stylesheets)
+    app.css.config.serve_locally = True
+    register_static_assets(app.server)
+    enable_compression(app.server)
+    register_metrics_endpoint(app.server)
+    app.server.add_url_rule(f"{FIGURES_URL}/<version>/<tab>.json", "figure", serve_figure)
+
+    # A function, so that each page load shows the dataset currently served
+    def serve_layout():
+        return html.Div(
+            style={"backgroundColor": "#1F2630"},
+            children=[
+                html.Br(),
+                html.H1(
+                    "Data pipeline demo 1 : micro ETL and web dashboard on GCP",
+                    style={
+                        "textAlign": "center",
+                        "padding-top": "50px",
+                        "padding-left": "20px",
+                        "padding-bottom": "50px",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#c2d6ea",
+                        "font-weight": "bold",
+                        "font-size": 30,
+                    },
+                ),
+                html.H2(
+                    "(please wait a few seconds for the charts to load)",
+                    style={
+                        "textAlign": "center",
+                        "padding-top": "20px",
+                        "padding-left": "20px",
+                        "padding-bottom": "25px",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#c2d6ea",
+                        "font-weight": "bold",
+                        "font-size": 20,
+                    },
+                ),
+                html.Div(
+                    [
+                        html.Span("Github repository : "),
+                        html.A(
+                            "https://github.com/AlexandreGarito/data-pipeline-demo-1",
+                            href="https://github.com/AlexandreGarito/data-pipeline-demo-1",
+                            target="_blank",
+                            style={
+                                "color": "#c2d6ea",
+                                "text-decoration": "underline",
+                            },
+                        ),
+                    ],
+                    style={
+                        "textAlign": "center",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#c2d6ea",
+                        "font-weight": "bold",
+                        "font-size": 22, 
+                        "padding": "20px 0px 0px 0px",
+                    },
+                ),
+                html.Br(),
+                html.H3(
+                    """The purpose of this project is to showcase my ability to employ Python in extracting, transforming, 
+                    loading, and displaying a simple set of API data within an interactive dashboard that updates daily. 
+                    This serves as a small "A to Z project" in 
+                    my data engineering journey, where I can gain experience with some tools and challenges involved in the field. 
+                    This project also involves some DevOps processes and tools such as CI/CD, Docker, and Airflow.
+                    Although dashboarding is not a core skill in data engineering, here it serves as an accessory tool that 
+                    demonstrates the functionality of this pipeline.""",
+                    style={
+                        "textAlign": "left",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#c2d6ea",
+                        "font-weight": "normal",
+                        "font-size": 15,
+                        "padding": "15px 100px 0px 100px",
+                    },
+                ),
+                html.H3(
+                    """The pipeline is coded in Python. The app is run in a Docker container on Google Cloud Platform (GCP). 
+                    Data is extracted with API requests, transformed using pandas, loaded into a GCP Cloud SQL PostgreSQL 
+                    database, and showcased in this dashboard using the Dash-Plotly web framework (based on Flask). 
+                    With GCP Cloud Build, the code is automatically pulled from the GitHub repo with each new commit, 
+                    built as a Docker image, and a container is deployed on GCP Cloud Run. At the start of the container, 
+                    unit tests are run with pytest, then the data 
+                    extraction scripts are called, then the Dash-Plotly app and web server is called.
+                    Every day at 2 AM UTC, a GCP Cloud Composer (managed Airflow) DAG triggers a container reboot to 
+                    refresh the data.""",
+                    style={
+                        "textAlign": "left",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#c2d6ea",
+                        "font-weight": "normal",
+                        "font-size": 15,
+                        "padding": "15px 100px 0px 100px",
+                    },
+                ),
+                html.H3(
+                    """Free and easily accessible API data was prioritized to facilitate long-term stability of the pipeline,
+                    data is therefore rather limited in order to stay under the free API rate limits and focuses on the biggest 
+                    publicly traded companies of the Technology field.""",
+                    style={
+                        "textAlign": "left",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#c2d6ea",
+                        "font-weight": "normal",
+                        "font-size": 15,
+                        "padding": "15px 100px 0px 100px",
+                    },
+                ),
+                html.H3(
+                    """My original idea was to use the data of those companies by crossing their market capitalization, their 
+                    number of employees, and their daily current job offerings to give a ranking of these companies when it 
+                    comes to market cap per employee and market cap per job offer. This would've been a simple approach to find 
+                    the "best-capitalized job offers" by company. Unfortunately, I realized that daily job offering data is 
+                    quite tricky to obtain, often paid and often incomplete. So, I decided to replace it with Twitter social 
+                    media sentiment, a data source simple to obtain and also updated daily. As a result, the dashboard would 
+                    display the "best-capitalized workforce" for each company, along with their social media sentiment. Since 
+                    the Twitter API ceased to be freely accessible in February 2023, the API I used ceased to provide it, and I 
+                    had to switch to Reddit social sentiment, 
+                    which is unfortunately more scarce than Twitter sentiment, but it's still the best option I have for now 
+                    without having to redesign the entire social sentiment part of the pipeline.""",
+                    style={
+                        "textAlign": "left",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#c2d6ea",
+                        "font-weight": "normal",
+                        "font-size": 15,
+                        "padding": "15px 100px 0px 100px",
+                    },
+                ),
+                html.H3(
+                    """As of March 2023, this dashboard primarily serves as a small working technical demo; however, I am committed to 
+                    update and enhance the dashboard with more valuable data as I advance in my data engineering journey. Also, 
+                    I discovered after a few days that Cloud Composer (managed Airflow) is actually somewhat expensive to run for 
+                    an individual, so I'm rebooting my container with a cheaper GCP Cloud Scheduler + Cloud Function setup from now on. Update: 
+                    As of 19/06/2023, the Reddit API is no longer free to use. As a consequence, the Reddit Sentiment updates were stopped just 
+                    before the change.""",
+                    style={
+                        "textAlign": "left",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#c2d6ea",
+                        "font-weight": "normal",
+                        "font-size": 15,
+                        "padding": "15px 100px 30px 100px",
+                    },
+                ),
+                html.H3(
+                    f"Last data update : {current_dataset()['updated']}",
+                    style={
+                        "textAlign": "right",
+                        "padding-top": "0px",
+                        "padding-right": "20px",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#c2d6ea",
+                        "font-weight": "bold",
+                        "font-size": 10,
+                    },
+                ),
+                html.H3(
+                    "Made by Alexandre Garito",
+                    style={
+                        "padding-top": "0px",
+                        "padding-left": "20px",
+                        "backgroundColor": "#1F2630",
+                        "font-family": "Lato",
+                        "color": "#43505b",
+                        "font-weight": "bold",
+                        "font-size": 10,
+                    },
+                ),
+                html.Div(
+                    [
+                        dcc.Tabs(
+                            style={"fontWeight": "bold", "color": "#c9c9c9"},
+                            id="tabs-marketcap",
+                            value="tab-treemap",
+                            children=[
+                                dcc.Tab(label="Treemap", value="tab-treemap"),
+                                dcc.Tab(label="Bar Chart", value="tab-barchart"),
+                                dcc.Tab(label="Table", value="tab-table"),
+                            ],
+                            colors={
+                                "border": "#252E3F",
+                                "primary": "#3a485b",
+                                "background": "#3a485b",
+                            },
+                        )
+                    ],
+                    style={
+                        "width": "50%",
+                        "display": "inline-block",
+                        "backgroundColor": "#1F2630",
+                        "padding-top": "0px",
+                        "padding-left": "20px",
+                        "padding-right": "20px",
+                        "padding-bottom": "0px",
+                    },
+                ),
+                html.Div(
+                    [
+                        dcc.Tabs(
+                            style={"fontWeight": "bold", "color": "#c9c9c9"},
+                            id="tabs-scatter",
+                            value="tab-3d-scatter",
+                            children=[
+                                dcc.Tab(label="3D Scatter", value="tab-3d-scatter"),
+                                dcc.Tab(label="2D Scatter", value="tab-2d-scatter"),
+                            ],
+                            colors={
+                                "border": "#252E3F",
+                                "primary": "#3a485b",
+                                "background": "#3a485b",
+                            },
+                        )
+                    ],
+                    style={
+                        "width": "50%",
+                        "display": "inline-block",
+                        "backgroundColor": "#1F2630",
+                        "padding-top": "0px",
+                        "padding-left": "20px",
+                        "padding-right": "20px",
+                        "padding-bottom": "0px",
+                    },
+                ),
+                html.Div(
+                    id="tabs-content-marketcap",
+                    style={
+                        "width": "50%",
+                        "display": "inline-block",
+                        "backgroundColor": "#1F2630",
+                        "padding-top": "0px",
+                        "padding-left": "20px",
+                        "padding-right": "20px",
+                        "padding-bottom": "20px",
+                    },
+                ),
+                html.Div(
+                    id="tabs-content-scatter",
+                    style={
+                        "width": "50%",
+                        "display": "inline-block",
+                        "backgroundColor": "#1F2630",
+                        "padding-top": "0px",
+                        "padding-left": "20px",
+                        "padding-right": "20px",
+                        "padding-bottom": "20px",
+                    },
+                ),
+            ],
+        )
 
-        scatter_data.add_traces(not_highlighted_data["data"])
+    app.layout = serve_layout
 
-        return scatter_data
+
+    def graph(graph_id, tab, version):
+        """A graph and the URL of its cached figure, which the browser fetches (see FETCH_FIGURE_JS)."""
+        return html.Div(
+            [dcc.Store(id=f"{graph_id}-url", data=figure_url(tab, version)), dcc.Graph(id=graph_id)]
+        )
+
+    for graph_id in ("graph-market-cap", "graph-3d-scatter", "graph-2d-scatter"):
+        app.clientside_callback(
+            FETCH_FIGURE_JS, Output(graph_id, "figure"), Input(f"{graph_id}-url", "data")
+        )
 
     @app.callback(
-        Output("graph-2d-scatter", "figure"),
+        Output("tabs-content-marketcap", "children"), Input("tabs-marketcap", "value")
+    )
+    @timed_callback
+    def render_content_marketcap(tab):
+        version = current_dataset()["version"]
+        if tab in ("tab-treemap", "tab-barchart"):
+            return graph("graph-market-cap", tab, version)
+        elif tab == "tab-table":
+            # Only the visible page is sent, by update_company_table
+            return html.Div(
+                [
+                    dash_table.DataTable(
+                        id="company-table",
+                        columns=company_table.table_columns(),
+                        page_current=0,
+                        page_size=company_table.PAGE_SIZE,
+                        page_action="custom",
+                        sort_action="custom",
+                        sort_mode="multi",
+                        sort_by=[{"column_id": "marketCap", "direction": "desc"}],
+                        filter_action="custom",
+                        filter_query="",
+                        style_header={
+                            "backgroundColor": "#3a485b",
+                            "color": "#ffffff",
+                            "fontWeight": "bold",
+                        },
+                        style_filter={"backgroundColor": "#1F2630", "color": "#ffffff"},
+                        style_cell={
+                            "backgroundColor": "#252E3F",
+                            "color": "#c2d6ea",
+                            "font-family": "Lato",
+                            "font-size": 12,
+                            "textAlign": "left",
+                            "border": "1px solid #1F2630",
+                        },
+                        style_table={"overflowX": "auto", "padding-top": "20px"},
+                    )
+                ]
+            )
+
+    @app.callback(
+        Output("company-table", "data"),
+        Output("company-table", "page_count"),
+        Input("company-table", "page_current"),
+        Input("company-table", "page_size"),
+        Input("company-table", "sort_by"),
+        Input("company-table", "filter_query"),
+    )
+    @timed_callback
+    def update_company_table(page_current, page_size, sort_by, filter_query):
+        table = current_dataset()["table"]
+        return company_table.query_page(table, page_current, page_size, sort_by, filter_query)
+
+
+    @app.callback(
+        Output("tabs-content-scatter", "children"), Input("tabs-scatter", "value")
+    )
+    @timed_callback
+    def render_content_scatter(tab):
+        version = current_dataset()["version"]
+        if tab == "tab-3d-scatter":
+            return graph("graph-3d-scatter", tab, version)
+        elif tab == "tab-2d-scatter":
+            return graph("graph-2d-scatter", tab, version)
+
+    # The figure of a scatter is set by its clientside callback, the hovers only patch it
+    @app.callback(
+        Output("graph-3d-scatter", "figure", allow_duplicate=True),
+        Input("graph-market-cap", "hoverData"),
+        State("tabs-scatter", "value"),
+        prevent_initial_call=True,
+    )
+    @timed_callback
+    def update_3d_highlighted_point(hoverData, tab):
+        if tab != "tab-3d-scatter":
+            raise dash.exceptions.PreventUpdate
+        df, version = _served()
+        return highlight_patch(tab, df, version, _hovered_company(hoverData))
+
+    @app.callback(
+        Output("graph-2d-scatter", "figure", allow_duplicate=True),
         Input("graph-market-cap", "hoverData"),
-        Input("tabs-scatter", "value"),
+        State("tabs-scatter", "value"),
+        prevent_initial_call=True,
     )
+    @timed_callback
     def update_2d_highlighted_point(hoverData, tab):
         if tab != "tab-2d-scatter":
             raise dash.exceptions.PreventUpdate
+        df, version = _served()
+        return highlight_patch(tab, df, version, _hovered_company(hoverData))
 
-        try:
-            company_name = hoverData["points"][0]["label"]
-            highlighted_df = df[df["companyName"] == company_name]
-        except (KeyError, TypeError):
-            company_name = "dummy"
-            highlighted_df = df
-
-        scatter_data = (
-            px.scatter(
-                highlighted_df,
-                x="fullTimeEmployees",
-                y="marketCap",
-                title="Market Capitalization & Full Time Employees & Reddit Sentiment (last 15 days)",
-                color="normalized_sentiment",
-                hover_name="companyName",
-                log_x=True,
-                log_y=True,
-                size="normalized_sentiment",
-                height=800,
-                size_max=30,
-                color_continuous_scale="rdbu",
-                labels=dict(
-                    companyName="Company Name",
-                    fullTimeEmployees="Full Time Employees",
-                    normalized_sentiment="Last 15 days Reddit Sentiment",
-                    marketCap="Market Capitalization ($)",
-                ),
-            )
-            .update_layout(
-                yaxis2=dict(title="Another Y-axis", overlaying="y", position=0.85),
-                font_size=10,
-                font_color="#ffffff",
-                paper_bgcolor="#252E3F",
-                font_family="Lato",
-            )
-            .update_yaxes(tickprefix="$")
-        )
+    return app
 
-        scatter_data["data"][0]["marker"]["color"] = "green"
-
-        not_highlighted_df = df[df["companyName"] != company_name]
-
-        not_highlighted_data = (
-            px.scatter(
-                not_highlighted_df,
-                x="fullTimeEmployees",
-                y="marketCap",
-                title="Market Capitalization & Full Time Employees & Reddit Sentiment (last 15 days)",
-                color="normalized_sentiment",
-                hover_name="companyName",
-                log_x=True,
-                log_y=True,
-                size="normalized_sentiment",
-                height=800,
-                size_max=30,
-                color_continuous_scale="rdbu",
-                labels=dict(
-                    companyName="Company Name",
-                    fullTimeEmployees="Full Time Employees",
-                    normalized_sentiment="Last 15 days Reddit Sentiment",
-                    marketCap="Market Capitalization ($)",
-                ),
-            )
-            .update_layout(
-                yaxis2=dict(title="Another Y-axis", overlaying="y", position=0.85),
-                font_size=10,
-                font_color="#ffffff",
-                paper_bgcolor="#252E3F",
-                font_family="Lato",
-            )
-            .update_yaxes(tickprefix="$")
-        )
 
-        scatter_data.add_traces(not_highlighted_data["data"])
+def dashboard(df_final_data=None):
+    """
+    Creates the dashboard and runs its web server: gunicorn if SERVER_MODE is gunicorn, else the
+    Flask development server.
 
-        return scatter_data
+    Args:
+        df_final_data (pandas.DataFrame): the final data, read from the snapshot file if not given
+    """
 
+    app = create_app(df_final_data)
 
     port = int(os.environ.get("PORT", 8050))
-    app.run_server(host="0.0.0.0", port=port)
-    # app.run_server(host='0.0.0.0', port=8050)
+    if SERVER_MODE == "gunicorn":
+        run_gunicorn(app, port)
+    else:
+        app.run(host="0.0.0.0", port=port)
@@ -6,24 +6,119 @@ Functions:
     - screener_transf: API call to get the companies tickers and general data about each company.
     - fte_call: API call to get the full time employees (fte) for each company.
     - add_fte: Adds the full time employees (fte) data.
-    - write_data_to_csv : Writes data into final_data.csv
+    - yest_sent_call: API call to get the social media sentiment of the lookback period for each company.
+    - add_yest_sent: Adds the sentiment data.
+    - write_data_to_csv : Writes data into the final data snapshot (final_data.csv by default).
+
+The per-ticker calls of fte_call and yest_sent_call are run concurrently with asyncio (see _fan_out),
+capped at MAX_CONCURRENCY requests in flight at the same time. fte_call also packs up to
+PROFILE_BATCH_SIZE tickers into each profile request. All requests go through the http_client module
+(pooled sessions, timeouts, retries and per-provider rate limiting), and their responses are cached on
+disk by the api_cache module with a time to live per endpoint. The daily sentiment is kept in the
+sentiment_store module so that yest_sent_call only fetches the days it doesn't have yet. Within a
+pipeline run, both also checkpoint each ticker (or batch) as soon as it is fetched (see the checkpoints
+module), so that a run stopped by the API limit resumes from the tickers already fetched.
+
+Between the stages, the data is held in pandas DataFrames indexed by the company symbol, and the
+add_* functions are key joins on that index, so that a company missing from an API answer can't
+shift the data of the other companies. pandas is only imported by the functions that need it, and
+the API keys are read from the lazy config on first use, so importing this module is cheap.
 """
 
 
+import asyncio
+import heapq
 import json
 import logging
-import os
 from datetime import date, timedelta
-import pandas as pd
-import requests
-from modules.gcp_interactions import get_secret
+from functools import partial
+from modules import http_client, sentiment_store, snapshot
+from modules.config import get_config
 
 
-PROJECT_ID = os.environ["PROJECT_ID"]
-FMI_API_KEY = get_secret(PROJECT_ID, "FMI_API_KEY")
-FINNH_API_KEY = get_secret(PROJECT_ID, "FINNH_API_KEY")
 URL_SCREENER = "https://financialmodelingprep.com/api/v3/stock-screener"
 URL_FINNHUB = "https://finnhub.io/api/v1/stock/social-sentiment"
+MAX_CONCURRENCY = 8
+PROFILE_BATCH_SIZE = 25
+LOOKBACK_DAYS = 15
+# Time to live in the on-disk api_cache, in seconds (sentiment isn't cached, see _sentiment_call)
+SCREENER_CACHE_TTL = 60 * 60
+PROFILE_CACHE_TTL = 30 * 24 * 60 * 60
+SCREENER_COLUMNS = ["companyName", "marketCap", "beta"]
+SENTIMENT_COLUMNS = [
+    "yest_twitter_positive_mentions",
+    "yest_twitter_negative_mentions",
+    "yest_twitter_mean_sentiment_score",
+]
+
+
+def _to_symbol_frame(data):
+    """Returns data (a DataFrame or a list of dicts with a symbol key) as a DataFrame indexed by symbol."""
+    import pandas as pd
+
+    if isinstance(data, pd.DataFrame):
+        return data if data.index.name == "symbol" else data.set_index("symbol")
+    return pd.DataFrame.from_records(data).set_index("symbol")
+
+
+def _item_key(ticker):
+    """Checkpoint key of a ticker, or of a batch of tickers."""
+
+    return ticker if isinstance(ticker, str) else ",".join(ticker)
+
+
+def _fan_out(call, tickers_list, max_concurrency=MAX_CONCURRENCY, checkpoint=None):
+    """
+    Runs a blocking per-ticker call for every ticker concurrently.
+
+    Each call is run in a worker thread by an asyncio event loop, with at most
+    max_concurrency calls in flight at the same time. Results are returned in the
+    same order as tickers_list, whatever the order in which the calls complete.
+
+    With a checkpoint, the tickers it already holds are not called again, and each
+    result is checkpointed as soon as its call returns, so that a run stopped by a
+    failing call resumes from the tickers already fetched.
+
+    Args:
+        call (callable): function taking a ticker (or a batch of tickers) and returning its result
+        tickers_list (list): the companies tickers, or batches of tickers
+        max_concurrency (int): maximum number of simultaneous calls
+        checkpoint (checkpoints.Items): the per-ticker checkpoints of the stage, or None
+
+    Returns:
+        list: the result of call for each ticker, in tickers_list order
+    """
+
+    done = checkpoint.done if checkpoint is not None else {}
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(ticker):
+            key = _item_key(ticker)
+            if key in done:
+                return done[key]
+            async with semaphore:
+                result = await asyncio.to_thread(call, ticker)
+            if checkpoint is not None:
+                await asyncio.to_thread(checkpoint.save, key, result)
+            return result
+
+        return await asyncio.gather(*(run_one(ticker) for ticker in tickers_list))
+
+    return asyncio.run(run_all())
+
+
+def _check_fmp_data(data):
+    """Raises if the data of an FMP API answer is not a list, like the error answer of the API limit."""
+
+    if not isinstance(data, list):
+        if "Limit Reach" in data.get("Error Message", ""):
+            logging.critical(
+                "API Limit is reached for financialmodelingprep.com, stopping..."
+            )
+            raise Exception("API Limit is reached for financialmodelingprep.com")
+        raise Exception("FMI API response data is not in the correct format.")
 
 
 def screener_call(row_limit):
@@ -38,7 +133,7 @@ def screener_call(row_limit):
         "country": "US",
         "exchange": "nasdaq",
         "limit": row_limit,
-        "apikey": FMI_API_KEY,
+        "apikey": get_config().fmi_api_key,
     }
 
     PARAMS_COM = {
@@ -48,175 +143,258 @@ def screener_call(row_limit):
         "country": "US",
         "exchange": "nasdaq",
         "limit": row_limit,
-        "apikey": FMI_API_KEY,
+        "apikey": get_config().fmi_api_key,
     }
 
-    screener_resp_tech = requests.get(URL_SCREENER, params=PARAMS_TECH)
-    screener_resp_com = requests.get(URL_SCREENER, params=PARAMS_COM)
+    screener_resp_tech = http_client.get(
+        URL_SCREENER, params=PARAMS_TECH, cache_ttl=SCREENER_CACHE_TTL
+    )
+    screener_resp_com = http_client.get(
+        URL_SCREENER, params=PARAMS_COM, cache_ttl=SCREENER_CACHE_TTL
+    )
+
+    # Checked here, so that an error answer is never checkpointed as the output of the stage
+    for screener_resp in (screener_resp_tech, screener_resp_com):
+        _check_fmp_data(json.loads(screener_resp.text))
 
     return screener_resp_tech, screener_resp_com
 
 
 def screener_transf(row_limit, screener_resp_tech, screener_resp_com):
     """API call to get the companies tickers and general data about each company."""
+    import pandas as pd
 
     tech_data = json.loads(screener_resp_tech.text)
     com_data = json.loads(screener_resp_com.text)
 
-    # Checking if tech_data response is in the expected format:
-    if not isinstance(tech_data, list):
-        if "Limit Reach" in tech_data["Error Message"]:
-            raise Exception("API Limit is reached for financialmodelingprep.com")
-        raise Exception("FMI API response data is not in the correct format.")
+    # Checking if the responses are in the expected format:
+    _check_fmp_data(tech_data)
+    _check_fmp_data(com_data)
 
     tech_data.extend(com_data)
     all_data = tech_data
-    sorted_data = sorted(all_data, key=lambda x: x["marketCap"], reverse=True)
 
-    # Eliminate duplicates based on company name, mainly because of Google A and C shares (GOOG and GOOGL)
-    unique_sorted_dicts = []
-    for d in sorted_data:
-        if not any(d["companyName"] == x["companyName"] for x in unique_sorted_dicts):
-            unique_sorted_dicts.append(d)
+    # Eliminate duplicates based on company name, mainly because of Google A and C shares (GOOG and GOOGL).
+    # Keeps the biggest market cap of each company, the first one listed in case of a tie.
+    unique_by_name = {}
+    for i, d in enumerate(all_data):
+        kept = unique_by_name.get(d["companyName"])
+        if kept is None or d["marketCap"] > kept[1]["marketCap"]:
+            unique_by_name[d["companyName"]] = (i, d)
 
-    sorted_data_lim = unique_sorted_dicts[:row_limit]
+    # Top row_limit companies by market cap, ties keep the listing order (same as a stable sort)
+    top_companies = heapq.nlargest(
+        row_limit, unique_by_name.values(), key=lambda x: (x[1]["marketCap"], -x[0])
+    )
+    sorted_data_lim = [d for _, d in top_companies]
 
     # For later use in following API calls
     tickers_list = [d["symbol"] for d in sorted_data_lim]
 
-    filtered_screener = [
+    filtered_screener = pd.DataFrame.from_records(
+        sorted_data_lim, columns=["symbol"] + SCREENER_COLUMNS
+    ).set_index("symbol")
+
+    return tickers_list, filtered_screener
+
+
+def _batches(tickers_list, batch_size):
+    """Splits tickers_list into consecutive batches of at most batch_size tickers."""
+
+    return [
+        tickers_list[i : i + batch_size] for i in range(0, len(tickers_list), batch_size)
+    ]
+
+
+def _profile_call(tickers_batch):
+    """API call to get the full time employees (fte) of a batch of companies in a single request."""
+
+    # The profile endpoint accepts several comma separated symbols
+    URL_PROFILE = f"https://financialmodelingprep.com/api/v3/profile/{','.join(tickers_batch)}"
+    PARAMS = {"apikey": get_config().fmi_api_key}
+    profile_response = http_client.get(
+        URL_PROFILE, params=PARAMS, cache_ttl=PROFILE_CACHE_TTL
+    )
+    profile_response_dict = json.loads(profile_response.text)
+
+    # Checking if profile_response_dict is in the expected format:
+    _check_fmp_data(profile_response_dict)
+
+    employees_n = [
         {
             k: v
             for k, v in d.items()
-            if k in ["symbol", "companyName", "marketCap", "beta"]
+            if k in ["symbol", "companyName", "fullTimeEmployees"]
         }
-        for d in sorted_data_lim
+        for d in profile_response_dict
     ]
 
-    return tickers_list, filtered_screener
+    return employees_n
+
 
+def fte_call(
+    tickers_list,
+    batch_size=PROFILE_BATCH_SIZE,
+    max_concurrency=MAX_CONCURRENCY,
+    checkpoint=None,
+):
+    """
+    API call to get the full time employees (fte) for each company.
 
-def fte_call(tickers_list):
-    """API call to get the full time employees (fte) for each company."""
+    Tickers are sent batch_size at a time to the profile endpoint (batch_size=1 makes
+    one request per ticker), and the batched responses are split back per symbol.
+
+    Args:
+        tickers_list (list): the companies tickers
+        batch_size (int): maximum number of tickers per profile request
+        max_concurrency (int): maximum number of simultaneous profile requests
+        checkpoint (checkpoints.Items): the batches already fetched by a previous attempt of the run, or None
+
+    Returns:
+        pandas.DataFrame: companyName and fullTimeEmployees indexed by symbol, in tickers_list order
+    """
+    import pandas as pd
 
     logging.info("Adding full time employees started.")
 
-    employees_n_list = []
-
-    for ticker in tickers_list:
-        URL_PROFILE = f"https://financialmodelingprep.com/api/v3/profile/{ticker}"
-        PARAMS = {"apikey": FMI_API_KEY}
-        profile_response = requests.get(URL_PROFILE, params=PARAMS)
-        profile_response_dict = json.loads(profile_response.text)
-
-        # Checking if profile_response_dict is in the expected format:
-        if not isinstance(profile_response_dict, list):
-            if "Limit Reach" in profile_response_dict["Error Message"]:
-                logging.critical(
-                    "API Limit is reached for financialmodelingprep.com, stopping..."
-                )
-                raise Exception("API Limit is reached for financialmodelingprep.com")
-            raise Exception("FMI API response data is not in the correct format.")
-
-        employees_n = [
-            {
-                k: v
-                for k, v in d.items()
-                if k in ["symbol", "companyName", "fullTimeEmployees"]
-            }
-            for d in profile_response_dict
-        ]
-
-        # Add the number of employees for this company to the list
-        employees_n_list.extend(employees_n)
+    tickers_batches = _batches(tickers_list, batch_size)
+    logging.info(
+        f"{len(tickers_list)} tickers requested in {len(tickers_batches)} profile requests."
+    )
+
+    employees_n_by_symbol = {}
+    for employees_n in _fan_out(
+        _profile_call, tickers_batches, max_concurrency, checkpoint
+    ):
+        for d in employees_n:
+            employees_n_by_symbol[d["symbol"]] = d
+
+    missing_tickers = [t for t in tickers_list if t not in employees_n_by_symbol]
+    if missing_tickers:
+        logging.warning(f"No profile returned for {missing_tickers}")
+
+    # Number of employees of each company, in tickers_list order
+    employees_n_list = pd.DataFrame.from_records(
+        [employees_n_by_symbol[t] for t in tickers_list if t in employees_n_by_symbol],
+        columns=["symbol", "companyName", "fullTimeEmployees"],
+    ).set_index("symbol")
 
     # convert the number of employees from a string to an int
-    for company in employees_n_list:
-        company['fullTimeEmployees'] = int(company['fullTimeEmployees'])
-    
+    employees_n_list["fullTimeEmployees"] = pd.to_numeric(
+        employees_n_list["fullTimeEmployees"], errors="coerce"
+    ).astype("Int64")
+
     return employees_n_list
 
 
 def add_fte(employees_n_list, filtered_screener):
-    """Adds the full time employees (fte) data."""
+    """Adds the full time employees (fte) data, joined on the company symbol."""
 
-    added_fte = [
-        {**d1, "fullTimeEmployees": d2["fullTimeEmployees"]}
-        for d1, d2 in zip(filtered_screener, employees_n_list)
-    ]
+    employees_n_list = _to_symbol_frame(employees_n_list)
+    added_fte = _to_symbol_frame(filtered_screener).join(
+        employees_n_list[["fullTimeEmployees"]], how="left"
+    )
     logging.info(f"DEBUGGING : {added_fte}")
     return added_fte
 
 
-def yest_sent_call(tickers_list):
-    """API call to get social media sentiment of the lookback period about each company."""
-
-    logging.info("Adding lookback period's social media sentiment started.")
-
-    # yesterday = date.today() - timedelta(days=1)
-    lookback_period = date.today() - timedelta(days=15)
-    d_list_sentiment = []
+def _sentiment_call(ticker, lookback_period):
+    """
+    API call to get the social media sentiment of the lookback period about a single company.
 
-    # Get the sentiment for each ticker
-    for ticker in tickers_list:
+    Only the days missing from the sentiment_store are requested, the lookback period summary is
+    then computed from the stored days.
+    """
 
-        twitter_data = None
+    today = date.today()
+    missing_days = sentiment_store.missing_days(ticker, lookback_period, today)
 
+    if missing_days:
         params = {
             "symbol": ticker,
-            "token": FINNH_API_KEY,
-            "from": lookback_period,
-            "to": date.today(),
+            "token": get_config().finnh_api_key,
+            "from": missing_days[0],
+            "to": today,
         }
-        response_finnhub = requests.get(URL_FINNHUB, params=params)
+        # Not cached: the request always covers today, which is still going on. The sentiment_store
+        # already spares the days fetched before.
+        response_finnhub = http_client.get(URL_FINNHUB, params=params)
         json_data = response_finnhub.json()
 
         # Sometimes companies don't have twitter mentions
         # logging.info(f"json_data : {json_data}")
         # FIXME: Following Twitter API not being free anymore, Finnhub.com ceased to provide twitter data
         # FIXME: so, switching to reddit, even though the data is very scarce
-        if json_data["reddit"]:
-            twitter_data = json_data["reddit"]
-        if twitter_data:
-            sentiment_summary = {
-                "yest_twitter_positive_mentions": sum(
-                    x["positiveMention"] for x in twitter_data
-                ),
-                "yest_twitter_negative_mentions": sum(
-                    x["negativeMention"] for x in twitter_data
-                ),
-                "yest_twitter_mean_sentiment_score": sum(
-                    x["score"] for x in twitter_data
-                )
-                / len(twitter_data),
-            }
-        else:
-            sentiment_summary = {}
-
-        d_list_sentiment.append(sentiment_summary)
-        
+        twitter_data = json_data["reddit"] or []
+        sentiment_store.save_days(ticker, twitter_data, missing_days[0], today)
+
+    sentiment_summary = sentiment_store.aggregate(ticker, lookback_period, today)
+
+    return sentiment_summary
+
+
+def yest_sent_call(tickers_list, max_concurrency=MAX_CONCURRENCY, checkpoint=None):
+    """
+    API call to get social media sentiment of the lookback period about each company.
+
+    Args:
+        tickers_list (list): the companies tickers
+        max_concurrency (int): maximum number of simultaneous sentiment requests
+        checkpoint (checkpoints.Items): the tickers already fetched by a previous attempt of the run, or None
+
+    Returns:
+        pandas.DataFrame: the sentiment columns indexed by symbol, empty for the companies without mentions
+    """
+    import pandas as pd
+
+    logging.info("Adding lookback period's social media sentiment started.")
+
+    # yesterday = date.today() - timedelta(days=1)
+    lookback_period = date.today() - timedelta(days=LOOKBACK_DAYS)
+    sentiment_store.prune(lookback_period)
+
+    # Get the sentiment for each ticker
+    sentiment_summaries = _fan_out(
+        partial(_sentiment_call, lookback_period=lookback_period),
+        tickers_list,
+        max_concurrency,
+        checkpoint,
+    )
+    d_list_sentiment = pd.DataFrame.from_records(
+        sentiment_summaries,
+        index=pd.Index(tickers_list, name="symbol"),
+        columns=SENTIMENT_COLUMNS,
+    )
+
     logging.info(f"DEBUGGING d_list_sentiment : {d_list_sentiment}")
     return d_list_sentiment
 
 def add_yest_sent(added_fte, d_list_sentiment):
-    """Adds the sentiment data"""
-    for i, d in enumerate(added_fte):
-        try:
-            added_fte[i].update(d_list_sentiment[i])
-        except IndexError:
-            pass
-
-    final_data = added_fte
+    """Adds the sentiment data, joined on the company symbol."""
+
+    final_data = _to_symbol_frame(added_fte).join(
+        _to_symbol_frame(d_list_sentiment), how="left"
+    )
     logging.info(f" DEBUGGING final : {final_data}")
     return final_data
 
 
-def write_data_to_csv(final_data):
+def write_data_to_csv(final_data, file_format=None):
+    """
+    Writes data into the final data snapshot.
+
+    Args:
+        final_data (pandas.DataFrame): the final data, indexed by symbol
+        file_format (str): csv, parquet or arrow (see the snapshot module), SNAPSHOT_FORMAT if not given
+
+    Returns:
+        str: the path of the written file
+    """
 
-    logging.info("Writing final data to csv...")
+    logging.info("Writing final data snapshot...")
 
-    name_final_data_csv = os.path.join('data', "final_data.csv")
-    df_final_data = pd.DataFrame(final_data)
-    df_final_data.to_csv(name_final_data_csv)
+    df_final_data = _to_symbol_frame(final_data)
+    name_final_data_file = snapshot.write_snapshot(df_final_data, file_format)
 
-    logging.info("Final data written to {}.".format(name_final_data_csv))
+    logging.info("Final data written to {}.".format(name_final_data_file))
+    return name_final_data_file
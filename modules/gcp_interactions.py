@@ -1,15 +1,141 @@
-"""Module for all the interactions with GCP for the project"""
+"""Module for all the interactions with GCP for the project
 
+Secrets are read through a small provider: one shared Secret Manager client, all the secrets of the
+project fetched concurrently on first use, then kept in memory for SECRETS_TTL seconds.
+The SECRETS_BACKEND environment variable selects where the secrets come from:
+    - gcp (default) : GCP Secret Manager.
+    - env : environment variables named after the secrets.
+    - file : a JSON file of {secret name: value}, at the SECRETS_FILE path.
+The env and file backends need no network, for tests and offline runs.
 
-from google.cloud import secretmanager
+Functions:
+    - get_secret : Returns the value of a secret.
+    - get_secrets : Returns the values of several secrets, fetched concurrently.
+    - clear_secrets_cache : Forgets the cached secrets.
+"""
 
 
-def get_secret(project_id, secret_name):
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+SECRETS_BACKEND = os.environ.get("SECRETS_BACKEND", "gcp")
+SECRETS_FILE = os.environ.get("SECRETS_FILE", "secrets.json")
+SECRETS_TTL = 60 * 60
+# All the secrets used by the project, prefetched together on first use
+SECRET_NAMES = (
+    "FMI_API_KEY",
+    "FINNH_API_KEY",
+    "SQL_INSTANCE_CONNECTION_NAME1",
+    "SQL_DB_USER1",
+    "SQL_DB_PASS1",
+    "SQL_DB_NAME1",
+    "SQL_DB_TABLE_NAME1",
+)
+
+_client = None
+_lock = threading.Lock()
+_cache = {}  # (project_id, secret_name) -> (value, expires_at)
+
+
+def _get_client():
+    """Returns the Secret Manager client shared by all the calls, created on first use."""
+
+    global _client
+    with _lock:
+        if _client is None:
+            from google.cloud import secretmanager
+
+            _client = secretmanager.SecretManagerServiceClient()
+        return _client
+
+
+def _fetch_gcp(project_id, secret_name):
     """
     This function connects to the GCP Secret Manager and get the value of a secret.
     The connection is made through a GCP authentication Client allowing for automated
     credentials retrieving with, in this case, either GOOGLE_APPLICATION_CREDENTIALS
     environment variable if run locally or attached service account if run in GCP.
+    """
+
+    path_secret_name = f"projects/{project_id}/secrets/{secret_name}/versions/latest"
+    response = _get_client().access_secret_version(name=path_secret_name)
+    return response.payload.data.decode("UTF-8")
+
+
+def _fetch_env(project_id, secret_name):
+    return os.environ[secret_name]
+
+
+def _fetch_file(project_id, secret_name):
+    with open(SECRETS_FILE) as f:
+        return json.load(f)[secret_name]
+
+
+_BACKENDS = {"gcp": _fetch_gcp, "env": _fetch_env, "file": _fetch_file}
+
+
+def _cached(project_id, secret_name):
+    with _lock:
+        value, expires_at = _cache.get((project_id, secret_name), (None, 0))
+    return value if expires_at > time.monotonic() else None
+
+
+def _fetch_all(project_id, secret_names):
+    """Fetches secrets concurrently, returns ({name: value}, {name: exception})."""
+
+    fetch = _BACKENDS[SECRETS_BACKEND]
+    with ThreadPoolExecutor(max_workers=len(secret_names)) as executor:
+        futures = {
+            name: executor.submit(fetch, project_id, name) for name in secret_names
+        }
+
+    values, errors = {}, {}
+    for name, future in futures.items():
+        try:
+            values[name] = future.result()
+        except Exception as e:
+            errors[name] = e
+
+    expires_at = time.monotonic() + SECRETS_TTL
+    with _lock:
+        for name, value in values.items():
+            _cache[(project_id, name)] = (value, expires_at)
+    return values, errors
+
+
+def get_secrets(project_id, secret_names):
+    """
+    Returns the values of several secrets, the ones not cached yet being fetched concurrently.
+
+    Args:
+        project_id (str): the GCP project ID
+        secret_names (list): the secret names inside GCP Secret Manager
+
+    Returns:
+        dict: the value of each secret
+    """
+
+    secrets = {name: _cached(project_id, name) for name in secret_names}
+    missing = [name for name, value in secrets.items() if value is None]
+    if missing:
+        values, errors = _fetch_all(project_id, missing)
+        if errors:
+            raise next(iter(errors.values()))
+        secrets.update(values)
+    return secrets
+
+
+def get_secret(project_id, secret_name):
+    """
+    Returns the value of a secret.
+
+    On a cache miss, all the SECRET_NAMES not cached yet are fetched along with it, so that the
+    following calls are served from memory.
 
     Args:
         project_id (str): the GCP project ID
@@ -19,8 +145,24 @@ def get_secret(project_id, secret_name):
         str: The secret value
     """
 
-    client = secretmanager.SecretManagerServiceClient()
-    path_secret_name = f"projects/{project_id}/secrets/{secret_name}/versions/latest"
-    response = client.access_secret_version(name=path_secret_name)
-    secret_value = response.payload.data.decode("UTF-8")
-    return secret_value
+    secret_value = _cached(project_id, secret_name)
+    if secret_value is not None:
+        return secret_value
+
+    to_fetch = {secret_name} | {
+        name for name in SECRET_NAMES if _cached(project_id, name) is None
+    }
+    values, errors = _fetch_all(project_id, sorted(to_fetch))
+    for name, e in errors.items():
+        if name != secret_name:
+            logging.warning(f"Prefetching secret {name} failed : {e}")
+    if secret_name in errors:
+        raise errors[secret_name]
+    return values[secret_name]
+
+
+def clear_secrets_cache():
+    """Forgets the cached secrets, the next calls fetch them again."""
+
+    with _lock:
+        _cache.clear()
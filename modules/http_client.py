@@ -0,0 +1,182 @@
+"""
+This http_client module is the HTTP layer shared by all the API calls of the extract_data module.
+
+Every request goes through a keep-alive session pooled per host, with a timeout, jittered
+exponential retries on connection errors, timeouts and 429/5xx responses, and a token bucket
+rate limiter per API provider (FMP and Finnhub) to stay inside the free plans quotas.
+Requests given a cache_ttl are served from the on-disk api_cache when possible, skipping the network.
+The time, size and errors of each attempt, and the retries, are recorded by the metrics module.
+
+Functions:
+    - get : GET request through the shared session of the url host.
+    - get_session : Returns the pooled keep-alive session of a host.
+
+Classes:
+    - TokenBucket : Thread-safe token bucket rate limiter.
+"""
+
+
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from modules import api_cache, metrics
+
+
+TIMEOUT = (5, 30)  # (connect, read) in seconds
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5  # in seconds, doubled at each retry
+BACKOFF_MAX = 30
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+POOL_MAXSIZE = 16
+
+# (sustained requests per second, burst size) for each provider.
+# Finnhub free plan allows 60 calls/minute: 12 + 0.8 * 60 = 60.
+RATE_LIMITS = {
+    "fmp": (5, 10),
+    "finnhub": (0.8, 12),
+}
+PROVIDERS_BY_HOST = {
+    "financialmodelingprep.com": "fmp",
+    "finnhub.io": "finnhub",
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    The bucket holds at most `burst` tokens and is refilled with `rate` tokens per second.
+    Each request takes one token, waiting for the refill when the bucket is empty.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token from the bucket, blocking until one is available."""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last_refill) * self.rate
+                )
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_buckets = {provider: TokenBucket(*limits) for provider, limits in RATE_LIMITS.items()}
+
+
+def get_session(host):
+    """Returns the keep-alive session of a host, creating it on first use."""
+
+    with _sessions_lock:
+        if host not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return _sessions[host]
+
+
+def _backoff_delay(attempt, response=None):
+    """Delay before the next retry: the Retry-After header if any, else a jittered exponential backoff."""
+
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(BACKOFF_MAX, int(retry_after))
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+def _cached_response(url, body):
+    """Rebuilds a response from a cached body."""
+
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.encoding = "utf-8"
+    response._content = body
+    return response
+
+
+def _is_cacheable(response):
+    # FMP answers with a 200 status and an "Error Message" body when the API limit is reached
+    return response.status_code == 200 and b"Error Message" not in response.content
+
+
+def get(url, params=None, provider=None, timeout=TIMEOUT, cache_ttl=None):
+    """
+    GET request through the shared session of the url host, rate limited and retried.
+
+    Args:
+        url (str): the requested url
+        params (dict): the query string parameters
+        provider (str): key of RATE_LIMITS, guessed from the url host if not given
+        timeout (tuple): (connect, read) timeouts in seconds
+        cache_ttl (float): if given, the response is looked up in and stored to the
+            api_cache for cache_ttl seconds
+
+    Returns:
+        requests.Response: the response, which is the last one received if retries were exhausted
+    """
+
+    if cache_ttl:
+        body = api_cache.get(url, params)
+        if body is not None:
+            return _cached_response(url, body)
+
+    response = _get_with_retries(url, params, provider, timeout)
+
+    if cache_ttl and _is_cacheable(response):
+        api_cache.put(url, params, response.content, cache_ttl)
+
+    return response
+
+
+def _get_with_retries(url, params, provider, timeout):
+    host = urlsplit(url).hostname
+    provider = provider or PROVIDERS_BY_HOST.get(host)
+    bucket = _buckets.get(provider)
+    session = get_session(host)
+
+    for attempt in range(MAX_RETRIES + 1):
+        if bucket is not None:
+            bucket.acquire()
+
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.observe_api_request(provider, time.perf_counter() - start, error=e)
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _backoff_delay(attempt)
+            logging.warning(f"{provider} request failed ({e}), retrying in {delay:.1f}s...")
+        else:
+            metrics.observe_api_request(provider, time.perf_counter() - start, response)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                return response
+            delay = _backoff_delay(attempt, response)
+            logging.warning(
+                f"{provider} answered {response.status_code}, retrying in {delay:.1f}s..."
+            )
+
+        metrics.observe_api_retry(provider)
+        time.sleep(delay)
@@ -0,0 +1,173 @@
+"""
+This metrics module holds the Prometheus metrics of the pipeline and of the dashboard, and serves them on
+the /metrics route of the dashboard server, in the OpenMetrics text format:
+
+    - pipeline_stage_duration_seconds : wall-clock time of each pipeline stage (histogram)
+    - pipeline_stage_failures_total : failed pipeline stages
+    - pipeline_rows_total : rows of the DataFrames output by each stage
+    - api_request_duration_seconds : time of each API request attempt, per provider (histogram)
+    - api_retries_total : retried API requests, per provider
+    - api_errors_total : failed API request attempts, per provider and reason (status code or exception)
+    - api_response_bytes_total : bytes downloaded from each provider
+    - dash_callback_duration_seconds : time of each Dash callback (histogram)
+
+The pipeline runs in the main process while, with gunicorn, the dashboard is served by forked workers. When
+the PROMETHEUS_MULTIPROC_DIR environment variable is set before the start, every process writes its metrics
+to that directory and /metrics aggregates them, whatever the worker answering the scrape.
+
+Functions:
+    - observe_stage : Records a finished pipeline stage.
+    - observe_stage_failure : Records a failed pipeline stage.
+    - observe_api_request : Records an API request attempt.
+    - observe_api_retry : Records an API request retry.
+    - timed_callback : Decorator recording the time of a Dash callback.
+    - register_metrics_endpoint : Adds the /metrics route to a Flask server.
+    - child_exit : gunicorn hook cleaning up the metrics of a dead worker.
+"""
+
+
+import functools
+import os
+import sys
+import time
+from prometheus_client import REGISTRY, Counter, Histogram
+
+
+METRICS_URL = "/metrics"
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+CALLBACK_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+STAGE_DURATION = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Wall-clock time of the pipeline stages.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_FAILURES = Counter(
+    "pipeline_stage_failures", "Failed pipeline stages.", ["stage"]
+)
+ROWS = Counter(
+    "pipeline_rows", "Rows of the DataFrames output by the pipeline stages.", ["stage"]
+)
+API_DURATION = Histogram(
+    "api_request_duration_seconds", "Time of the API request attempts.", ["provider"]
+)
+API_RETRIES = Counter("api_retries", "Retried API requests.", ["provider"])
+API_ERRORS = Counter(
+    "api_errors", "Failed API request attempts.", ["provider", "reason"]
+)
+API_BYTES = Counter(
+    "api_response_bytes", "Bytes downloaded from the APIs.", ["provider"]
+)
+CALLBACK_DURATION = Histogram(
+    "dash_callback_duration_seconds",
+    "Time of the Dash callbacks.",
+    ["callback"],
+    buckets=CALLBACK_BUCKETS,
+)
+
+
+def observe_stage(stage, seconds, outputs):
+    """
+    Records a finished pipeline stage.
+
+    Args:
+        stage (str): the stage name
+        seconds (float): the wall-clock time of the stage
+        outputs (dict): the outputs of the stage, the rows of its DataFrames are counted
+    """
+
+    STAGE_DURATION.labels(stage).observe(seconds)
+    # pandas is only imported by the stages that need it, a stage can't output a DataFrame without it
+    pd = sys.modules.get("pandas")
+    rows = pd and sum(len(value) for value in outputs.values() if isinstance(value, pd.DataFrame))
+    if rows:
+        ROWS.labels(stage).inc(rows)
+
+
+def observe_stage_failure(stage):
+    """Records a failed pipeline stage."""
+
+    STAGE_FAILURES.labels(stage).inc()
+
+
+def observe_api_request(provider, seconds, response=None, error=None):
+    """
+    Records an API request attempt.
+
+    Args:
+        provider (str): key of http_client.RATE_LIMITS, None for another host
+        seconds (float): the time of the attempt
+        response (requests.Response): the response received, None if the attempt failed
+        error (Exception): the connection error or the timeout of a failed attempt
+    """
+
+    provider = provider or "other"
+    API_DURATION.labels(provider).observe(seconds)
+    if response is not None:
+        API_BYTES.labels(provider).inc(len(response.content))
+        if response.status_code >= 400:
+            API_ERRORS.labels(provider, str(response.status_code)).inc()
+    if error is not None:
+        API_ERRORS.labels(provider, type(error).__name__).inc()
+
+
+def observe_api_retry(provider):
+    """Records an API request retry."""
+
+    API_RETRIES.labels(provider or "other").inc()
+
+
+def timed_callback(func):
+    """Decorator recording the time of a Dash callback, labelled with the function name."""
+
+    histogram = CALLBACK_DURATION.labels(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def _registry():
+    """The registry to expose: the default one, or one aggregating the files of all the processes."""
+    from prometheus_client import CollectorRegistry, multiprocess
+
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    return registry
+
+
+def register_metrics_endpoint(server):
+    """
+    Adds the /metrics route, serving the metrics in the OpenMetrics text format, to a Flask server.
+
+    Args:
+        server (flask.Flask): the server of the Dash app
+    """
+    from flask import Response
+    from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST, generate_latest
+
+    def serve_metrics():
+        return Response(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
+
+    server.add_url_rule(METRICS_URL, "metrics", serve_metrics)
+
+
+def child_exit(server, worker):
+    """gunicorn hook cleaning up the metrics files of a dead worker, in multiprocess mode."""
+    from prometheus_client import multiprocess
+
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid, MULTIPROC_DIR)
@@ -0,0 +1,237 @@
+"""
+This pipeline module runs the pipeline as a small DAG of named stages: each stage declares the values it
+takes as inputs and the values it outputs, and is started on a thread pool as soon as all its inputs are
+available. Stages that don't depend on each other, like the employees and the sentiment API calls, thus
+run concurrently.
+
+The wall-clock time of each stage is logged when it ends, and all of them at the end of the run. It is also
+recorded, with the failures and the rows output by each stage, by the metrics module.
+
+A run started with a run ID checkpoints the outputs of its checkpoint stages (see the checkpoints module):
+a re-run with the same ID, after a failure, restores them instead of running these stages again, and its
+per-ticker stages resume from the tickers they already fetched.
+
+Classes:
+    - Stage : A named step of the pipeline.
+    - PipelineRun : A run of stages, in the background.
+
+Functions:
+    - run_stages : Starts a run of stages.
+"""
+
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from modules import checkpoints, metrics
+
+
+MAX_WORKERS = 4
+
+
+class Stage:
+    """
+    A named step of the pipeline: func is called with its inputs as keyword arguments, and its return
+    value gives its outputs (the value itself for a single output, a tuple for several).
+
+    The outputs of a checkpoint stage are checkpointed in the runs with a run ID. The func of a per_ticker
+    stage also takes a checkpoint keyword argument, the checkpoints.Items of the stage (None without a
+    run ID).
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), checkpoint=False, per_ticker=False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.checkpoint = checkpoint
+        self.per_ticker = per_ticker
+
+    def run(self, values, items=None):
+        """Runs the stage on the values of its inputs, returns (its outputs dict, seconds)."""
+
+        kwargs = {name: values[name] for name in self.inputs}
+        if self.per_ticker:
+            kwargs["checkpoint"] = items
+
+        start = time.perf_counter()
+        result = self.func(**kwargs)
+        elapsed = time.perf_counter() - start
+
+        if len(self.outputs) == 1:
+            result = (result,)
+        elif not self.outputs:
+            result = ()
+        return dict(zip(self.outputs, result)), elapsed
+
+
+class PipelineRun:
+    """
+    A run of stages in the background. Values can be waited for one by one with result(), so that the
+    caller uses the ones it needs while the other stages go on, or all at once with wait().
+    """
+
+    def __init__(self, stages, values=None, max_workers=MAX_WORKERS, run_id=None):
+        _check_stages(stages, values or {})
+        self.stages = list(stages)
+        self.values = dict(values or {})
+        self.run_id = run_id
+        self.timings = {}
+        self.restored = []
+        self.error = None
+        self.done = False
+        self._condition = threading.Condition()
+        self._max_workers = max_workers
+        self._thread = threading.Thread(target=self._run, name="pipeline", daemon=True)
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        pending = list(self.stages)
+        running = {}
+        executor = ThreadPoolExecutor(self._max_workers, thread_name_prefix="stage")
+        try:
+            if self.run_id is not None:
+                # Only this run can be resumed from now on
+                checkpoints.clear_other_runs(self.run_id)
+
+            while pending or running:
+                restored = False
+                for stage in [s for s in pending if all(name in self.values for name in s.inputs)]:
+                    pending.remove(stage)
+                    outputs = self._restore(stage)
+                    if outputs is not None:
+                        with self._condition:
+                            self.values.update(outputs)
+                            self.restored.append(stage.name)
+                            self._condition.notify_all()
+                        restored = True
+                        continue
+                    logging.info(f"Stage {stage.name} started.")
+                    running[executor.submit(stage.run, dict(self.values), self._items(stage))] = stage
+                if restored:
+                    # The restored outputs may be the inputs of other stages
+                    continue
+                if not running:
+                    raise Exception(f"Stages {[s.name for s in pending]} wait for each other")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        outputs, elapsed = future.result()
+                    except Exception:
+                        metrics.observe_stage_failure(stage.name)
+                        raise
+                    metrics.observe_stage(stage.name, elapsed, outputs)
+                    if stage.checkpoint and self.run_id is not None:
+                        checkpoints.save_outputs(self.run_id, stage.name, outputs)
+                    with self._condition:
+                        self.values.update(outputs)
+                        self.timings[stage.name] = elapsed
+                        self._condition.notify_all()
+                    logging.info(f"Stage {stage.name} done in {elapsed:.2f} s.")
+
+            if self.run_id is not None:
+                # Nothing left to resume
+                checkpoints.clear_run(self.run_id)
+
+        except Exception as e:
+            logging.error(f"Pipeline stopped, stage failed : {e}")
+            with self._condition:
+                self.error = e
+
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.total_time = time.perf_counter() - self._start_time
+            self.log_timings()
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    def _restore(self, stage):
+        """Returns the checkpointed outputs of a stage in this run, None if it has to run."""
+
+        if not stage.checkpoint or self.run_id is None:
+            return None
+        outputs = checkpoints.load_outputs(self.run_id, stage.name)
+        if outputs is not None:
+            logging.info(f"Stage {stage.name} restored from the checkpoints of run {self.run_id}.")
+        return outputs
+
+    def _items(self, stage):
+        """The per-ticker checkpoints of a stage in this run, None if it has none."""
+
+        if not stage.per_ticker or self.run_id is None:
+            return None
+        items = checkpoints.Items(self.run_id, stage.name)
+        if items.done:
+            logging.info(f"Stage {stage.name} resumes after {len(items.done)} checkpointed items.")
+        return items
+
+    def result(self, name, timeout=None):
+        """
+        Waits for a value.
+
+        Raises:
+            Exception: the error of the stage that stopped the run before the value was available
+        """
+
+        with self._condition:
+            self._condition.wait_for(lambda: name in self.values or self.error or self.done, timeout)
+            if name in self.values:
+                return self.values[name]
+            if self.error is not None:
+                raise self.error
+            raise Exception(f"{name} is not available")
+
+    def wait(self, timeout=None):
+        """Waits for the end of the run, returns all the values. Raises the error of a failed stage."""
+
+        with self._condition:
+            self._condition.wait_for(lambda: self.done, timeout)
+        if self.error is not None:
+            raise self.error
+        return self.values
+
+    def log_timings(self):
+        """Logs the wall-clock time of each finished stage, in the order they were declared."""
+
+        timings = ", ".join(
+            f"{s.name} {self.timings[s.name]:.2f} s" for s in self.stages if s.name in self.timings
+        )
+        logging.info(f"Stage timings : {timings} (total {self.total_time:.2f} s).")
+
+
+def _check_stages(stages, values):
+    produced = set(values)
+    for stage in stages:
+        duplicates = produced & set(stage.outputs)
+        if duplicates:
+            raise Exception(f"Stage {stage.name} outputs {sorted(duplicates)}, already produced")
+        produced.update(stage.outputs)
+    for stage in stages:
+        missing = set(stage.inputs) - produced
+        if missing:
+            raise Exception(f"Stage {stage.name} takes {sorted(missing)}, produced by no stage")
+
+
+def run_stages(stages, values=None, max_workers=MAX_WORKERS, run_id=None):
+    """
+    Starts a run of stages on a thread pool, each stage starting as soon as its inputs are available.
+
+    Args:
+        stages (list): the Stage objects
+        values (dict): the values available from the start
+        max_workers (int): the number of stages run at the same time
+        run_id (str): the ID the stages are checkpointed under, None to not checkpoint them
+
+    Returns:
+        PipelineRun: the started run
+    """
+
+    return PipelineRun(stages, values, max_workers, run_id).start()
@@ -0,0 +1,158 @@
+"""
+This sentiment_store module keeps the daily social media sentiment of each ticker in a local SQLite
+database, so that each run only has to fetch the days it doesn't have yet.
+
+Each row holds the sums of one (ticker, day): positive and negative mentions, sentiment score and
+number of API entries, which is enough to compute the lookback window aggregates exactly. Days before
+today are marked complete once fetched; today is always fetched again since it is still going on. The days
+that left the lookback period are pruned, so the database doesn't grow with the days.
+
+Functions:
+    - missing_days : Days of a period that still have to be fetched for a ticker.
+    - save_days : Stores the daily sums of the API entries fetched for a ticker.
+    - aggregate : Lookback period sentiment summary of a ticker, computed from the stored days.
+    - prune : Deletes the days before a date.
+"""
+
+
+import os
+from datetime import date, timedelta
+from modules.sqlite_db import LocalDatabase
+
+
+STORE_PATH = os.environ.get(
+    "SENTIMENT_STORE_PATH", os.path.join("data", "sentiment_store.sqlite")
+)
+
+_db = LocalDatabase(
+    [
+        """CREATE TABLE IF NOT EXISTS daily_sentiment (
+            symbol TEXT NOT NULL,
+            day TEXT NOT NULL,
+            positive_mentions INTEGER NOT NULL,
+            negative_mentions INTEGER NOT NULL,
+            score_sum REAL NOT NULL,
+            n_entries INTEGER NOT NULL,
+            complete INTEGER NOT NULL,
+            PRIMARY KEY (symbol, day)
+        )"""
+    ]
+)
+_lock = _db.lock
+
+
+def _connection():
+    """Returns the connection to the store database, opening it on first use."""
+
+    return _db.connection(STORE_PATH)
+
+
+def _days(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def missing_days(symbol, start, end):
+    """
+    Days of a period that still have to be fetched for a ticker.
+
+    Args:
+        symbol (str): the company ticker
+        start (datetime.date): first day of the period
+        end (datetime.date): last day of the period, included
+
+    Returns:
+        list: the days of the period that are not stored as complete
+    """
+
+    with _lock:
+        rows = _connection().execute(
+            "SELECT day FROM daily_sentiment WHERE symbol = ? AND day BETWEEN ? AND ? AND complete = 1",
+            (symbol, start.isoformat(), end.isoformat()),
+        ).fetchall()
+    complete_days = {row[0] for row in rows}
+    return [d for d in _days(start, end) if d.isoformat() not in complete_days]
+
+
+def save_days(symbol, entries, start, end):
+    """
+    Stores the daily sums of the API entries fetched for a ticker.
+
+    Every day of the fetched period gets a row, even without any entry, so that it is not fetched
+    again. Days before today are marked complete.
+
+    Args:
+        symbol (str): the company ticker
+        entries (list): the API sentiment entries, with atTime, positiveMention, negativeMention and score
+        start (datetime.date): first day of the fetched period
+        end (datetime.date): last day of the fetched period, included
+    """
+
+    sums = {d.isoformat(): [0, 0, 0.0, 0] for d in _days(start, end)}
+    for x in entries:
+        day_sums = sums.get(x["atTime"][:10])
+        if day_sums is None:
+            continue
+        day_sums[0] += x["positiveMention"]
+        day_sums[1] += x["negativeMention"]
+        day_sums[2] += x["score"]
+        day_sums[3] += 1
+
+    today = date.today().isoformat()
+    rows = [(symbol, day, *day_sums, int(day < today)) for day, day_sums in sums.items()]
+
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO daily_sentiment VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+
+def aggregate(symbol, start, end):
+    """
+    Lookback period sentiment summary of a ticker, computed from the stored days.
+
+    Args:
+        symbol (str): the company ticker
+        start (datetime.date): first day of the period
+        end (datetime.date): last day of the period, included
+
+    Returns:
+        dict: the positive and negative mentions and the mean sentiment score of the period,
+        empty if no entry was found
+    """
+
+    with _lock:
+        positive, negative, score_sum, n_entries = _connection().execute(
+            """SELECT SUM(positive_mentions), SUM(negative_mentions), SUM(score_sum), SUM(n_entries)
+            FROM daily_sentiment WHERE symbol = ? AND day BETWEEN ? AND ?""",
+            (symbol, start.isoformat(), end.isoformat()),
+        ).fetchone()
+
+    if not n_entries:
+        return {}
+
+    return {
+        "yest_twitter_positive_mentions": positive,
+        "yest_twitter_negative_mentions": negative,
+        "yest_twitter_mean_sentiment_score": score_sum / n_entries,
+    }
+
+
+def prune(before):
+    """
+    Deletes the days before a date, for all the tickers.
+
+    Args:
+        before (datetime.date): first day kept, the first day of the lookback period
+
+    Returns:
+        int: the number of deleted rows
+    """
+
+    with _lock:
+        conn = _connection()
+        with conn:
+            return conn.execute(
+                "DELETE FROM daily_sentiment WHERE day < ?", (before.isoformat(),)
+            ).rowcount
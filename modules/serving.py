@@ -0,0 +1,74 @@
+"""
+This serving module runs the dashboard with gunicorn, a production WSGI server, instead of the
+single process Flask development server.
+
+The Dash app, its dataset and its precomputed figures are created once, in the gunicorn master
+process, before the workers are forked (the preload mode of gunicorn): the workers share them
+copy-on-write instead of each loading the data and building the figures. The objects created so far
+are frozen out of the garbage collector before the fork, so that collections in the workers don't
+write to, and thus copy, the shared memory pages. Each worker then watches the snapshot file on its
+own (see dash_plotly_dashboard.watch_snapshot).
+
+The server is chosen with the SERVER_MODE environment variable: gunicorn, or dev (the default) for
+the Flask development server. WEB_WORKERS and WEB_THREADS set the number of worker processes and of
+threads per worker. See profiling/bench_serving.py for a throughput comparison of both servers. With
+PROMETHEUS_MULTIPROC_DIR set, /metrics aggregates the metrics of all the workers (see modules/metrics.py).
+
+Functions:
+    - gunicorn_options : gunicorn settings of the dashboard server.
+    - run_gunicorn : Serves a Dash app with gunicorn.
+"""
+
+
+import gc
+import logging
+import os
+from modules import metrics
+
+
+SERVER_MODE = os.environ.get("SERVER_MODE", "dev")
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 2 * (os.cpu_count() or 1) + 1))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 4))
+WEB_TIMEOUT = 120
+
+
+def gunicorn_options(port, workers=WEB_WORKERS, threads=WEB_THREADS):
+    """gunicorn settings of the dashboard server."""
+
+    return {
+        "bind": f"0.0.0.0:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "preload_app": True,
+        "timeout": WEB_TIMEOUT,
+        "accesslog": None,
+        "child_exit": metrics.child_exit,
+    }
+
+
+def run_gunicorn(app, port, workers=WEB_WORKERS, threads=WEB_THREADS):
+    """
+    Serves a Dash app with gunicorn, until the server is stopped.
+
+    Args:
+        app (dash.Dash): the app, already created with its data loaded
+        port (int): the port to listen on
+        workers (int): the number of worker processes
+        threads (int): the number of threads of each worker
+    """
+    from gunicorn.app.base import BaseApplication
+
+    options = gunicorn_options(port, workers, threads)
+
+    class DashApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app.server
+
+    logging.info(f"Serving the dashboard with gunicorn : {workers} workers of {threads} threads.")
+    gc.freeze()
+    DashApplication().run()
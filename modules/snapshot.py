@@ -0,0 +1,109 @@
+"""
+This snapshot module writes and reads the final data snapshot of the pipeline, in one of these formats:
+    - csv : data/final_data.csv, plain text export.
+    - parquet : data/final_data.parquet, typed and zstd compressed, memory-mapped when read.
+    - arrow : data/final_data.arrow, typed Arrow IPC file, memory-mapped when read. It is left
+      uncompressed by default so that numeric columns are read zero-copy from the mapped file.
+
+The format is chosen with the SNAPSHOT_FORMAT environment variable (csv by default). Snapshots are
+read back as DataFrames indexed by symbol, with the dtypes they were written with (except for csv).
+pandas and pyarrow are imported by the functions that need them, pyarrow only for the parquet and arrow formats.
+
+Functions:
+    - snapshot_path : Path of the snapshot file of a format.
+    - write_snapshot : Writes the final data snapshot.
+    - read_snapshot : Reads the final data snapshot.
+"""
+
+
+import os
+
+
+SNAPSHOT_FORMAT = os.environ.get("SNAPSHOT_FORMAT", "csv")
+SNAPSHOT_PATHS = {
+    "csv": os.path.join("data", "final_data.csv"),
+    "parquet": os.path.join("data", "final_data.parquet"),
+    "arrow": os.path.join("data", "final_data.arrow"),
+}
+PARQUET_COMPRESSION = "zstd"
+# None, "lz4" or "zstd". A compressed Arrow file can't be read zero-copy.
+ARROW_COMPRESSION = None
+
+
+def snapshot_path(file_format=None):
+    """Path of the snapshot file of a format (SNAPSHOT_FORMAT if not given)."""
+
+    file_format = file_format or SNAPSHOT_FORMAT
+    if file_format not in SNAPSHOT_PATHS:
+        raise ValueError(
+            f"Unknown snapshot format {file_format}, expected one of {list(SNAPSHOT_PATHS)}"
+        )
+    return SNAPSHOT_PATHS[file_format]
+
+
+def write_snapshot(df_final_data, file_format=None):
+    """
+    Writes the final data snapshot.
+
+    Args:
+        df_final_data (pandas.DataFrame): the final data, indexed by symbol
+        file_format (str): csv, parquet or arrow, SNAPSHOT_FORMAT if not given
+
+    Returns:
+        str: the path of the written file
+    """
+
+    path = snapshot_path(file_format)
+    file_format = file_format or SNAPSHOT_FORMAT
+    # Written next to the final file then renamed, so that readers never see a partial snapshot
+    tmp_path = f"{path}.tmp"
+
+    if file_format == "csv":
+        df_final_data.to_csv(tmp_path)
+    elif file_format == "parquet":
+        df_final_data.to_parquet(tmp_path, compression=PARQUET_COMPRESSION)
+    else:
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df_final_data)
+        options = pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION)
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_snapshot(file_format=None):
+    """
+    Reads the final data snapshot.
+
+    Args:
+        file_format (str): csv, parquet or arrow, SNAPSHOT_FORMAT if not given
+
+    Returns:
+        pandas.DataFrame: the final data, indexed by symbol
+    """
+
+    path = snapshot_path(file_format)
+    file_format = file_format or SNAPSHOT_FORMAT
+
+    if file_format == "csv":
+        import pandas as pd
+
+        df_final_data = pd.read_csv(path)
+        # Files written before the data was indexed by symbol have an unnamed positional index
+        df_final_data = df_final_data.drop(columns="Unnamed: 0", errors="ignore")
+        return df_final_data.set_index("symbol")
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format == "parquet":
+        table = pq.read_table(path, memory_map=True)
+    else:
+        # The table buffers point into the mapped file, which stays mapped as long as they are used
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    return table.to_pandas(split_blocks=True)
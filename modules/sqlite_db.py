@@ -0,0 +1,51 @@
+"""
+This sqlite_db module opens the local SQLite databases of the pipeline: the api_cache, the sentiment_store
+and the checkpoints.
+
+Classes:
+    - LocalDatabase : A local SQLite database shared by the threads of the process.
+"""
+
+
+import os
+import sqlite3
+import threading
+
+
+class LocalDatabase:
+    """
+    A local SQLite database shared by the threads of the process, behind its lock. It is opened on first
+    use, in WAL mode and with its tables created, and opened again when its path changes.
+
+    Args:
+        schema (list): the CREATE TABLE IF NOT EXISTS statements of the database
+        on_open (callable): called with the connection once it is opened, or None
+    """
+
+    def __init__(self, schema, on_open=None):
+        self.schema = list(schema)
+        self.on_open = on_open
+        self.lock = threading.Lock()
+        self._conn = None
+        self._path = None
+
+    def connection(self, path):
+        """Returns the connection to the database file at path, opening it on first use."""
+
+        if self._conn is None or self._path != path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                conn.execute(statement)
+            self._conn, self._path = conn, path
+            if self.on_open is not None:
+                self.on_open(conn)
+        return self._conn
+
+    def close(self):
+        """Closes the connection, the next use opens it again."""
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -5,42 +5,57 @@ For now, this serves no real purpose other than training me to interact with a S
 Functions:
     - conn_to_psql : Connects to the GCP Cloud SQL PostgreSQL database.
     - upload_to_psql : Uploads data to the GCP Cloud SQL PostgreSQL database.
+    - copy_to_psql : Bulk loads data with COPY into a staging table, swapped in atomically.
+    - upsert_history_to_psql : Upserts the changed rows of the day into the history table.
+    - verify_psql_load : Checks a loaded table against the source data, server side.
+    - close_conn_to_sql : Closes the connection to the GCP Cloud SQL PostgreSQL database.
+
+The database credentials are read from the lazy config on first use, and the Cloud SQL connector,
+sqlalchemy and pandas are imported by the functions that need them, so importing this module is cheap.
 """
 
 
+import hashlib
+import io
 import logging
+import math
 
-import os
-from google.cloud.sql.connector import Connector
-import pandas as pd
-import sqlalchemy
-from modules.gcp_interactions import get_secret
-
-
+from datetime import date, timedelta
+from modules.config import get_config
+from modules.snapshot import read_snapshot
 
 
-PROJECT_ID = os.environ["PROJECT_ID"]
-SQL_INSTANCE_CONNECTION_NAME1 = get_secret(PROJECT_ID, "SQL_INSTANCE_CONNECTION_NAME1")
-SQL_DB_USER1 = get_secret(PROJECT_ID, "SQL_DB_USER1")
-SQL_DB_PASS1 = get_secret(PROJECT_ID, "SQL_DB_PASS1")
-SQL_DB_NAME1 = get_secret(PROJECT_ID, "SQL_DB_NAME1")
-SQL_DB_TABLE_NAME1 = get_secret(PROJECT_ID, "SQL_DB_TABLE_NAME1")
+# "copy" (COPY FROM STDIN into a staging table) or "to_sql" (pandas parameterized inserts)
+UPLOAD_METHOD = "copy"
+# Number of rows compared one by one after a load
+VERIFY_SAMPLE_SIZE = 5
+# PostgreSQL column type for each numpy dtype kind, anything else is stored as TEXT
+PG_TYPES = {
+    "i": "BIGINT",
+    "u": "BIGINT",
+    "f": "DOUBLE PRECISION",
+    "b": "BOOLEAN",
+    "M": "TIMESTAMP",
+}
 
 
 def conn_to_psql():
     """Connects to the GCP Cloud SQL PostgreSQL database"""
     
+    from google.cloud.sql.connector import Connector
+    import sqlalchemy
+
     logging.info("Connecting to database...")
     
     connector = Connector()
 
     def getconn_SQL():
         conn = connector.connect(
-            SQL_INSTANCE_CONNECTION_NAME1,
+            get_config().sql_instance_connection_name,
             "pg8000",
-            user=SQL_DB_USER1,
-            password=SQL_DB_PASS1,
-            db=SQL_DB_NAME1,
+            user=get_config().sql_db_user,
+            password=get_config().sql_db_pass,
+            db=get_config().sql_db_name,
         )
         return conn
 
@@ -57,21 +72,361 @@ def conn_to_psql():
     return pool, connector
 
 
-def upload_to_psql(pool):
-    """Upload data to the GCP Cloud SQL PostgreSQL database"""
+def _table_name():
+    """Name of the final data table, from the SQL_DB_TABLE_NAME1 secret."""
+    return get_config().sql_db_table_name
+
+
+def _quote_ident(name):
+    """Quotes a PostgreSQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _columns_sql(df):
+    """Columns definitions matching the columns and dtypes of a DataFrame."""
+
+    return ", ".join(
+        f"{_quote_ident(column)} {PG_TYPES.get(dtype.kind, 'TEXT')}"
+        for column, dtype in df.dtypes.items()
+    )
+
+
+def _create_table_sql(df, table_name):
+    """CREATE TABLE statement matching the columns and dtypes of a DataFrame."""
+
+    return f"CREATE TABLE {_quote_ident(table_name)} ({_columns_sql(df)})"
+
+
+def copy_to_psql(pool, df, table_name):
+    """
+    Bulk loads data with COPY FROM STDIN into a staging table, then swaps it in place of the
+    table inside the same transaction. Readers keep seeing the previous table until the commit,
+    never an empty or partially loaded one.
+
+    Args:
+        pool (sqlalchemy.engine.Engine): the connection pool to the database
+        df (pandas.DataFrame): the data to load
+        table_name (str): the table to replace
+    """
+
+    staging_name = f"{table_name}_staging"
+
+    # Missing values are written as unquoted empty fields, which COPY reads as NULL
+    csv_buffer = io.StringIO()
+    df.to_csv(csv_buffer, index=False, header=False)
+    csv_buffer.seek(0)
+
+    raw_connection = pool.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {_quote_ident(staging_name)}")
+        cursor.execute(_create_table_sql(df, staging_name))
+        cursor.execute(
+            f"COPY {_quote_ident(staging_name)} FROM STDIN WITH (FORMAT csv)",
+            stream=csv_buffer,
+        )
+        cursor.execute(f"DROP TABLE IF EXISTS {_quote_ident(table_name)}")
+        cursor.execute(
+            f"ALTER TABLE {_quote_ident(staging_name)} RENAME TO {_quote_ident(table_name)}"
+        )
+        raw_connection.commit()
+    except Exception:
+        raw_connection.rollback()
+        raise
+    finally:
+        raw_connection.close()
+
+
+def _row_hashes(df):
+    """
+    Content hash of each row, as hexadecimal strings (vectorized, stable across runs).
+
+    The numeric columns are hashed as float64: a count column is int64, or float64 as soon as one
+    company lacks the data, and the hash of a row must not depend on the other rows.
+    """
+    import pandas as pd
+
+    numeric_columns = df.select_dtypes("number").columns
+    normalized = df.astype({column: "float64" for column in numeric_columns})
+    return pd.util.hash_pandas_object(normalized, index=False).map("{:016x}".format)
+
+
+def upsert_history_to_psql(pool, df_final_data, snapshot_date=None):
+    """
+    Upserts the day's snapshot into the {SQL_DB_TABLE_NAME1}_history table.
+
+    The history table is partitioned by month of snapshot_date, with (snapshot_date, symbol) as
+    primary key. A row is only written when its content hash differs from the latest stored
+    version of the company, so the write volume is proportional to the actual changes: the
+    state of a company at a given date is its latest row up to that date.
+
+    The latest version of each company is kept in the small {SQL_DB_TABLE_NAME1}_history_latest
+    table, keyed by symbol and updated in the same transaction, so the comparison doesn't scan
+    all the partitions of the history. It is filled from the history the first time, when empty.
+    A company whose latest version is after the snapshot date, when a past day is backfilled, has
+    its row written.
+
+    Args:
+        pool (sqlalchemy.engine.Engine): the connection pool to the database
+        df_final_data (pandas.DataFrame): the final data, indexed by symbol
+        snapshot_date (datetime.date): date of the snapshot, today if not given
+
+    Returns:
+        int: the number of written rows
+    """
+    import sqlalchemy
+
+    snapshot_date = snapshot_date or date.today()
+    history_name = f"{_table_name()}_history"
+    month_start = snapshot_date.replace(day=1)
+    next_month_start = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    partition_name = f"{history_name}_{month_start:%Y%m}"
+
+    df = df_final_data.reset_index() if df_final_data.index.name == "symbol" else df_final_data
+    df = df.assign(row_hash=_row_hashes(df))
+    columns = list(df.columns)
+
+    history = _quote_ident(history_name)
+    latest = _quote_ident(f"{history_name}_latest")
+    columns_sql = ", ".join(_quote_ident(c) for c in ["snapshot_date"] + columns)
+    values_sql = ", ".join(f":p{i}" for i in range(len(columns) + 1))
+    updates_sql = ", ".join(
+        f"{_quote_ident(c)} = EXCLUDED.{_quote_ident(c)}" for c in columns if c != "symbol"
+    )
+
+    with pool.begin() as conn:
+        conn.execute(
+            sqlalchemy.text(
+                f"""CREATE TABLE IF NOT EXISTS {history} (snapshot_date DATE NOT NULL, {_columns_sql(df)},
+                PRIMARY KEY (snapshot_date, symbol)) PARTITION BY RANGE (snapshot_date)"""
+            )
+        )
+        conn.execute(
+            sqlalchemy.text(
+                f"""CREATE TABLE IF NOT EXISTS {_quote_ident(partition_name)} PARTITION OF {history}
+                FOR VALUES FROM ('{month_start}') TO ('{next_month_start}')"""
+            )
+        )
+
+        conn.execute(
+            sqlalchemy.text(
+                f"""CREATE TABLE IF NOT EXISTS {latest} (symbol TEXT PRIMARY KEY,
+                snapshot_date DATE NOT NULL, row_hash TEXT NOT NULL)"""
+            )
+        )
+        # Only scans the history once, to fill the table of a history written before it existed
+        conn.execute(
+            sqlalchemy.text(
+                f"""INSERT INTO {latest} (symbol, snapshot_date, row_hash)
+                SELECT DISTINCT ON (symbol) symbol, snapshot_date, row_hash FROM {history}
+                WHERE NOT EXISTS (SELECT 1 FROM {latest}) ORDER BY symbol, snapshot_date DESC"""
+            )
+        )
+
+        # Latest stored version of each company, before or at the snapshot date
+        latest_hashes = dict(
+            conn.execute(
+                sqlalchemy.text(
+                    f"SELECT symbol, row_hash FROM {latest} WHERE snapshot_date <= :snapshot_date"
+                ),
+                {"snapshot_date": snapshot_date},
+            ).fetchall()
+        )
+        changed = df[df["row_hash"] != df["symbol"].map(latest_hashes)]
+
+        if not changed.empty:
+            records = [
+                {
+                    f"p{i}": None if isinstance(v, float) and math.isnan(v) else v
+                    for i, v in enumerate([snapshot_date] + list(row.values()))
+                }
+                for row in changed.to_dict("records")
+            ]
+            conn.execute(
+                sqlalchemy.text(
+                    f"""INSERT INTO {history} ({columns_sql}) VALUES ({values_sql})
+                    ON CONFLICT (snapshot_date, symbol) DO UPDATE SET {updates_sql}
+                    WHERE {history}.row_hash IS DISTINCT FROM EXCLUDED.row_hash"""
+                ),
+                records,
+            )
+            # A backfilled past day doesn't replace a later version
+            conn.execute(
+                sqlalchemy.text(
+                    f"""INSERT INTO {latest} (symbol, snapshot_date, row_hash)
+                    VALUES (:symbol, :snapshot_date, :row_hash)
+                    ON CONFLICT (symbol) DO UPDATE SET snapshot_date = EXCLUDED.snapshot_date,
+                    row_hash = EXCLUDED.row_hash WHERE {latest}.snapshot_date <= EXCLUDED.snapshot_date"""
+                ),
+                [
+                    {"symbol": symbol, "snapshot_date": snapshot_date, "row_hash": row_hash}
+                    for symbol, row_hash in zip(changed["symbol"], changed["row_hash"])
+                ],
+            )
+
+    logging.info(
+        f"History upsert : {len(changed)} changed rows out of {len(df)} for {snapshot_date}."
+    )
+    return len(changed)
+
+
+# Server side sum of a typed column: booleans count their true values, timestamps sum their epoch seconds
+SUM_SQL = {
+    "b": "SUM({column}::int)::float8",
+    "M": "SUM(EXTRACT(EPOCH FROM {column}))::float8",
+}
+
+
+def _column_sum(values):
+    """Local sum of a typed column, like the server side SUM_SQL, None when it has no value."""
+    import pandas as pd
+
+    values = values.dropna()
+    if values.empty:
+        return None
+    if values.dtype.kind == "M":
+        # TIMESTAMP columns are stored without the time zone, EXTRACT reads them as UTC
+        if values.dt.tz is not None:
+            values = values.dt.tz_localize(None)
+        return float((values - pd.Timestamp(0)).dt.total_seconds().sum())
+    return float(values.astype("float64").sum())
+
+
+def _text_checksum(values):
+    """
+    md5 of the sorted non null values joined by the unit separator, like the server side checksum.
+    Only used for the TEXT columns, where the values are stored the way the loader wrote them, as str does.
+    """
+    import pandas as pd
+
+    values = sorted(str(v) for v in values if not pd.isna(v))
+    return hashlib.md5(chr(31).join(values).encode()).hexdigest() if values else None
+
+
+def _same_value(expected, actual):
+    import pandas as pd
+
+    if pd.isna(expected) or actual is None:
+        return pd.isna(expected) and (actual is None or pd.isna(actual))
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+        return math.isclose(expected, float(actual), rel_tol=1e-9)
+    return str(expected) == str(actual)
+
+
+def verify_psql_load(pool, df, table_name=None, sample_size=VERIFY_SAMPLE_SIZE):
+    """
+    Checks a loaded table against the source data without reading the table back.
+
+    The row count and a checksum per column (sum of the numeric, boolean and timestamp columns, md5
+    of the sorted values of the text columns) are computed by the server in a single query, then a
+    sample of rows is fetched by symbol and compared value by value. The typed columns are compared
+    by sum rather than by text, Postgres renders their values differently from Python (true, not
+    True, and its own float format).
+
+    Args:
+        pool (sqlalchemy.engine.Engine): the connection pool to the database
+        df (pandas.DataFrame): the source data, with a symbol column
+        table_name (str): the loaded table, SQL_DB_TABLE_NAME1 if not given
+        sample_size (int): number of rows compared one by one
+
+    Returns:
+        dict: "ok", the "row_count" expected and actual, and the list of "mismatches", each with
+        the check, the column (and symbol for sampled rows), the expected and the actual value
+    """
+    import sqlalchemy
+
+    table = _quote_ident(table_name or _table_name())
+    typed_columns = [c for c, dtype in df.dtypes.items() if dtype.kind in "iufbM"]
+    text_columns = [c for c in df.columns if c not in typed_columns]
+
+    aggregates = ["COUNT(*)"]
+    aggregates += [
+        SUM_SQL.get(df[c].dtype.kind, "SUM({column}::float8)").format(column=_quote_ident(c))
+        for c in typed_columns
+    ]
+    aggregates += [
+        f"md5(string_agg({_quote_ident(c)}::text, chr(31) ORDER BY {_quote_ident(c)}::text COLLATE \"C\"))"
+        for c in text_columns
+    ]
+
+    sample = df.sample(min(sample_size, len(df)))
+
+    with pool.connect() as conn:
+        row = conn.execute(
+            sqlalchemy.text(f"SELECT {', '.join(aggregates)} FROM {table}")
+        ).fetchone()
+        sampled_rows = conn.execute(
+            sqlalchemy.text(f"SELECT * FROM {table} WHERE symbol IN :symbols").bindparams(
+                sqlalchemy.bindparam("symbols", expanding=True)
+            ),
+            {"symbols": list(sample["symbol"])},
+        ).mappings().fetchall()
+
+    mismatches = []
+    row_count = {"expected": len(df), "actual": row[0]}
+    if row[0] != len(df):
+        mismatches.append({"check": "row_count", "column": None, **row_count})
+
+    # SUM of a column without any value is NULL on the server
+    expected_checksums = [_column_sum(df[c]) for c in typed_columns]
+    expected_checksums += [_text_checksum(df[c]) for c in text_columns]
+    for column, expected, actual in zip(typed_columns + text_columns, expected_checksums, row[1:]):
+        if not _same_value(expected, actual):
+            mismatches.append(
+                {"check": "checksum", "column": column, "expected": expected, "actual": actual}
+            )
+
+    sampled_rows_by_symbol = {r["symbol"]: r for r in sampled_rows}
+    for expected_row in sample.to_dict("records"):
+        actual_row = sampled_rows_by_symbol.get(expected_row["symbol"], {})
+        for column, expected in expected_row.items():
+            if not _same_value(expected, actual_row.get(column)):
+                mismatches.append(
+                    {
+                        "check": "sample",
+                        "column": column,
+                        "symbol": expected_row["symbol"],
+                        "expected": expected,
+                        "actual": actual_row.get(column),
+                    }
+                )
+
+    return {"ok": not mismatches, "row_count": row_count, "mismatches": mismatches}
+
+
+def upload_to_psql(pool, df_final_data=None, method=UPLOAD_METHOD):
+    """
+    Upload data to the GCP Cloud SQL PostgreSQL database, then verify the load with verify_psql_load
+
+    Args:
+        pool (sqlalchemy.engine.Engine): the connection pool to the database
+        df_final_data (pandas.DataFrame): the final data, read from the snapshot file if not given
+        method (str): "copy" to bulk load with copy_to_psql, "to_sql" for pandas inserts
+
+    Returns:
+        dict: the verification report
+    """
     
     logging.info("Uploading data to GCP database...")
     
-    df_final_data = pd.read_csv("data/final_data.csv")
-    df_final_data.to_sql(SQL_DB_TABLE_NAME1, pool, if_exists="replace", index=False)
+    if df_final_data is None:
+        df_final_data = read_snapshot()
+    if df_final_data.index.name == "symbol":
+        df_final_data = df_final_data.reset_index()
+
+    if method == "copy":
+        copy_to_psql(pool, df_final_data, _table_name())
+    else:
+        df_final_data.to_sql(_table_name(), pool, if_exists="replace", index=False)
 
     # Verify data has been inserted
-    query = f"SELECT * FROM {SQL_DB_TABLE_NAME1}"
-    result = pd.read_sql(query, pool)
-    if result is not None:
-        logging.info("Data inserted.")
-    print("SQL query result : \n")
-    print(result)
+    report = verify_psql_load(pool, df_final_data)
+    if report["ok"]:
+        logging.info(f"Data inserted and verified ({report['row_count']['actual']} rows).")
+    for mismatch in report["mismatches"]:
+        logging.warning(f"Database load mismatch : {mismatch}")
+
+    return report
 
 def close_conn_to_sql(pool, connector):
     """Closes the connection to the GCP Cloud SQL PostgreSQL database"""
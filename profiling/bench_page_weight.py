@@ -0,0 +1,140 @@
+"""
+Page weight and time to first chart of the dashboard, measured in process with the Flask test client
+on the current data snapshot.
+
+A page load is replayed the way a browser does it: the index page, every stylesheet and script it links
+(fetched over the network when they are on a CDN), the scripts loaded with the first graph (plotly.js),
+the layout and the callbacks dependencies, then the callbacks rendering the first two charts and the
+figures they link to (see dash_plotly_dashboard.serve_figure). The requests are sent one after the other, with an
+Accept-Encoding: br, gzip header: the time to first chart is the sum of their durations, an upper bound
+of what a browser that parallelizes them would see, without the JavaScript and rendering time.
+
+Usage (from the repository root):
+    python -m profiling.bench_page_weight
+
+Measured on 12 companies, before and after the fonts and stylesheets were served by the app, with
+compression (time to first chart of a page load after the first one of the process):
+                                      requests   on the wire (kB)   uncompressed (kB)   first chart (ms)
+    before, served by the app               18              6 328               6 328                 28
+    before, CDNs (3 more origins)            2        not reachable from the benchmark machine
+    after                                   20              1 577               6 342                 18
+The Slate theme was 242 kB uncompressed from the CDN, and the Lato font a Google Fonts stylesheet plus
+a font file from a third origin, each needing its own DNS lookup and TLS handshake. After, the
+dash_bootstrap_components script (228 kB) is no longer sent, the app not importing it anymore. The
+first page load of a process takes 246 ms, as it compresses the static files.
+Since the figures are fetched from their own URLs, a page load is 22 requests, 1 578 kB on the wire,
+22 ms: the two figure requests are added to the sequential sum, a browser sends them while plotly.js
+loads, and serves them from its cache on the next page loads until the data changes.
+"""
+
+
+import re
+import time
+
+import requests
+
+
+FIRST_CHARTS = [
+    ("tabs-content-marketcap", "tabs-marketcap", "tab-treemap"),
+    ("tabs-content-scatter", "tabs-scatter", "tab-3d-scatter"),
+]
+# Loaded by the browser when the first dcc.Graph is rendered
+LAZY_SCRIPTS = [
+    "/_dash-component-suites/dash/dcc/async-graph.js",
+    "/_dash-component-suites/plotly/package_data/plotly.min.js",
+]
+HEADERS = {"Accept-Encoding": "br, gzip"}
+
+
+def fetch(client, method, url, **kwargs):
+    """
+    Sends a request, to the app or to a CDN.
+
+    Returns:
+        tuple: bytes on the wire, uncompressed bytes, seconds, None or the error of an unreachable CDN
+    """
+
+    start = time.perf_counter()
+    if url.startswith("http"):
+        try:
+            response = requests.request(method, url, headers=HEADERS, stream=True, timeout=10, **kwargs)
+            raw = response.raw.read(decode_content=False)
+            elapsed = time.perf_counter() - start
+            return len(raw), len(response.content or raw), elapsed, None
+        except requests.RequestException as e:
+            return 0, 0, 0, type(e).__name__
+
+    response = client.open(url, method=method, headers=HEADERS, **kwargs)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, f"{url} : {response.status_code}"
+    wire = len(response.get_data())
+    encoding = response.headers.get("Content-Encoding")
+    if encoding == "br":
+        import brotli
+
+        uncompressed = len(brotli.decompress(response.get_data()))
+    elif encoding == "gzip":
+        import gzip
+
+        uncompressed = len(gzip.decompress(response.get_data()))
+    else:
+        uncompressed = wire
+    return wire, uncompressed, elapsed, None
+
+
+def page_load(app):
+    """Replays a page load, returns one (url, wire bytes, uncompressed bytes, seconds, error) per request."""
+
+    client = app.server.test_client()
+    results = []
+
+    def record(method, url, **kwargs):
+        results.append((url, *fetch(client, method, url, **kwargs)))
+
+    record("GET", "/")
+    index = client.get("/").get_data(as_text=True)
+    for url in re.findall(r'(?:href|src)="([^"]+)"', index):
+        record("GET", url.replace("&amp;", "&"))
+    for url in LAZY_SCRIPTS:
+        record("GET", url)
+    record("GET", "/_dash-layout")
+    record("GET", "/_dash-dependencies")
+    from modules.dash_plotly_dashboard import current_dataset, figure_url
+
+    for output, tab_id, tab in FIRST_CHARTS:
+        record(
+            "POST",
+            "/_dash-update-component",
+            json={
+                "output": f"{output}.children",
+                "outputs": {"id": output, "property": "children"},
+                "inputs": [{"id": tab_id, "property": "value", "value": tab}],
+                "changedPropIds": [f"{tab_id}.value"],
+            },
+        )
+        record("GET", figure_url(tab, current_dataset()["version"]))
+    return results
+
+
+def main():
+    from modules.dash_plotly_dashboard import create_app
+
+    app = create_app()
+    # The first page load of a process also compresses the static files, which are then kept compressed
+    first_results = page_load(app)
+    results = page_load(app)
+    print(f"{'request':<70} {'wire (kB)':>10} {'raw (kB)':>10} {'ms':>8}")
+    for url, wire, uncompressed, elapsed, error in results:
+        note = f"  unreachable ({error})" if error else ""
+        print(f"{url[:70]:<70} {wire / 1000:>10.1f} {uncompressed / 1000:>10.1f} {elapsed * 1000:>8.1f}{note}")
+    print(
+        f"{'total, ' + str(len(results)) + ' requests':<70}"
+        f" {sum(r[1] for r in results) / 1000:>10.1f}"
+        f" {sum(r[2] for r in results) / 1000:>10.1f}"
+        f" {sum(r[3] for r in results) * 1000:>8.1f}"
+    )
+    print(f"{'first page load of the process':<70} {'':>10} {'':>10} {sum(r[3] for r in first_results) * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark of screener_transf on synthetic screener responses, from ROW_LIMIT sized answers up to
+a full NASDAQ-like universe.
+
+The previous implementation (full sort, then quadratic dedup with any()) is kept below as a reference:
+its results are checked against the current ones, and it is skipped above REFERENCE_MAX_ROWS rows
+where it takes minutes.
+
+Usage (from the repository root):
+    python -m profiling.bench_screener_transf
+"""
+
+
+import json
+import random
+import timeit
+from unittest.mock import Mock
+from modules.extract_data import screener_transf
+
+
+ROW_LIMIT = 12
+SIZES = [12, 100, 1_000, 10_000, 50_000]
+REFERENCE_MAX_ROWS = 10_000
+
+
+def reference_screener_transf(row_limit, screener_resp_tech, screener_resp_com):
+    """Previous implementation of screener_transf, for comparison."""
+
+    tech_data = json.loads(screener_resp_tech.text)
+    com_data = json.loads(screener_resp_com.text)
+    tech_data.extend(com_data)
+    sorted_data = sorted(tech_data, key=lambda x: x["marketCap"], reverse=True)
+    unique_sorted_dicts = []
+    for d in sorted_data:
+        if not any(d["companyName"] == x["companyName"] for x in unique_sorted_dicts):
+            unique_sorted_dicts.append(d)
+    sorted_data_lim = unique_sorted_dicts[:row_limit]
+    tickers_list = [d["symbol"] for d in sorted_data_lim]
+    return tickers_list
+
+
+def synthetic_responses(n_rows, seed=0):
+    """Two screener responses with n_rows companies in total, including share classes duplicates and ties."""
+
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_rows):
+        # ~5% of the rows are a second share class of a previous company
+        company_id = rng.randrange(i) if i and rng.random() < 0.05 else i
+        rows.append(
+            {
+                "symbol": f"T{i}",
+                "companyName": f"Company {company_id}",
+                # Rounded market caps so that ties happen
+                "marketCap": rng.randrange(1, 10_000) * 100_000_000,
+                "beta": rng.random(),
+            }
+        )
+    half = n_rows // 2
+    return Mock(text=json.dumps(rows[:half])), Mock(text=json.dumps(rows[half:]))
+
+
+def main():
+    print(f"{'rows':>8} {'current (ms)':>14} {'reference (ms)':>16}")
+    for n_rows in SIZES:
+        resp_tech, resp_com = synthetic_responses(n_rows)
+        tickers_list, _ = screener_transf(ROW_LIMIT, resp_tech, resp_com)
+        runs = max(1, 2_000 // n_rows)
+        current = min(
+            timeit.repeat(
+                lambda: screener_transf(ROW_LIMIT, resp_tech, resp_com), number=runs, repeat=3
+            )
+        ) / runs
+
+        reference = "skipped"
+        if n_rows <= REFERENCE_MAX_ROWS:
+            assert reference_screener_transf(ROW_LIMIT, resp_tech, resp_com) == tickers_list
+            reference = min(
+                timeit.repeat(
+                    lambda: reference_screener_transf(ROW_LIMIT, resp_tech, resp_com),
+                    number=1,
+                    repeat=1 if n_rows > 1_000 else 3,
+                )
+            )
+            reference = f"{reference * 1000:.2f}"
+
+        print(f"{n_rows:>8} {current * 1000:>14.2f} {reference:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Throughput benchmark of the dashboard servers: the Flask development server (app.run) against
+gunicorn (see modules/serving.py), on the callbacks hit by page loads and hovers.
+
+Each server is started in a subprocess on the current data snapshot, then CONCURRENCY clients send
+REQUESTS callback requests in total: tab renders, which send the graph and the URL of its cached figure,
+and hover highlights, which send a small Patch.
+
+With --figures N, the tab renders and the requests of the cached figures JSON they link to are timed
+instead, in process with the Flask test client, on N synthetic companies (see
+dash_plotly_dashboard.serve_figure).
+
+Usage (from the repository root):
+    python -m profiling.bench_serving [--requests 2000] [--concurrency 16] [--workers 4] [--threads 4]
+    python -m profiling.bench_serving --figures 5000
+
+Measured on a 1 vCPU machine, 12 companies, 2000 requests, 16 clients, gunicorn with 4 workers of 4 threads:
+        server       req/s   p50 (ms)   p95 (ms)
+           dev         241       66.0       79.6
+      gunicorn         233       61.8      114.3
+With a single CPU, both servers are CPU-bound at the same throughput: the gain of gunicorn comes with
+the number of CPUs, its workers running callbacks in parallel where the development server is held by
+the GIL of its single process. Run it again on the target machine to size WEB_WORKERS.
+The workers share the preloaded app: on the same run, each worker had 188 MB resident but only
+about 4 MB of private dirty memory (Private_Dirty in /proc/<pid>/smaps_rollup).
+
+Measured on the same machine with --figures 5000 (DASHBOARD_MAX_SCATTER_POINTS, the largest scatters):
+                     figure (kB)   tab render before (ms)   tab render (ms)   figure request (ms)
+         tab-treemap          11                     2.19              0.67                  0.33
+        tab-barchart          33                     3.42              0.67                  0.28
+      tab-3d-scatter         383                     7.15              0.62                  0.34
+      tab-2d-scatter         319                     6.91              0.69                  0.27
+Before, the tab render sent the figure, cached as a JSON-ready dict that Dash serialized again on each
+render: orjson can't serialize the Dash components around it, so plotly walked the whole figure in
+Python, 4.5 ms of the 7 ms of a scatter render. The figure JSON is now serialized and compressed once,
+then fetched by the browser from its own URL, and from the browser cache until the data changes.
+"""
+
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORTS = {"dev": 8061, "gunicorn": 8062}
+STARTUP_TIMEOUT = 60
+
+TAB_RENDER = {
+    "output": "tabs-content-marketcap.children",
+    "outputs": {"id": "tabs-content-marketcap", "property": "children"},
+    "inputs": [{"id": "tabs-marketcap", "property": "value", "value": "tab-treemap"}],
+    "changedPropIds": ["tabs-marketcap.value"],
+}
+HOVER = {
+    "inputs": [
+        {"id": "graph-market-cap", "property": "hoverData", "value": {"points": [{"label": "?"}]}},
+    ],
+    "state": [{"id": "tabs-scatter", "property": "value", "value": "tab-3d-scatter"}],
+    "changedPropIds": ["graph-market-cap.hoverData"],
+}
+
+
+def serve(mode, port, workers, threads):
+    """Runs the dashboard on the current snapshot with a server, in this process."""
+
+    from modules.dash_plotly_dashboard import create_app
+    from modules.serving import run_gunicorn
+
+    app = create_app()
+    if mode == "gunicorn":
+        run_gunicorn(app, port, workers, threads)
+    else:
+        app.run(host="127.0.0.1", port=port)
+
+
+def wait_until_up(url):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/_dash-layout", timeout=1).ok:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise Exception(f"Server at {url} did not start")
+
+
+def hover_body(url):
+    """
+    The hover request body. The figure of the scatter is also set by a clientside callback, so the
+    hover callback output has a suffix, read from the callbacks of the app.
+    """
+
+    dependencies = requests.get(f"{url}/_dash-dependencies").json()
+    output = next(d["output"] for d in dependencies if d["output"].startswith("graph-3d-scatter.figure@"))
+    return {
+        "output": output,
+        "outputs": {"id": "graph-3d-scatter", "property": output.split(".", 1)[1]},
+        **HOVER,
+    }
+
+
+def load_test(url, n_requests, concurrency):
+    """
+    Sends n_requests callback requests, alternating tab renders and hovers.
+
+    Returns:
+        tuple: requests per second, and the latencies in seconds
+    """
+
+    hover = hover_body(url)
+
+    def client(n):
+        session = requests.Session()
+        latencies = []
+        for i in range(n):
+            body = TAB_RENDER if i % 2 else hover
+            start = time.perf_counter()
+            session.post(f"{url}/_dash-update-component", json=body).raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    per_client = n_requests // concurrency
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client, [per_client] * concurrency))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for result in results for latency in result]
+    return len(latencies) / elapsed, latencies
+
+
+def figures_cost(n_companies, repeat=50):
+    """
+    Prints, for each tab, the size of its cached figure JSON, the time of the tab render callback
+    request, and the time of the request of the figure JSON it links to.
+    """
+    import numpy as np
+    from flask import json as flask_json
+
+    from modules import dash_plotly_dashboard
+    from modules.dash_plotly_dashboard import create_app
+    from modules.snapshot import read_snapshot
+
+    rng = np.random.default_rng(0)
+    df = read_snapshot().reset_index().sample(n_companies, replace=True, random_state=0)
+    df = df.assign(
+        symbol=[f"S{i}" for i in range(n_companies)],
+        companyName=[f"Company {i}" for i in range(n_companies)],
+    )
+    for column in df.select_dtypes("number").columns:
+        df[column] = df[column] * rng.uniform(0.5, 1.5, n_companies)
+
+    app = create_app(df.set_index("symbol"))
+    client = app.server.test_client()
+    headers = {"Accept-Encoding": "br, gzip"}
+
+    def median_time(request):
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = request()
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+        return statistics.median(latencies)
+
+    print(f"{'tab':>16} {'figure (kB)':>12} {'tab render (ms)':>16} {'figure request (ms)':>20}")
+    for tab in dash_plotly_dashboard.FIGURE_BUILDERS:
+        version = dash_plotly_dashboard.current_dataset()["version"]
+        figure_json = dash_plotly_dashboard.get_figure(tab, None, version)
+
+        container, tabs = ("tabs-content-scatter", "tabs-scatter") if "scatter" in tab else ("tabs-content-marketcap", "tabs-marketcap")
+        body = flask_json.dumps(
+            {
+                "output": f"{container}.children",
+                "outputs": {"id": container, "property": "children"},
+                "inputs": [{"id": tabs, "property": "value", "value": tab}],
+                "changedPropIds": [f"{tabs}.value"],
+            }
+        )
+        render = median_time(
+            lambda: client.post(
+                "/_dash-update-component", data=body, content_type="application/json", headers=headers
+            )
+        )
+        url = dash_plotly_dashboard.figure_url(tab, version)
+        figure = median_time(lambda: client.get(url, headers=headers))
+
+        print(f"{tab:>16} {len(figure_json) / 1024:>12.0f} {render * 1000:>16.2f} {figure * 1000:>20.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--figures", type=int, help="measure the figures serialization on N companies")
+    parser.add_argument("--serve", choices=PORTS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.workers, args.threads)
+        return
+    if args.figures:
+        figures_cost(args.figures)
+        return
+
+    print(f"{'server':>14} {'req/s':>11} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+    for mode, port in PORTS.items():
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "profiling.bench_serving", "--serve", mode, "--port", str(port),
+                "--workers", str(args.workers), "--threads", str(args.threads),
+            ],
+            cwd=REPO_ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            url = f"http://127.0.0.1:{port}"
+            wait_until_up(url)
+            load_test(url, args.concurrency * 10, args.concurrency)  # warm-up
+            throughput, latencies = load_test(url, args.requests, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+
+        quantiles = statistics.quantiles(latencies, n=20)
+        print(f"{mode:>14} {throughput:>11.0f} {quantiles[9] * 1000:>10.1f} {quantiles[18] * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
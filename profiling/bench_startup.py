@@ -0,0 +1,89 @@
+"""
+Startup benchmark: measures the import time of the main module in a fresh interpreter, per module,
+with python -X importtime, and fails if the import budget is exceeded or if one of the heavy
+libraries, which must only be imported by the stage that needs them, is imported.
+
+Usage (from the repository root):
+    python -m profiling.bench_startup [--budget-ms 500] [--top 15]
+"""
+
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+IMPORT_BUDGET_MS = 500
+# Libraries that must not be imported by "import main"
+HEAVY_MODULES = [
+    "pandas",
+    "pyarrow",
+    "plotly",
+    "dash",
+    "dash_bootstrap_components",
+    "sklearn",
+    "sqlalchemy",
+    "google.cloud.secretmanager",
+    "google.cloud.sql.connector",
+]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_imports(module="main"):
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        dict: the cumulative import time in microseconds of every imported module
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    cumulative_us = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        cumulative_us[name.strip()] = int(cumulative)
+    return cumulative_us
+
+
+def check_budget(cumulative_us, module="main", budget_ms=IMPORT_BUDGET_MS):
+    """Returns the list of budget violations, empty if the startup is within budget."""
+
+    violations = []
+    total_ms = cumulative_us[module] / 1000
+    if total_ms > budget_ms:
+        violations.append(f"import {module} took {total_ms:.0f} ms, budget is {budget_ms} ms")
+    for heavy_module in HEAVY_MODULES:
+        if heavy_module in cumulative_us:
+            violations.append(f"import {module} imports {heavy_module}")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    cumulative_us = measure_imports()
+    print(f"{'cumulative (ms)':>16}  module")
+    for name, us in sorted(cumulative_us.items(), key=lambda x: -x[1])[: args.top]:
+        print(f"{us / 1000:>16.1f}  {name}")
+
+    violations = check_budget(cumulative_us, budget_ms=args.budget_ms)
+    for violation in violations:
+        print(f"BUDGET EXCEEDED: {violation}")
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
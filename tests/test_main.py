@@ -1,10 +1,34 @@
 """Unit testing the different functions called in the main script"""
 
 import os
+import re
+import sys
 import tempfile
+import threading
+import time
 from unittest.mock import Mock, patch, MagicMock
 import requests
 import json
+import pandas as pd
+from datetime import date, timedelta
+from modules import (
+    api_cache,
+    checkpoints,
+    company_table,
+    dash_plotly_dashboard,
+    gcp_interactions,
+    http_client,
+    metrics,
+    pipeline,
+    sentiment_store,
+    serving,
+    snapshot,
+    static_assets,
+    update_psql,
+)
+from modules.extract_data import _fan_out
+from profiling.bench_startup import check_budget, measure_imports
+import main
 from main import (
     ROW_LIMIT,
     screener_call,
@@ -16,6 +40,7 @@ from main import (
     write_data_to_csv,
     conn_to_psql,
     upload_to_psql,
+    upsert_history_to_psql,
     close_conn_to_sql,
     dashboard,
 )
@@ -28,6 +53,30 @@ def test_row_limit():
     assert isinstance(ROW_LIMIT, int)
 
 
+def test_get_secret_prefetch_and_cache():
+    """Test that the first secret access prefetches all the secrets, and that the next ones are served from memory"""
+
+    fetch = Mock(side_effect=lambda project_id, name: f"value of {name}")
+
+    with patch.dict("modules.gcp_interactions._BACKENDS", {"env": fetch}), patch(
+        "modules.gcp_interactions.SECRETS_BACKEND", "env"
+    ), patch.dict("modules.gcp_interactions._cache", clear=True):
+        assert gcp_interactions.get_secret("project", "FMI_API_KEY") == "value of FMI_API_KEY"
+        assert fetch.call_count == len(gcp_interactions.SECRET_NAMES)
+
+        assert gcp_interactions.get_secret("project", "SQL_DB_USER1") == "value of SQL_DB_USER1"
+        assert fetch.call_count == len(gcp_interactions.SECRET_NAMES)
+
+
+def test_import_budget():
+    """Test that importing main doesn't import the heavy libraries"""
+
+    cumulative_us = measure_imports("main")
+
+    # The time budget is checked by profiling/bench_startup.py: a timing would fail on a throttled cold start
+    assert check_budget(cumulative_us, "main", budget_ms=float("inf")) == []
+
+
 def test_screener_call():
     """Test the screener API call, and check if responses are present and conforming to expectations."""
 
@@ -165,12 +214,41 @@ def test_screener_transf():
     assert len(tickers_list) == len(set(tickers_list))
     for ticker in tickers_list:
         assert ticker.isupper()
-    # Test if filtered_screener is a list of dicts
-    assert isinstance(filtered_screener, list) and all(
-        isinstance(d, dict) for d in filtered_screener
+    # Test if filtered_screener is a DataFrame indexed by symbol, in tickers_list order
+    assert isinstance(filtered_screener, pd.DataFrame)
+    assert filtered_screener.index.name == "symbol"
+    assert list(filtered_screener.index) == tickers_list
+    assert filtered_screener.index[0] == "AAPL"
+    assert filtered_screener.loc["AAPL", "marketCap"] == 2435465032520
+
+
+def test_screener_transf_ties_and_duplicates():
+    """Test that market cap ties keep the listing order and that only the biggest share class is kept."""
+
+    mock_screener_resp_tech = Mock()
+    mock_screener_resp_tech.text = json.dumps(
+        [
+            {"symbol": "B", "companyName": "B Inc.", "marketCap": 100, "beta": 1},
+            {"symbol": "A", "companyName": "A Inc.", "marketCap": 100, "beta": 1},
+            {"symbol": "C", "companyName": "C Inc.", "marketCap": 50, "beta": 1},
+        ]
+    )
+    mock_screener_resp_com = Mock()
+    mock_screener_resp_com.text = json.dumps(
+        [
+            {"symbol": "GOOG", "companyName": "Alphabet Inc.", "marketCap": 100, "beta": 1},
+            {"symbol": "GOOGL", "companyName": "Alphabet Inc.", "marketCap": 200, "beta": 1},
+            {"symbol": "D", "companyName": "D Inc.", "marketCap": 10, "beta": 1},
+        ]
+    )
+
+    tickers_list, _ = screener_transf(
+        row_limit=4,
+        screener_resp_tech=mock_screener_resp_tech,
+        screener_resp_com=mock_screener_resp_com,
     )
-    assert filtered_screener[0]["symbol"] == "AAPL"
-    assert filtered_screener[0]["marketCap"] == 2435465032520
+
+    assert tickers_list == ["GOOGL", "B", "A", "C"]
 
 
 def test_fte_call():
@@ -180,9 +258,121 @@ def test_fte_call():
 
     employees_n_list = fte_call(tickers_list=mock_tickers_list)
 
-    assert isinstance(employees_n_list, list)
-    assert employees_n_list[0]["symbol"].isupper()
-    assert employees_n_list[0]["fullTimeEmployees"] > 0
+    assert isinstance(employees_n_list, pd.DataFrame)
+    assert employees_n_list.index[0].isupper()
+    assert employees_n_list["fullTimeEmployees"].iloc[0] > 0
+
+
+@patch("modules.http_client.get")
+def test_fte_call_concurrent_order(mock_get):
+    """Test that the concurrent profile calls return results in the tickers_list order."""
+
+    mock_tickers_list = ["AAPL", "MSFT", "GOOG", "META", "NVDA"]
+
+    def fake_profile_response(url, params=None, **kwargs):
+        ticker = url.rsplit("/", 1)[-1]
+        # The first tickers answer last
+        time.sleep(0.01 * (len(mock_tickers_list) - mock_tickers_list.index(ticker)))
+        response = Mock()
+        response.text = json.dumps(
+            [{"symbol": ticker, "companyName": ticker, "fullTimeEmployees": "1000"}]
+        )
+        return response
+
+    mock_get.side_effect = fake_profile_response
+
+    employees_n_list = fte_call(
+        tickers_list=mock_tickers_list, batch_size=1, max_concurrency=3
+    )
+
+    assert list(employees_n_list.index) == mock_tickers_list
+    assert (employees_n_list["fullTimeEmployees"] == 1000).all()
+
+
+@patch("modules.http_client.get")
+def test_fte_call_batched(mock_get):
+    """Test that batched profile requests are split back per ticker, in the tickers_list order."""
+
+    mock_tickers_list = ["AAPL", "MSFT", "GOOG", "META", "NVDA"]
+
+    def fake_profile_response(url, params=None, **kwargs):
+        tickers_batch = url.rsplit("/", 1)[-1].split(",")
+        response = Mock()
+        # The API doesn't guarantee the order of the symbols in its answer
+        response.text = json.dumps(
+            [
+                {"symbol": t, "companyName": t, "fullTimeEmployees": "1000"}
+                for t in reversed(tickers_batch)
+            ]
+        )
+        return response
+
+    mock_get.side_effect = fake_profile_response
+
+    employees_n_list = fte_call(tickers_list=mock_tickers_list, batch_size=2)
+
+    assert mock_get.call_count == 3
+    assert list(employees_n_list.index) == mock_tickers_list
+
+
+@patch("modules.http_client.time.sleep")
+def test_http_client_get_retries(mock_sleep):
+    """Test that a 429 response is retried, honoring its Retry-After header."""
+
+    rate_limited = Mock(status_code=429, headers={"Retry-After": "2"}, content=b"")
+    ok = Mock(status_code=200, headers={}, content=b"[]")
+    session = Mock()
+    session.get.side_effect = [rate_limited, ok]
+
+    with patch("modules.http_client.get_session", return_value=session):
+        response = http_client.get("https://example.com/api", params={"a": 1})
+
+    assert response is ok
+    assert session.get.call_count == 2
+    mock_sleep.assert_called_once_with(2)
+
+
+def test_token_bucket():
+    """Test that the token bucket lets the burst through, then throttles to its rate."""
+
+    # A fake clock, advanced by the waits of the bucket (a rate of 4 keeps them exact in binary)
+    clock = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    # Only the time module seen by http_client is replaced, not the one of the other threads
+    with patch("modules.http_client.time") as mock_time:
+        mock_time.monotonic.side_effect = lambda: clock[0]
+        mock_time.sleep.side_effect = sleep
+        bucket = http_client.TokenBucket(rate=4, burst=5)
+
+        for _ in range(5):
+            bucket.acquire()
+        assert sleeps == []
+
+        for _ in range(4):
+            bucket.acquire()
+        assert sleeps == [0.25] * 4
+
+
+def test_api_cache():
+    """Test that cached responses are served until they expire, and that secrets are not part of the key."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with patch("modules.api_cache.CACHE_PATH", os.path.join(tmpdir, "cache.sqlite")):
+            url = "https://financialmodelingprep.com/api/v3/profile/AAPL"
+            api_cache.put(url, {"apikey": "secret"}, b"[]", ttl=60)
+            api_cache.put(url + "?expired", None, b"[]", ttl=-1)
+
+            assert api_cache.get(url, {"apikey": "another secret"}) == b"[]"
+            assert api_cache.get(url + "?expired") is None
+            assert api_cache.stats()["hits"] >= 1
+            assert api_cache.stats()["evictions"] >= 1
+
+            api_cache._db.close()
 
 
 def test_add_fte():
@@ -232,10 +422,33 @@ def test_add_fte():
         filtered_screener=mock_filtered_screener,
     )
 
-    assert isinstance(added_fte, list)
-    assert added_fte[0]["symbol"] == "AAPL"
-    assert added_fte[0]["marketCap"] == 2413630810829
-    assert added_fte[0]["fullTimeEmployees"] == 164000
+    assert isinstance(added_fte, pd.DataFrame)
+    assert added_fte.index[0] == "AAPL"
+    assert added_fte.loc["AAPL", "marketCap"] == 2413630810829
+    assert added_fte.loc["AAPL", "fullTimeEmployees"] == 164000
+
+
+def test_add_fte_missing_profile():
+    """Test that a profile missing from the API answer doesn't shift the other companies data."""
+
+    mock_employees_n_list = pd.DataFrame(
+        {"fullTimeEmployees": [186779, 164000]},
+        index=pd.Index(["GOOGL", "AAPL"], name="symbol"),
+    )
+    mock_filtered_screener = pd.DataFrame(
+        {"companyName": ["Apple Inc.", "Microsoft Corporation", "Alphabet Inc."]},
+        index=pd.Index(["AAPL", "MSFT", "GOOGL"], name="symbol"),
+    )
+
+    added_fte = add_fte(
+        employees_n_list=mock_employees_n_list,
+        filtered_screener=mock_filtered_screener,
+    )
+
+    assert list(added_fte.index) == ["AAPL", "MSFT", "GOOGL"]
+    assert added_fte.loc["AAPL", "fullTimeEmployees"] == 164000
+    assert pd.isna(added_fte.loc["MSFT", "fullTimeEmployees"])
+    assert added_fte.loc["GOOGL", "fullTimeEmployees"] == 186779
 
 
 def test_yest_sent_call():
@@ -244,10 +457,58 @@ def test_yest_sent_call():
     mock_tickers_list = ["AAPL", "MSFT", "GOOG", "META", "NVDA"]
     d_list_sentiment = yest_sent_call(tickers_list=mock_tickers_list)
 
-    assert isinstance(d_list_sentiment, list)
+    assert isinstance(d_list_sentiment, pd.DataFrame)
+    assert list(d_list_sentiment.index) == mock_tickers_list
     # assert d_list_sentiment[0]["yest_twitter_positive_mentions"] >= 0
 
 
+@patch("modules.http_client.get")
+def test_yest_sent_call_incremental(mock_get):
+    """Test that only the missing days are fetched, and that the summary covers the whole lookback period."""
+
+    today = date.today()
+    mock_get.return_value.json.return_value = {
+        "reddit": [
+            {
+                "atTime": f"{today - timedelta(days=3)} 10:00:00",
+                "positiveMention": 10,
+                "negativeMention": 4,
+                "score": 0.5,
+            },
+            {
+                "atTime": f"{today - timedelta(days=1)} 15:00:00",
+                "positiveMention": 2,
+                "negativeMention": 6,
+                "score": -0.1,
+            },
+        ]
+    }
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with patch(
+            "modules.sentiment_store.STORE_PATH", os.path.join(tmpdir, "store.sqlite")
+        ):
+            # A day that left the lookback period, pruned by the next call
+            sentiment_store.save_days("MSFT", [], today - timedelta(days=40), today - timedelta(days=40))
+            first_run = yest_sent_call(tickers_list=["AAPL"])
+            mock_get.return_value.json.return_value = {"reddit": []}
+            second_run = yest_sent_call(tickers_list=["AAPL"])
+            n_rows = sentiment_store._connection().execute(
+                "SELECT COUNT(*) FROM daily_sentiment WHERE symbol = 'MSFT'"
+            ).fetchone()[0]
+
+            sentiment_store._db.close()
+
+    assert first_run.equals(second_run)
+    assert first_run.loc["AAPL", "yest_twitter_positive_mentions"] == 12
+    assert first_run.loc["AAPL", "yest_twitter_negative_mentions"] == 10
+    assert abs(first_run.loc["AAPL", "yest_twitter_mean_sentiment_score"] - 0.2) < 1e-9
+    # The second run only asks for today, which is never complete, without the API cache
+    assert mock_get.call_args.kwargs["params"]["from"] == today
+    assert not mock_get.call_args.kwargs.get("cache_ttl")
+    assert n_rows == 0
+
+
 def test_add_yest_sent():
     """Test adding the yesterday social sentiment data from mock API data."""
 
@@ -277,16 +538,19 @@ def test_add_yest_sent():
 
     mock_d_list_sentiment = [
         {
+            "symbol": "AAPL",
             "yest_twitter_positive_mentions": 635,
             "yest_twitter_negative_mentions": 734,
             "yest_twitter_mean_sentiment_score": -0.1396835036534542,
         },
         {
+            "symbol": "MSFT",
             "yest_twitter_positive_mentions": 454,
             "yest_twitter_negative_mentions": 448,
             "yest_twitter_mean_sentiment_score": 0.0690662677249494,
         },
         {
+            "symbol": "GOOGL",
             "yest_twitter_positive_mentions": 246,
             "yest_twitter_negative_mentions": 333,
             "yest_twitter_mean_sentiment_score": -0.17537234188129472,
@@ -298,11 +562,11 @@ def test_add_yest_sent():
         d_list_sentiment=mock_d_list_sentiment,
     )
 
-    assert isinstance(final_data, list)
-    assert final_data[0]["symbol"] == "AAPL"
-    assert final_data[0]["marketCap"] == 2413630810829
-    assert final_data[0]["fullTimeEmployees"] == 164000
-    assert final_data[0]["yest_twitter_positive_mentions"] == 635
+    assert isinstance(final_data, pd.DataFrame)
+    assert final_data.index[0] == "AAPL"
+    assert final_data.loc["AAPL", "marketCap"] == 2413630810829
+    assert final_data.loc["AAPL", "fullTimeEmployees"] == 164000
+    assert final_data.loc["AAPL", "yest_twitter_positive_mentions"] == 635
 
 
 def test_write_data_to_csv():
@@ -353,6 +617,47 @@ def test_write_data_to_csv():
         assert os.path.exists(filename)
 
 
+def test_snapshot_formats():
+    """Test that every snapshot format reads back the data indexed by symbol, typed formats keeping the dtypes"""
+
+    final_data = pd.DataFrame(
+        {
+            "companyName": ["Apple Inc.", "Microsoft Corporation"],
+            "marketCap": [2413630810829, 1920947044516],
+            "fullTimeEmployees": pd.array([164000, None], dtype="Int64"),
+            "yest_twitter_mean_sentiment_score": [-0.14, 0.07],
+        },
+        index=pd.Index(["AAPL", "MSFT"], name="symbol"),
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = {fmt: os.path.join(tmpdir, f"final_data.{fmt}") for fmt in snapshot.SNAPSHOT_PATHS}
+        with patch.dict("modules.snapshot.SNAPSHOT_PATHS", paths):
+            for file_format in ["csv", "parquet", "arrow"]:
+                write_data_to_csv(final_data, file_format=file_format)
+                read_data = snapshot.read_snapshot(file_format)
+
+                assert list(read_data.index) == ["AAPL", "MSFT"]
+                assert read_data.loc["MSFT", "marketCap"] == 1920947044516
+                if file_format != "csv":
+                    pd.testing.assert_frame_equal(read_data, final_data)
+
+
+def test_csv_snapshot_without_pyarrow():
+    """Test that the csv snapshot is written and read back without importing pyarrow"""
+
+    final_data = pd.DataFrame({"marketCap": [2413630810829]}, index=pd.Index(["AAPL"], name="symbol"))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with patch.dict("modules.snapshot.SNAPSHOT_PATHS", {"csv": os.path.join(tmpdir, "final_data.csv")}):
+            # None in sys.modules makes any import of pyarrow raise ImportError
+            with patch.dict(sys.modules, {"pyarrow": None, "pyarrow.parquet": None}):
+                snapshot.write_snapshot(final_data, file_format="csv")
+                read_data = snapshot.read_snapshot("csv")
+
+    assert read_data.loc["AAPL", "marketCap"] == 2413630810829
+
+
 @patch("sqlalchemy.create_engine")
 def test_conn_to_psql(mock_create_engine):
     """Test if sqlalchemy.create_engine is properly called"""
@@ -371,12 +676,170 @@ def test_upload_to_psql(mock_to_sql):
     """Test if .to_sql is properly called in the function"""
 
     pool = MagicMock()
-    upload_to_psql(pool)
+    upload_to_psql(pool, method="to_sql")
 
     # assert that to_sql method was called
     mock_to_sql.assert_called_once()
 
 
+def test_upload_to_psql_copy():
+    """Test that the COPY upload loads a staging table and renames it in a single transaction"""
+
+    pool = MagicMock()
+    cursor = pool.raw_connection.return_value.cursor.return_value
+    final_data = pd.DataFrame(
+        {"companyName": ["Apple Inc."], "marketCap": [2413630810829], "beta": [None]},
+        index=pd.Index(["AAPL"], name="symbol"),
+    )
+
+    upload_to_psql(pool, final_data, method="copy")
+
+    statements = [c.args[0] for c in cursor.execute.call_args_list]
+    copy_call = next(c for c in cursor.execute.call_args_list if c.args[0].startswith("COPY"))
+    assert any('"marketCap" BIGINT' in s for s in statements if s.startswith("CREATE"))
+    assert copy_call.kwargs["stream"].read() == "AAPL,Apple Inc.,2413630810829,\n"
+    assert statements[-1].startswith("ALTER TABLE") and "RENAME TO" in statements[-1]
+    pool.raw_connection.return_value.commit.assert_called_once()
+
+
+def test_upsert_history_to_psql():
+    """Test that only the rows whose content changed since their latest stored version are upserted"""
+
+    final_data = pd.DataFrame(
+        {"companyName": ["Apple Inc.", "Microsoft Corporation"], "marketCap": [1, 2]},
+        index=pd.Index(["AAPL", "MSFT"], name="symbol"),
+    )
+    stored_hashes = update_psql._row_hashes(
+        final_data.assign(marketCap=[1, 3]).reset_index()
+    )
+
+    pool = MagicMock()
+    conn = pool.begin.return_value.__enter__.return_value
+    conn.execute.return_value.fetchall.return_value = [
+        ("AAPL", stored_hashes[0]),
+        ("MSFT", stored_hashes[1]),
+    ]
+
+    n_written = upsert_history_to_psql(pool, final_data, snapshot_date=date(2023, 3, 1))
+
+    statements = [str(c.args[0]) for c in conn.execute.call_args_list]
+    assert n_written == 1
+    assert any("PARTITION BY RANGE (snapshot_date)" in s for s in statements)
+    assert any("FROM ('2023-03-01') TO ('2023-04-01')" in s for s in statements)
+    # The stored hashes are read from the latest table, the history is only read to fill it when empty
+    select_latest = next(s for s in statements if s.startswith("SELECT symbol, row_hash"))
+    assert 'FROM "t_history_latest"' in select_latest
+    assert all("NOT EXISTS" in s for s in statements if 'FROM "t_history"' in s)
+    insert_call, latest_call = conn.execute.call_args_list[-2:]
+    assert "ON CONFLICT (snapshot_date, symbol)" in str(insert_call.args[0])
+    assert [r["p1"] for r in insert_call.args[1]] == ["MSFT"]
+    assert "ON CONFLICT (symbol)" in str(latest_call.args[0])
+    assert latest_call.args[1] == [
+        {"symbol": "MSFT", "snapshot_date": date(2023, 3, 1), "row_hash": update_psql._row_hashes(final_data.reset_index())[1]}
+    ]
+
+
+def test_row_hashes_do_not_depend_on_other_rows():
+    """Test that a row keeps its hash when another company lacks sentiment, turning the counts to float"""
+
+    all_mentioned = pd.DataFrame(
+        {"symbol": ["A", "B"], "companyName": ["A Inc.", "B Inc."], "yest_twitter_positive_mentions": [3, 5]}
+    )
+    one_missing = all_mentioned.assign(yest_twitter_positive_mentions=[3, None])
+    assert all_mentioned["yest_twitter_positive_mentions"].dtype != one_missing["yest_twitter_positive_mentions"].dtype
+
+    hashes, other_hashes = update_psql._row_hashes(all_mentioned), update_psql._row_hashes(one_missing)
+    assert hashes[0] == other_hashes[0]
+    assert hashes[1] != other_hashes[1]
+
+
+def test_verify_psql_load():
+    """Test that the server side checks report the row count and sampled values mismatches"""
+
+    final_data = pd.DataFrame(
+        {
+            "symbol": ["AAPL", "MSFT"],
+            "companyName": ["Apple Inc.", "Microsoft Corporation"],
+            "marketCap": [2413630810829, 1920947044516],
+        }
+    )
+
+    pool = MagicMock()
+    conn = pool.connect.return_value.__enter__.return_value
+    aggregates, sampled_rows = MagicMock(), MagicMock()
+    conn.execute.side_effect = [aggregates, sampled_rows]
+    aggregates.fetchone.return_value = (
+        3,
+        float(final_data["marketCap"].sum()),
+        update_psql._text_checksum(final_data["symbol"]),
+        update_psql._text_checksum(final_data["companyName"]),
+    )
+    sampled_rows.mappings.return_value.fetchall.return_value = [
+        {"symbol": "AAPL", "companyName": "Apple Inc.", "marketCap": 2413630810829},
+        {"symbol": "MSFT", "companyName": "Microsoft", "marketCap": 1920947044516},
+    ]
+
+    report = update_psql.verify_psql_load(pool, final_data, table_name="companies")
+
+    aggregates_query = str(conn.execute.call_args_list[0].args[0])
+    assert "SELECT *" not in aggregates_query and 'FROM "companies"' in aggregates_query
+    assert report["ok"] is False
+    assert report["row_count"] == {"expected": 2, "actual": 3}
+    assert [(m["check"], m["column"]) for m in report["mismatches"]] == [
+        ("row_count", None),
+        ("sample", "companyName"),
+    ]
+    assert report["mismatches"][1]["symbol"] == "MSFT"
+
+
+def test_verify_psql_load_typed_columns():
+    """Test that the boolean, float and timestamp columns are compared by sum, not by their Python text"""
+
+    final_data = pd.DataFrame(
+        {
+            "symbol": ["AAPL", "MSFT"],
+            "isActivelyTrading": [True, False],
+            "beta": [1.0, 0.1],
+            "ipoDate": pd.to_datetime(["1980-12-12", "1986-03-13"]),
+        }
+    )
+
+    pool = MagicMock()
+    conn = pool.connect.return_value.__enter__.return_value
+    aggregates, sampled_rows = MagicMock(), MagicMock()
+    conn.execute.side_effect = [aggregates, sampled_rows]
+    # What Postgres returns: the count of true values, the float8 sum, the sum of the epoch seconds
+    aggregates.fetchone.return_value = (2, 1.0, 1.1, 345427200.0 + 511056000.0, update_psql._text_checksum(["AAPL", "MSFT"]))
+    sampled_rows.mappings.return_value.fetchall.return_value = [
+        {"symbol": "AAPL", "isActivelyTrading": True, "beta": 1.0, "ipoDate": pd.Timestamp("1980-12-12")},
+        {"symbol": "MSFT", "isActivelyTrading": False, "beta": 0.1, "ipoDate": pd.Timestamp("1986-03-13")},
+    ]
+
+    report = update_psql.verify_psql_load(pool, final_data, table_name="companies")
+
+    aggregates_query = str(conn.execute.call_args_list[0].args[0])
+    assert 'SUM("isActivelyTrading"::int)' in aggregates_query
+    assert 'EXTRACT(EPOCH FROM "ipoDate")' in aggregates_query
+    assert "string_agg(\"symbol\"" in aggregates_query and "string_agg(\"beta\"" not in aggregates_query
+    assert report["ok"] is True, report["mismatches"]
+
+
+@patch("pandas.read_csv")
+@patch("pandas.DataFrame.to_sql")
+def test_upload_to_psql_in_memory(mock_to_sql, mock_read_csv):
+    """Test that in-memory data is uploaded without reading the csv file back"""
+
+    pool = MagicMock()
+    final_data = pd.DataFrame(
+        {"companyName": ["Apple Inc."], "marketCap": [2413630810829]},
+        index=pd.Index(["AAPL"], name="symbol"),
+    )
+    upload_to_psql(pool, final_data, method="to_sql")
+
+    mock_to_sql.assert_called_once()
+    mock_read_csv.assert_not_called()
+
+
 @patch("google.cloud.sql.connector.Connector")
 @patch("sqlalchemy.create_engine")
 def test_close_conn_to_sql(mock_connector, mock_pool):
@@ -391,12 +854,536 @@ def test_close_conn_to_sql(mock_connector, mock_pool):
     assert mock_pool.dispose.called
 
 
-@patch("dash.Dash.run_server")
-def test_dashboard(mock_run_server):
-    """Test if app.run_server is called"""
+def test_figure_cache():
+    """Test if the figures are built once per dataset version, then served from the cache"""
+
+    df = pd.DataFrame(
+        {
+            "companyName": ["Apple", "Microsoft"],
+            "marketCap": [3e12, 2.5e12],
+            "fullTimeEmployees": [160000, 220000],
+            "normalized_sentiment": [0.2, 1.0],
+        }
+    )
+    version = dash_plotly_dashboard.dataset_version(df)
+    dash_plotly_dashboard.build_figures(df, version)
+
+    with patch.dict(dash_plotly_dashboard.FIGURE_BUILDERS, clear=True):
+        treemap = json.loads(dash_plotly_dashboard.get_figure("tab-treemap", df, version))
+        scatter_3d = json.loads(dash_plotly_dashboard.get_figure("tab-3d-scatter", df, version))
+
+    assert treemap["data"][0]["type"] == "treemap"
+    assert scatter_3d["data"][0]["type"] == "scatter3d"
+    assert scatter_3d["layout"]["scene"]["camera"]["eye"]["y"] == -2.5
+
+    df_changed = df.assign(marketCap=[1e12, 2.5e12])
+    assert dash_plotly_dashboard.dataset_version(df_changed) != version
+
+
+def test_figure_route():
+    """Test if the tab callbacks only send the figure URL, the cached figure JSON being served at that URL"""
+
+    df = pd.DataFrame(
+        {
+            "symbol": ["AAPL", "MSFT"],
+            "companyName": ["Apple", "Microsoft"],
+            "marketCap": [3e12, 2.5e12],
+            "fullTimeEmployees": [160000, 220000],
+            "yest_twitter_mean_sentiment_score": [0.1, 0.3],
+        }
+    ).set_index("symbol")
+    app = dash_plotly_dashboard.create_app(df)
+    client = app.server.test_client()
+    version = dash_plotly_dashboard.current_dataset()["version"]
+
+    response = client.post(
+        "/_dash-update-component",
+        json={
+            "output": "tabs-content-scatter.children",
+            "outputs": {"id": "tabs-content-scatter", "property": "children"},
+            "inputs": [{"id": "tabs-scatter", "property": "value", "value": "tab-3d-scatter"}],
+            "changedPropIds": ["tabs-scatter.value"],
+        },
+    )
+    store, graph = response.get_json()["response"]["tabs-content-scatter"]["children"]["props"]["children"]
+    assert store["props"]["data"] == f"/figures/{version}/tab-3d-scatter.json"
+    assert graph["props"] == {"id": "graph-3d-scatter"}
+
+    response = client.get(store["props"]["data"])
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == dash_plotly_dashboard.get_figure("tab-3d-scatter", None, version)
+    assert "immutable" in response.headers["Cache-Control"]
+
+    # Compressed once, then sent from the cache
+    with patch.object(dash_plotly_dashboard, "compress", wraps=dash_plotly_dashboard.compress) as mock_compress:
+        for _ in range(2):
+            response = client.get(store["props"]["data"], headers={"Accept-Encoding": "br"})
+            assert response.headers["Content-Encoding"] == "br"
+    assert mock_compress.call_count == 1
+
+    # A page rendered before a reload gets the current figure, not cached under the outdated URL
+    response = client.get("/figures/outdated/tab-3d-scatter.json")
+    assert response.status_code == 200 and response.headers["Cache-Control"] == "no-cache"
+    assert client.get(f"/figures/{version}/unknown.json").status_code == 404
+
+
+def test_highlight_patch():
+    """Test if hovering a company only patches the coordinates of the highlight trace"""
+
+    df = pd.DataFrame(
+        {
+            "companyName": ["Apple", "Microsoft"],
+            "marketCap": [3e12, 2.5e12],
+            "fullTimeEmployees": [160000, 220000],
+            "normalized_sentiment": [0.2, 1.0],
+        }
+    )
+    version = dash_plotly_dashboard.dataset_version(df)
+
+    patched = dash_plotly_dashboard.highlight_patch("tab-3d-scatter", df, version, "Microsoft")
+    operations = patched.to_plotly_json()["operations"]
+    figure = json.loads(dash_plotly_dashboard.get_figure("tab-3d-scatter", df, version))
+    highlight = figure["data"][-1]
+
+    assert highlight["marker"]["color"] == "green" and highlight["x"] == []
+    assert {tuple(op["location"]): op["params"]["value"] for op in operations} == {
+        ("data", len(figure["data"]) - 1, "x"): [220000],
+        ("data", len(figure["data"]) - 1, "y"): [1.0],
+        ("data", len(figure["data"]) - 1, "z"): [2.5e12],
+        ("data", len(figure["data"]) - 1, "marker", "size"): [1.0],
+    }
+
+    patched = dash_plotly_dashboard.highlight_patch("tab-2d-scatter", df, version, None)
+    values = [op["params"]["value"] for op in patched.to_plotly_json()["operations"]]
+    assert values == [[], [], []]
+
+
+def test_figures_large_universe():
+    """Test if the charts of a large universe are bounded: top N plus "Other", downsampled WebGL scatters"""
+
+    n_companies = 3000
+    df = pd.DataFrame(
+        {
+            "companyName": [f"Company {i}" for i in range(n_companies)],
+            "marketCap": [float(n_companies - i) * 1e9 for i in range(n_companies)],
+            "fullTimeEmployees": [1000 + i for i in range(n_companies)],
+            "normalized_sentiment": [i / n_companies for i in range(n_companies)],
+        }
+    )
+
+    with patch.object(dash_plotly_dashboard, "TOP_N", 10), patch.object(
+        dash_plotly_dashboard, "MAX_SCATTER_POINTS", 500
+    ):
+        version = dash_plotly_dashboard.dataset_version(df)
+        figures = dash_plotly_dashboard.build_figures(df, version)
+
+    treemap = json.loads(figures["tab-treemap"])["data"][0]
+    assert len(treemap["labels"]) == 11
+    assert "Other (2990 companies)" in treemap["labels"]
+    assert dash_plotly_dashboard.top_n_with_other(df, 10)["marketCap"].sum() == df["marketCap"].sum()
+
+    scatter_2d = json.loads(figures["tab-2d-scatter"])["data"][0]
+    assert scatter_2d["type"] == "scattergl"
+    assert len(scatter_2d["hovertext"]) == 500
+    sample = dash_plotly_dashboard.downsample(df, 500)
+    assert len(sample) == 500
+    assert sample["companyName"].iloc[0] == "Company 0"
+    assert sample["companyName"].iloc[-1] == f"Company {n_companies - 1}"
+
+    small = df.head(12)
+    assert dash_plotly_dashboard.top_n_with_other(small, 25) is small
+
+
+def test_company_table_query_page():
+    """Test if the company table pages are sorted, filtered and paged on the server"""
+
+    n_companies = 100
+    df = pd.DataFrame(
+        {
+            "symbol": [f"T{i}" for i in range(n_companies)],
+            "companyName": [f"Company {i} Inc." if i % 2 else f"Company {i} Corp" for i in range(n_companies)],
+            "marketCap": [float((i * 37) % n_companies) * 1e9 for i in range(n_companies)],
+            "fullTimeEmployees": [1000 + i for i in range(n_companies)],
+        }
+    )
+    table = company_table.prepare_table(df)
+
+    rows, page_count = company_table.query_page(
+        table, 1, 10, [{"column_id": "marketCap", "direction": "desc"}], ""
+    )
+    assert page_count == 10
+    assert len(rows) == 10
+    assert [row["marketCap"] for row in rows] == [float(x) * 1e9 for x in range(89, 79, -1)]
+    assert "companyName__lower" not in rows[0]
+
+    rows, page_count = company_table.query_page(
+        table, 0, 10, [], '{companyName} icontains "INC." && {marketCap} >= 50e9'
+    )
+    matches = df[df["companyName"].str.contains("Inc.", regex=False) & (df["marketCap"] >= 50e9)]
+    assert page_count == -(-len(matches) // 10)
+    assert [row["symbol"] for row in rows] == matches["symbol"].head(10).tolist()
+
+    rows, page_count = company_table.query_page(table, 5, 10, [], "{marketCap} > abc")
+    assert rows == [] and page_count == 1
+
+
+def test_dashboard_hot_reload():
+    """Test if a new snapshot file is swapped in and the figures of the previous one evicted"""
+
+    df = pd.DataFrame(
+        {
+            "symbol": ["AAPL", "MSFT"],
+            "companyName": ["Apple", "Microsoft"],
+            "marketCap": [3e12, 2.5e12],
+            "fullTimeEmployees": [160000, 220000],
+            "yest_twitter_mean_sentiment_score": [0.1, 0.5],
+        }
+    ).set_index("symbol")
+
+    with tempfile.TemporaryDirectory() as tmp_dir, patch.dict(
+        snapshot.SNAPSHOT_PATHS, {"csv": os.path.join(tmp_dir, "final_data.csv")}
+    ), patch.object(dash_plotly_dashboard, "_dataset", None):
+        df.to_csv(snapshot.SNAPSHOT_PATHS["csv"])
+        assert dash_plotly_dashboard.reload_if_changed()
+        first_version = dash_plotly_dashboard.current_dataset()["version"]
+        assert not dash_plotly_dashboard.reload_if_changed()
+
+        df.assign(marketCap=[1e12, 2.5e12]).to_csv(snapshot.SNAPSHOT_PATHS["csv"])
+        later = time.time() + 10
+        os.utime(snapshot.SNAPSHOT_PATHS["csv"], (later, later))
+        assert dash_plotly_dashboard.reload_if_changed()
+
+        dataset = dash_plotly_dashboard.current_dataset()
+        assert dataset["version"] != first_version
+        assert dataset["df"]["marketCap"].tolist() == [1e12, 2.5e12]
+        assert {key[1] for key in dash_plotly_dashboard._figure_cache} == {dataset["version"]}
+
+
+def test_pipeline_runs_independent_stages_concurrently():
+    """Test if the stages run as soon as their inputs are available, independent ones concurrently"""
+
+    # Both stages must be running at the same time to get through the barrier, the timeout only keeps a
+    # sequential run from hanging
+    barrier = threading.Barrier(2, timeout=10)
+
+    def overlapping(value):
+        barrier.wait()
+        return value
+
+    stages = [
+        pipeline.Stage("tickers", lambda: ["AAPL"], outputs=("tickers_list",)),
+        pipeline.Stage("fte", lambda tickers_list: overlapping(1), inputs=("tickers_list",), outputs=("fte",)),
+        pipeline.Stage(
+            "sentiment", lambda tickers_list: overlapping(2), inputs=("tickers_list",), outputs=("sent",)
+        ),
+        pipeline.Stage("total", lambda fte, sent: fte + sent, inputs=("fte", "sent"), outputs=("total",)),
+    ]
+
+    run = pipeline.run_stages(stages)
+    assert run.result("total") == 3
+    run.wait()
+    assert set(run.timings) == {"tickers", "fte", "sentiment", "total"}
+
+    failing = [
+        pipeline.Stage("fte", lambda: 1 / 0, outputs=("fte",)),
+        pipeline.Stage("total", lambda fte: fte, inputs=("fte",), outputs=("total",)),
+    ]
+    run = pipeline.run_stages(failing)
+    try:
+        run.result("total")
+        assert False, "the stage error should be raised"
+    except ZeroDivisionError:
+        pass
+
+    try:
+        pipeline.run_stages([pipeline.Stage("total", lambda fte: fte, inputs=("fte",))])
+        assert False, "a missing input should be detected"
+    except Exception as e:
+        assert "produced by no stage" in str(e)
+
+
+def test_pipeline_resumes_from_checkpoints():
+    """Test if a re-run of a failed run restores the completed stages and skips the tickers already fetched"""
+
+    screener = Mock(return_value=["AAPL", "MSFT", "NVDA"])
+    fetched = []
+    limit_reached = [True]
+
+    def fetch(ticker):
+        if ticker == "NVDA" and limit_reached[0]:
+            raise Exception("API Limit is reached")
+        fetched.append(ticker)
+        return len(ticker)
+
+    stages = [
+        pipeline.Stage("screener", screener, outputs=("tickers_list",), checkpoint=True),
+        pipeline.Stage(
+            "fte",
+            lambda tickers_list, checkpoint: _fan_out(fetch, tickers_list, 1, checkpoint),
+            inputs=("tickers_list",),
+            outputs=("fte",),
+            checkpoint=True,
+            per_ticker=True,
+        ),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp_dir, patch.object(
+        checkpoints, "CHECKPOINT_PATH", os.path.join(tmp_dir, "checkpoints.sqlite")
+    ):
+        try:
+            pipeline.run_stages(stages, run_id="2024-01-02").wait()
+            assert False, "the API limit error should be raised"
+        except Exception as e:
+            assert "Limit" in str(e)
+        assert fetched == ["AAPL", "MSFT"]
+        assert set(checkpoints.Items("2024-01-02", "fte").done) == {"AAPL", "MSFT"}
+
+        # The checkpoints of another run are dropped when a run starts
+        checkpoints.save_outputs("2024-01-01", "screener", {"tickers_list": ["IBM"]})
+        limit_reached[0] = False
+        run = pipeline.run_stages(stages, run_id="2024-01-02")
+        assert run.wait()["fte"] == [4, 4, 4]
+        assert screener.call_count == 1
+        assert run.restored == ["screener"]
+        assert fetched == ["AAPL", "MSFT", "NVDA"]
+
+        # A completed run leaves nothing to resume
+        assert checkpoints.load_outputs("2024-01-02", "screener") is None
+        assert not checkpoints.Items("2024-01-02", "fte").done
+        assert checkpoints.load_outputs("2024-01-01", "screener") is None
+
+
+def test_pipeline_does_not_checkpoint_api_limit_answer():
+    """Test if a screener answer hitting the API limit is not checkpointed, so that the re-run calls the API"""
+
+    def screener_response(data):
+        # A real response, since the outputs of the stage are pickled
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(data).encode()
+        return response
+
+    limit_reached = screener_response({"Error Message": "Limit Reach . Please upgrade your plan"})
+    screener_data = screener_response(
+        [{"symbol": "AAPL", "companyName": "Apple Inc.", "marketCap": 100, "beta": 1}]
+    )
+    stages = main.pipeline_stages()[:2]
+
+    with tempfile.TemporaryDirectory() as tmp_dir, patch.object(
+        checkpoints, "CHECKPOINT_PATH", os.path.join(tmp_dir, "checkpoints.sqlite")
+    ), patch("modules.extract_data.http_client.get") as mock_get:
+        mock_get.side_effect = [limit_reached, limit_reached]
+        try:
+            pipeline.run_stages(stages, run_id="2024-01-02").wait()
+            assert False, "the API limit error should be raised"
+        except Exception as e:
+            assert "API Limit" in str(e)
+        assert checkpoints.load_outputs("2024-01-02", "screener") is None
+
+        mock_get.side_effect = [screener_data, screener_data]
+        run = pipeline.run_stages(stages, run_id="2024-01-02")
+        assert run.wait()["tickers_list"] == ["AAPL"]
+        assert run.restored == []
+        assert mock_get.call_count == 4
+
+
+def test_app_serves_stale_snapshot_while_refreshing():
+    """Test if the dashboard starts on the last snapshot and the refreshed data is published to it"""
+
+    df = pd.DataFrame(
+        {
+            "symbol": ["AAPL", "MSFT"],
+            "companyName": ["Apple", "Microsoft"],
+            "marketCap": [3e12, 2.5e12],
+            "fullTimeEmployees": [160000, 220000],
+            "yest_twitter_mean_sentiment_score": [0.1, 0.5],
+        }
+    ).set_index("symbol")
+
+    with tempfile.TemporaryDirectory() as tmp_dir, patch.dict(
+        snapshot.SNAPSHOT_PATHS, {"csv": os.path.join(tmp_dir, "final_data.csv")}
+    ), patch.object(dash_plotly_dashboard, "_dataset", None):
+        df.to_csv(snapshot.SNAPSHOT_PATHS["csv"])
+
+        with patch("main.SERVER_MODE", "dev"), patch("main.STARTUP_MODE", "stale"), patch(
+            "main.refresh_data"
+        ) as mock_refresh, patch(
+            "main.dashboard"
+        ) as mock_dashboard, patch("main.run_stages") as mock_run_stages:
+            main.app()
+        mock_dashboard.assert_called_once_with()
+        assert mock_refresh.called
+        assert not mock_run_stages.called
+
+        refreshed = df.assign(marketCap=[1e12, 2.5e12])
+        mock_load = Mock()
+        stages = [
+            pipeline.Stage("transform", lambda: refreshed, outputs=("final_data",)),
+            pipeline.Stage(
+                "snapshot", write_data_to_csv, inputs=("final_data",), outputs=("snapshot_file",)
+            ),
+            pipeline.Stage("upload", mock_load, inputs=("final_data",)),
+        ]
+        with patch("main.pipeline_stages", return_value=stages):
+            main.refresh_data()
+        assert mock_load.called
+        assert dash_plotly_dashboard.current_dataset()["df"]["marketCap"].tolist() == [1e12, 2.5e12]
+        assert not dash_plotly_dashboard.reload_if_changed()
+
+
+def test_app_gunicorn_forks_no_pipeline_thread():
+    """Test if, with gunicorn, the pipeline runs in its own process or is done before the workers are forked"""
+
+    with tempfile.TemporaryDirectory() as tmp_dir, patch.dict(
+        snapshot.SNAPSHOT_PATHS, {"csv": os.path.join(tmp_dir, "final_data.csv")}
+    ):
+        pd.DataFrame({"symbol": ["AAPL"]}).to_csv(snapshot.SNAPSHOT_PATHS["csv"], index=False)
+
+        with patch("main.SERVER_MODE", "gunicorn"), patch("main.STARTUP_MODE", "stale"), patch(
+            "main.multiprocessing.get_context"
+        ) as mock_get_context, patch("main.threading.Thread") as mock_thread, patch(
+            "main.dashboard"
+        ) as mock_dashboard:
+            main.app()
+        mock_get_context.assert_called_once_with("spawn")
+        mock_get_context.return_value.Process.assert_called_once_with(
+            target=main.refresh_data_process, name="data-refresh", daemon=True
+        )
+        assert mock_get_context.return_value.Process.return_value.start.called
+        assert not mock_thread.called
+        mock_dashboard.assert_called_once_with()
+
+    run = Mock()
+    run.wait.return_value = {"final_data": "data"}
+    with patch("main.SERVER_MODE", "gunicorn"), patch("main.STARTUP_MODE", "fresh"), patch(
+        "main.run_stages", return_value=run
+    ), patch("main.dashboard") as mock_dashboard:
+        main.app()
+    assert run.wait.called
+    assert not run.result.called
+    mock_dashboard.assert_called_once_with("data")
+
+
+@patch("modules.http_client.time.sleep")
+def test_metrics_endpoint(mock_sleep):
+    """Test if the stage, API and callback metrics are served at /metrics in the OpenMetrics format"""
+
+    def sample(name, **labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    before = {
+        "stage": sample("pipeline_stage_duration_seconds_count", stage="transform"),
+        "rows": sample("pipeline_rows_total", stage="transform"),
+        "retries": sample("api_retries_total", provider="fmp"),
+        "errors": sample("api_errors_total", provider="fmp", reason="503"),
+        "bytes": sample("api_response_bytes_total", provider="fmp"),
+        "callback": sample("dash_callback_duration_seconds_count", callback="render_content_marketcap"),
+    }
+
+    frame = pd.DataFrame({"symbol": ["AAPL", "MSFT", "NVDA"]})
+    pipeline.run_stages([pipeline.Stage("transform", lambda: frame, outputs=("frame",))]).wait()
+
+    session = Mock()
+    session.get.side_effect = [
+        Mock(status_code=503, headers={}, content=b"busy"),
+        Mock(status_code=200, headers={}, content=b"[]"),
+    ]
+    with patch("modules.http_client.get_session", return_value=session):
+        http_client.get("https://financialmodelingprep.com/api/v3/profile/AAPL")
+
+    app = dash_plotly_dashboard.create_app()
+    client = app.server.test_client()
+    response = client.post(
+        "/_dash-update-component",
+        json={
+            "output": "tabs-content-marketcap.children",
+            "outputs": {"id": "tabs-content-marketcap", "property": "children"},
+            "inputs": [{"id": "tabs-marketcap", "property": "value", "value": "tab-treemap"}],
+            "changedPropIds": ["tabs-marketcap.value"],
+        },
+    )
+    assert response.status_code == 200
+
+    assert sample("pipeline_stage_duration_seconds_count", stage="transform") == before["stage"] + 1
+    assert sample("pipeline_rows_total", stage="transform") == before["rows"] + 3
+    assert sample("api_retries_total", provider="fmp") == before["retries"] + 1
+    assert sample("api_errors_total", provider="fmp", reason="503") == before["errors"] + 1
+    assert sample("api_response_bytes_total", provider="fmp") == before["bytes"] + 6
+    assert (
+        sample("dash_callback_duration_seconds_count", callback="render_content_marketcap")
+        == before["callback"] + 1
+    )
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("application/openmetrics-text")
+    body = response.get_data(as_text=True)
+    assert 'dash_callback_duration_seconds_bucket{callback="render_content_marketcap"' in body
+    assert 'api_request_duration_seconds_count{provider="fmp"}' in body
+    assert body.rstrip().endswith("# EOF")
+
+
+def test_static_assets_and_compression():
+    """Test if the stylesheets are self-hosted with immutable cache headers and the responses compressed"""
+
+    app = dash_plotly_dashboard.create_app()
+    client = app.server.test_client()
+
+    index = client.get("/").get_data(as_text=True)
+    assert "fonts.googleapis.com" not in index and "cdn.jsdelivr.net" not in index
+
+    font = client.get(static_assets.asset_url("Lato.ttf"), headers={"Accept-Encoding": "gzip"})
+    assert font.status_code == 200
+    assert "immutable" in font.headers["Cache-Control"]
+    assert font.headers["Content-Encoding"] == "gzip"
+    assert client.get(f"{static_assets.ASSETS_URL}/outdated/styles.css").headers["Cache-Control"] == "no-cache"
+    assert client.get(static_assets.asset_url("missing.css")).status_code == 404
+
+    # The tab callbacks only send a figure URL, below COMPRESS_MIN_SIZE, the layout is compressed on each request
+    layout = client.get("/_dash-layout", headers={"Accept-Encoding": "br"})
+    assert layout.headers["Content-Encoding"] == "br"
+
+    # Any version or fingerprint in the URL is served, but the compressed cache holds one entry per file
+    script = re.search(r'src="(/_dash-component-suites/dash/[^"]+\.js)"', index).group(1)
+    with patch.dict(static_assets._compressed_static, clear=True):
+        for i in range(3):
+            for url in (
+                f"{static_assets.ASSETS_URL}/junk{i}/styles.css",
+                re.sub(r"\.v\w+m\d+\.", f".v{i}m{i}.", script),
+            ):
+                response = client.get(url, headers={"Accept-Encoding": "gzip"})
+                assert response.headers["Content-Encoding"] == "gzip"
+        assert len(static_assets._compressed_static) == 2
+
+
+@patch("modules.dash_plotly_dashboard.run_gunicorn")
+@patch("dash.Dash.run")
+def test_dashboard(mock_run_server, mock_run_gunicorn):
+    """Test if app.run is called"""
 
     mock_run_server.return_value = MagicMock()
 
-    dashboard()
+    with patch("modules.dash_plotly_dashboard.SERVER_MODE", "dev"):
+        dashboard()
 
     assert mock_run_server.called
+
+
+@patch("modules.dash_plotly_dashboard.run_gunicorn")
+def test_dashboard_gunicorn(mock_run_gunicorn):
+    """Test if the preloaded app is handed to gunicorn in the gunicorn server mode"""
+
+    with patch("modules.dash_plotly_dashboard.SERVER_MODE", "gunicorn"), patch.object(
+        dash_plotly_dashboard, "_watch_interval", None
+    ), patch("modules.dash_plotly_dashboard.watch_snapshot") as mock_watch_snapshot:
+        dashboard()
+        # The snapshot watcher is only started in the forked workers
+        assert not mock_watch_snapshot.called
+        dash_plotly_dashboard._after_fork_in_child()
+        mock_watch_snapshot.assert_called_once_with(dash_plotly_dashboard.RELOAD_INTERVAL)
+
+    app, port = mock_run_gunicorn.call_args[0]
+    assert port == int(os.environ.get("PORT", 8050))
+    options = serving.gunicorn_options(port, workers=4, threads=2)
+    assert options["preload_app"] and options["workers"] == 4 and options["threads"] == 2
+    assert app.server.test_client().get("/_dash-layout").status_code == 200
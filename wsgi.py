@@ -0,0 +1,22 @@
+"""
+WSGI entry point of the dashboard, to serve the last data snapshot without running the pipeline:
+
+    gunicorn --preload --workers 4 --threads 4 --worker-class gthread --bind 0.0.0.0:8050 wsgi:server
+
+With --preload, the app, its dataset and its figures are created once, before the workers are forked,
+and shared by them (see modules/serving.py). --preload is required: each worker starts its snapshot watcher
+when it is forked.
+"""
+
+import gc
+import os
+
+# Served by gunicorn: the snapshot watcher is only started in the workers
+os.environ.setdefault("SERVER_MODE", "gunicorn")
+
+from modules.dash_plotly_dashboard import create_app
+
+
+app = create_app()
+server = app.server
+gc.freeze()